@@ -4,97 +4,1254 @@ Complete Calculator Application
 Includes both GUI and command-line interfaces
 """
 
+import contextvars
+import decimal
+import importlib.util
+import itertools
+import keyword
+import mmap
+import os
+import struct
 import sys
 import math
+import operator
 import re
-from typing import Optional, Tuple
+from array import array
+from collections import OrderedDict, deque
+from fractions import Fraction
+from functools import cached_property, lru_cache
+from time import perf_counter
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, List, NamedTuple, Optional, Tuple
+
+if TYPE_CHECKING:
+    import argparse    # imported on demand by parse_arguments()
+
+# NumPy is optional and only imported when a vectorized path is first used,
+# so library, CLI and batch callers start without paying for it
+NUMPY_AVAILABLE = importlib.util.find_spec("numpy") is not None
+np = None
+
+
+def _load_numpy():
+    """Import numpy on first use"""
+    global np
+    if np is None:
+        import numpy
+        np = numpy
+    return np
 
 # ============================================================================
 # Part 1: Core Calculator Engine
 # ============================================================================
 
+# Exact powers and factorials are refused beyond this many bits (about
+# 315,000 digits), so a typo like 10^1e9 fails at once instead of running
+# for minutes
+MAX_EXACT_BITS = 1 << 20
+
+# A lower limit in force for the current thread (LivePreview sets one)
+_exact_bits_limit = contextvars.ContextVar("exact_bits_limit")
+
+
+def _check_exact_size(bits: float):
+    if bits > _exact_bits_limit.get(MAX_EXACT_BITS):
+        raise OverflowError(f"Result too large (about {int(bits * math.log10(2)):,} digits)")
+
+
+def _check_power_size(a, b):
+    """Raise OverflowError if the exact result of a ** b would exceed MAX_EXACT_BITS"""
+    if isinstance(a, Fraction):
+        size = math.log2(abs(a.numerator) or 1) + math.log2(a.denominator)
+    else:
+        size = math.log2(abs(a)) if a else 0
+    _check_exact_size(abs(b) * size)
+
+
+def format_result(value) -> str:
+    """str(value), except that ints too long for str() are shown as 3.316275092450633e+5735
+    
+    CPython refuses to convert ints of more than 4300 digits to text (see
+    sys.set_int_max_str_digits); the leading digits are computed from the
+    top 64 bits instead, which takes microseconds at any size.
+    """
+    if type(value) is int:
+        try:
+            return str(value)
+        except ValueError:
+            shift = abs(value).bit_length() - 64
+            context = decimal.Context(prec=30, Emax=decimal.MAX_EMAX)
+            approximate = context.multiply(abs(value) >> shift, context.power(2, shift))
+            return ("-" if value < 0 else "") + format(approximate, ".15e")
+    return str(value)
+
+
+class FloatBackend:
+    """Numeric backend using Python floats and the math module"""
+    
+    name = "float"
+    context = None
+    pi = math.pi
+    e = math.e
+    
+    def number(self, value):
+        """Convert a literal (text, int or float) to this backend's number type"""
+        return float(value)
+    
+    add = staticmethod(operator.add)
+    subtract = staticmethod(operator.sub)
+    multiply = staticmethod(operator.mul)
+    divide = staticmethod(operator.truediv)
+    sqrt = staticmethod(math.sqrt)
+    sin = staticmethod(math.sin)
+    cos = staticmethod(math.cos)
+    tan = staticmethod(math.tan)
+    radians = staticmethod(math.radians)
+    ln = staticmethod(math.log)
+    log10 = staticmethod(math.log10)
+    log2 = staticmethod(math.log2)
+    
+    def power(self, a, b):
+        """a ** b, switching to exact integers when an integral power overflows"""
+        if type(a) is int and type(b) is int:
+            _check_power_size(a, b)
+        try:
+            return a ** b
+        except OverflowError:
+            if b >= 0 and a == int(a) and b == int(b):
+                _check_power_size(int(a), int(b))
+                return int(a) ** int(b)
+            raise
+    
+    def log(self, a, base):
+        return math.log(a, base)
+    
+    def factorial(self, a) -> int:
+        """Exact factorial (math.factorial multiplies by binary splitting in C)"""
+        if a < 0 or a != int(a):
+            raise ValueError("Factorial requires a non-negative integer")
+        _check_exact_size(math.lgamma(int(a) + 1) / math.log(2))
+        return math.factorial(int(a))
+    
+    def matrix(self, shape: Tuple[int, ...], values) -> "Matrix":
+        """Matrix or vector literal (matrices always hold floats)"""
+        if self.name != "float":
+            raise ValueError("Matrices are only supported by the float backend")
+        return Matrix(shape, [float(value) for value in values])
+    
+    @cached_property
+    def namespace(self) -> MappingProxyType:
+        """Read-only namespace compiled expressions are evaluated in (built once)"""
+        return MappingProxyType({
+            "__builtins__": {},
+            "pi": self.pi,
+            "e": self.e,
+            "sin": lambda a: self.sin(self.radians(a)),
+            "cos": lambda a: self.cos(self.radians(a)),
+            "tan": lambda a: self.tan(self.radians(a)),
+            "log": self.log10,
+            "ln": self.ln,
+            "sqrt": self.sqrt,
+            "fact": self.factorial,
+            "percent": lambda a: self.divide(a, 100),
+            "det": matrix_det,
+            "transpose": matrix_transpose,
+            "solve": matrix_solve,
+            "_matrix": self.matrix,
+            "_pow": self.power,
+        })
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}()"
+
+
+class DecimalBackend(FloatBackend):
+    """Arbitrary-precision backend using decimal.Decimal
+    
+    All arithmetic runs in the backend's own context, so each engine can use
+    a different precision. Trigonometric functions use Taylor series.
+    """
+    
+    name = "decimal"
+    
+    def __init__(self, precision: int = 28):
+        self.context = decimal.Context(prec=precision)
+        with decimal.localcontext(self.context):
+            self.pi = self._compute_pi()
+            self.e = decimal.Decimal(1).exp()
+    
+    def number(self, value):
+        if type(value) is decimal.Decimal:
+            return value
+        if isinstance(value, float):
+            value = repr(value)
+        try:
+            return self.context.create_decimal(value)
+        except (decimal.InvalidOperation, TypeError):
+            raise ValueError(f"Invalid number: {value!r}")
+    
+    def add(self, a, b):
+        return self.context.add(self.number(a), self.number(b))
+    
+    def subtract(self, a, b):
+        return self.context.subtract(self.number(a), self.number(b))
+    
+    def multiply(self, a, b):
+        return self.context.multiply(self.number(a), self.number(b))
+    
+    def divide(self, a, b):
+        return self.context.divide(self.number(a), self.number(b))
+    
+    def power(self, a, b):
+        return self.context.power(self.number(a), self.number(b))
+    
+    def sqrt(self, a):
+        return self.context.sqrt(self.number(a))
+    
+    def ln(self, a):
+        return self.context.ln(self.number(a))
+    
+    def log10(self, a):
+        return self.context.log10(self.number(a))
+    
+    def log2(self, a):
+        return self.log(a, 2)
+    
+    def log(self, a, base):
+        with decimal.localcontext(self.context) as ctx:
+            ctx.prec += 2
+            result = self.number(a).ln() / self.number(base).ln()
+        return self.context.plus(result)
+    
+    def radians(self, a):
+        return self.context.divide(self.context.multiply(self.number(a), self.pi), 180)
+    
+    def _compute_pi(self):
+        with decimal.localcontext() as ctx:
+            ctx.prec += 2
+            three = decimal.Decimal(3)
+            lasts, t, s, n, na, d, da = 0, three, 3, 1, 0, 0, 24
+            while s != lasts:
+                lasts = s
+                n, na = n + na, na + 8
+                d, da = d + da, da + 32
+                t = (t * n) / d
+                s += t
+        return self.context.plus(s)
+    
+    def _series(self, x, first: int):
+        """Taylor series for sine (first=1) or cosine (first=0)"""
+        with decimal.localcontext(self.context) as ctx:
+            ctx.prec += 2
+            x = self.number(x) % (2 * self.pi)
+            i = first
+            term = x if first else decimal.Decimal(1)
+            total, last = term, None
+            while total != last:
+                last = total
+                i += 2
+                term = -term * x * x / (i * (i - 1))
+                total += term
+        return self.context.plus(total)
+    
+    def sin(self, a):
+        return self._series(a, 1)
+    
+    def cos(self, a):
+        return self._series(a, 0)
+    
+    def tan(self, a):
+        with decimal.localcontext(self.context) as ctx:
+            ctx.prec += 2
+            result = self.sin(a) / self.cos(a)
+        return self.context.plus(result)
+    
+    def __repr__(self) -> str:
+        return f"DecimalBackend(precision={self.context.prec})"
+
+
+class FractionBackend(FloatBackend):
+    """Exact rational backend using fractions.Fraction
+    
+    Arithmetic, integral powers and square roots of perfect squares are exact;
+    irrational constants and functions are rounded to float precision.
+    """
+    
+    name = "fraction"
+    pi = Fraction(math.pi)
+    e = Fraction(math.e)
+    
+    def number(self, value):
+        if type(value) is Fraction:
+            return value
+        if isinstance(value, float):
+            value = repr(value)
+        try:
+            return Fraction(value)
+        except (TypeError, ZeroDivisionError):
+            raise ValueError(f"Invalid number: {value!r}")
+    
+    def add(self, a, b):
+        return self.number(a) + self.number(b)
+    
+    def subtract(self, a, b):
+        return self.number(a) - self.number(b)
+    
+    def multiply(self, a, b):
+        return self.number(a) * self.number(b)
+    
+    def divide(self, a, b):
+        return self.number(a) / self.number(b)
+    
+    def power(self, a, b):
+        a, b = self.number(a), self.number(b)
+        if b.denominator == 1:
+            _check_power_size(a, b)
+        return a ** b
+    
+    def sqrt(self, a):
+        a = self.number(a)
+        numerator, denominator = math.isqrt(a.numerator), math.isqrt(a.denominator)
+        if numerator * numerator == a.numerator and denominator * denominator == a.denominator:
+            return Fraction(numerator, denominator)
+        return math.sqrt(a)
+
+
+BACKENDS = {
+    "float": FloatBackend(),
+    "decimal": DecimalBackend(),
+    "fraction": FractionBackend(),
+}
+
+
+def get_backend(backend=None) -> FloatBackend:
+    """Resolve a backend name (or instance, or None for float) to a backend instance"""
+    if backend is None:
+        return BACKENDS["float"]
+    if isinstance(backend, str):
+        try:
+            return BACKENDS[backend]
+        except KeyError:
+            raise ValueError(f"Unknown backend '{backend}' (choose from {', '.join(BACKENDS)})")
+    return backend
+
+
+# Element-wise operations on matrices larger than this go through NumPy
+_MATRIX_NUMPY_SIZE = 256
+
+
+def _element_power(a: float, b: float) -> float:
+    result = BACKENDS["float"].power(a, b)
+    if isinstance(result, complex):
+        raise ValueError("Matrix power has a complex result")
+    return float(result)
+
+
+class Matrix:
+    """Vector or matrix of floats stored row-major in one contiguous array('d')
+    
+    A vector has shape (n,) and a matrix (rows, cols). Arithmetic with a
+    scalar or an equal-shaped value is element-wise and follows the float
+    backend (^ uses its power rules, division by zero raises). @ is the
+    matrix product. Products, determinants and solving use NumPy (viewing
+    the same buffer) when it is installed and plain Python otherwise.
+    """
+    
+    __slots__ = ("shape", "data")
+    
+    def __init__(self, shape: Tuple[int, ...], data):
+        self.shape = tuple(int(n) for n in shape)
+        self.data = data if isinstance(data, array) and data.typecode == "d" else array("d", data)
+        size = self.shape[0] if len(self.shape) == 1 else self.shape[0] * self.shape[1]
+        if len(self.shape) not in (1, 2) or len(self.data) != size or size == 0:
+            raise ValueError(f"Cannot make a {self.shape} matrix from {len(self.data)} values")
+    
+    @classmethod
+    def from_rows(cls, rows) -> "Matrix":
+        """Build from a flat list (a vector) or a list of equal-length rows"""
+        rows = list(rows)
+        if rows and isinstance(rows[0], (list, tuple)):
+            if any(len(row) != len(rows[0]) for row in rows):
+                raise ValueError("Matrix rows must have the same length")
+            return cls((len(rows), len(rows[0])), [value for row in rows for value in row])
+        return cls((len(rows),), rows)
+    
+    @classmethod
+    def from_numpy(cls, values) -> "Matrix":
+        np = _load_numpy()
+        data = array("d")
+        data.frombytes(np.ascontiguousarray(values, dtype=float).tobytes())
+        return cls(values.shape, data)
+    
+    def to_numpy(self):
+        """NumPy view of the same buffer (no copy)"""
+        _load_numpy()
+        return np.frombuffer(self.data, dtype=float).reshape(self.shape)
+    
+    def tolist(self) -> list:
+        if len(self.shape) == 1:
+            return self.data.tolist()
+        cols = self.shape[1]
+        return [self.data[row * cols:(row + 1) * cols].tolist() for row in range(self.shape[0])]
+    
+    def __len__(self) -> int:
+        return self.shape[0]
+    
+    def __getitem__(self, index: int):
+        """An element of a vector, or a row of a matrix as a vector"""
+        if len(self.shape) == 1:
+            return self.data[index]
+        cols = self.shape[1]
+        row = range(self.shape[0])[index]
+        return Matrix((cols,), self.data[row * cols:(row + 1) * cols])
+    
+    # Element-wise arithmetic
+    
+    def _elementwise(self, other, function, reverse: bool = False):
+        if isinstance(other, Matrix):
+            if other.shape != self.shape:
+                raise ValueError(f"Shape mismatch: {self.shape} and {other.shape}")
+            right = other.data
+        elif isinstance(other, (int, float)):
+            right = float(other)
+        else:
+            return NotImplemented
+        left = self.data
+        if reverse:
+            left, right = right, left
+        
+        if NUMPY_AVAILABLE and function is not _element_power and len(self.data) > _MATRIX_NUMPY_SIZE:
+            _load_numpy()
+            a = np.frombuffer(left, dtype=float) if isinstance(left, array) else left
+            b = np.frombuffer(right, dtype=float) if isinstance(right, array) else right
+            if function is operator.truediv and not np.all(b):
+                raise ZeroDivisionError("division by zero")
+            return Matrix.from_numpy(function(a, b).reshape(self.shape))
+        
+        if not isinstance(left, array):
+            return Matrix(self.shape, [function(left, b) for b in right])
+        if not isinstance(right, array):
+            return Matrix(self.shape, [function(a, right) for a in left])
+        return Matrix(self.shape, list(map(function, left, right)))
+    
+    def __add__(self, other):
+        return self._elementwise(other, operator.add)
+    
+    def __radd__(self, other):
+        return self._elementwise(other, operator.add, reverse=True)
+    
+    def __sub__(self, other):
+        return self._elementwise(other, operator.sub)
+    
+    def __rsub__(self, other):
+        return self._elementwise(other, operator.sub, reverse=True)
+    
+    def __mul__(self, other):
+        return self._elementwise(other, operator.mul)
+    
+    def __rmul__(self, other):
+        return self._elementwise(other, operator.mul, reverse=True)
+    
+    def __truediv__(self, other):
+        return self._elementwise(other, operator.truediv)
+    
+    def __rtruediv__(self, other):
+        return self._elementwise(other, operator.truediv, reverse=True)
+    
+    def __pow__(self, other):
+        return self._elementwise(other, _element_power)
+    
+    def __rpow__(self, other):
+        return self._elementwise(other, _element_power, reverse=True)
+    
+    def __neg__(self):
+        return Matrix(self.shape, [-a for a in self.data])
+    
+    def __pos__(self):
+        return self
+    
+    # Linear algebra
+    
+    def __matmul__(self, other):
+        if not isinstance(other, Matrix):
+            return NotImplemented
+        inner = self.shape[-1]
+        if other.shape[0] != inner:
+            raise ValueError(f"Cannot multiply {self.shape} by {other.shape} matrices")
+        if NUMPY_AVAILABLE:
+            result = self.to_numpy() @ other.to_numpy()
+            return float(result) if result.ndim == 0 else Matrix.from_numpy(result)
+        
+        rows = self.tolist() if len(self.shape) == 2 else [self.data.tolist()]
+        columns = other.transpose().tolist() if len(other.shape) == 2 else [other.data.tolist()]
+        products = [[math.fsum(map(operator.mul, row, column)) for column in columns] for row in rows]
+        if len(self.shape) == 1 and len(other.shape) == 1:
+            return products[0][0]
+        if len(other.shape) == 1:
+            return Matrix((len(rows),), [row[0] for row in products])
+        if len(self.shape) == 1:
+            return Matrix((len(columns),), products[0])
+        return Matrix((len(rows), len(columns)), [value for row in products for value in row])
+    
+    def transpose(self) -> "Matrix":
+        if len(self.shape) == 1:
+            return self
+        rows, cols = self.shape
+        data = self.data
+        return Matrix((cols, rows), [data[r * cols + c] for c in range(cols) for r in range(rows)])
+    
+    def _require_square(self, operation: str) -> int:
+        if len(self.shape) != 2 or self.shape[0] != self.shape[1]:
+            raise ValueError(f"{operation} requires a square matrix, got shape {self.shape}")
+        return self.shape[0]
+    
+    def det(self) -> float:
+        """Determinant (LU decomposition with partial pivoting)"""
+        n = self._require_square("Determinant")
+        if NUMPY_AVAILABLE:
+            np = _load_numpy()
+            return float(np.linalg.det(self.to_numpy()))
+        rows = self.tolist()
+        result = 1.0
+        for column in range(n):
+            pivot = max(range(column, n), key=lambda r: abs(rows[r][column]))
+            if rows[pivot][column] == 0:
+                return 0.0
+            if pivot != column:
+                rows[column], rows[pivot] = rows[pivot], rows[column]
+                result = -result
+            result *= rows[column][column]
+            for r in range(column + 1, n):
+                factor = rows[r][column] / rows[column][column]
+                rows[r] = [a - factor * b for a, b in zip(rows[r], rows[column])]
+        return result
+    
+    def solve(self, b: "Matrix") -> "Matrix":
+        """x such that self @ x == b, for a vector or matrix b"""
+        n = self._require_square("Solve")
+        if not isinstance(b, Matrix) or b.shape[0] != n:
+            raise ValueError(f"Right-hand side must have {n} rows")
+        if NUMPY_AVAILABLE:
+            np = _load_numpy()
+            try:
+                return Matrix.from_numpy(np.linalg.solve(self.to_numpy(), b.to_numpy()))
+            except np.linalg.LinAlgError:
+                raise ValueError("Matrix is singular")
+        
+        # Gauss-Jordan elimination on the augmented matrix
+        rhs = b.tolist() if len(b.shape) == 2 else [[value] for value in b.data]
+        rows = [row + extra for row, extra in zip(self.tolist(), rhs)]
+        for column in range(n):
+            pivot = max(range(column, n), key=lambda r: abs(rows[r][column]))
+            if rows[pivot][column] == 0:
+                raise ValueError("Matrix is singular")
+            rows[column], rows[pivot] = rows[pivot], rows[column]
+            lead = rows[column][column]
+            rows[column] = [value / lead for value in rows[column]]
+            for r in range(n):
+                if r != column and rows[r][column]:
+                    factor = rows[r][column]
+                    rows[r] = [a - factor * p for a, p in zip(rows[r], rows[column])]
+        solution = [row[n:] for row in rows]
+        if len(b.shape) == 1:
+            return Matrix((n,), [row[0] for row in solution])
+        return Matrix.from_rows(solution)
+    
+    # Comparison and display
+    
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Matrix) and self.shape == other.shape and self.data == other.data
+    
+    def __hash__(self) -> int:
+        return hash((self.shape, self.data.tobytes()))
+    
+    def __str__(self) -> str:
+        if len(self.shape) == 1:
+            return "[" + ", ".join(map(str, self.data)) + "]"
+        return "[" + "; ".join(", ".join(map(str, row)) for row in self.tolist()) + "]"
+    
+    def __repr__(self) -> str:
+        return f"Matrix({self.tolist()!r})"
+
+
+def _require_matrix(value, function: str) -> Matrix:
+    if not isinstance(value, Matrix):
+        raise ValueError(f"{function}() requires a matrix or vector")
+    return value
+
+
+def matrix_det(a) -> float:
+    return _require_matrix(a, "det").det()
+
+
+def matrix_transpose(a) -> Matrix:
+    return _require_matrix(a, "transpose").transpose()
+
+
+def matrix_solve(a, b) -> Matrix:
+    return _require_matrix(a, "solve").solve(_require_matrix(b, "solve"))
+
+
+class HistoryBuffer:
+    """Fixed-capacity ring buffer of (operation, result) history entries
+    
+    Results are kept as floats in a preallocated array('d') alongside a
+    preallocated list of operation strings, so appends are O(1) and text is
+    only formatted when the history is read.
+    """
+    
+    def __init__(self, capacity: int = 10):
+        if capacity < 1:
+            raise ValueError("History capacity must be at least 1")
+        self.capacity = capacity
+        self.operations = [None] * capacity
+        self.results = array("d", bytes(8 * capacity))
+        self._exact = {}    # slot -> exact result when it is not a plain float
+        self._start = 0
+        self._size = 0
+        self.appended = 0   # total appends since the last clear
+    
+    def __len__(self) -> int:
+        return self._size
+    
+    def append(self, operation: str, result):
+        """Add an entry, overwriting the oldest one when full"""
+        if self._size < self.capacity:
+            slot = (self._start + self._size) % self.capacity
+            self._size += 1
+        else:
+            slot = self._start
+            self._start = (self._start + 1) % self.capacity
+        self.appended += 1
+        self.operations[slot] = operation
+        if self._exact:
+            self._exact.pop(slot, None)
+        try:
+            self.results[slot] = result
+        except (TypeError, OverflowError):
+            self.results[slot] = math.nan
+        if type(result) is not float:
+            self._exact[slot] = result
+    
+    def clear(self):
+        """Remove all entries"""
+        self._start = 0
+        self._size = 0
+        self.appended = 0
+        self._exact.clear()
+        self.operations = [None] * self.capacity
+    
+    def _slot(self, index: int) -> int:
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("history index out of range")
+        return (self._start + index) % self.capacity
+    
+    def __getitem__(self, index: int) -> Tuple[str, float]:
+        slot = self._slot(index)
+        return self.operations[slot], self._exact.get(slot, self.results[slot])
+    
+    def results_view(self, start: int = 0, stop: Optional[int] = None) -> Tuple[memoryview, ...]:
+        """Zero-copy views of results[start:stop] in chronological order
+        
+        Returns one memoryview, or two when the range wraps around the end of
+        the ring. Results that did not fit in a float read as nan.
+        """
+        start, stop, _ = slice(start, stop).indices(self._size)
+        if start >= stop:
+            return (memoryview(self.results)[0:0],)
+        view = memoryview(self.results)
+        first = (self._start + start) % self.capacity
+        last = first + (stop - start)
+        if last <= self.capacity:
+            return (view[first:last],)
+        return (view[first:], view[:last - self.capacity])
+    
+    def format(self, limit: Optional[int] = None) -> list:
+        """Format entries as 'operation = result' strings, oldest first"""
+        count = self._size if limit is None else min(limit, self._size)
+        entries = []
+        for index in range(self._size - count, self._size):
+            operation, result = self[index]
+            entries.append(f"{operation} = {format_result(result)}")
+        return entries
+
+
+
+# CALCULATOR_HISTORY overrides the log location; set it empty to keep
+# history in memory only (as --no-history does)
+DEFAULT_HISTORY_PATH = os.environ.get("CALCULATOR_HISTORY",
+                                      os.path.join(os.path.expanduser("~"), ".calculator_history.bin")) or None
+
+
+class HistoryLog:
+    """Append-only history file of fixed-width binary records
+    
+    Each record is 128 bytes: the float result, a flag byte and 119 bytes of
+    UTF-8 text. Plain floats store the operation text; other results store
+    "operation\0result" with the flag naming the result type, so ints,
+    Decimals and Fractions read back exactly (ints are written in hex, which
+    has no length limit). Text longer than one record
+    spills into continuation records. The file is memory-mapped for reading,
+    so reopening a log with millions of entries costs nothing until entries
+    are actually read.
+    """
+    
+    MAGIC = b"CALCHST1"
+    HEADER = struct.Struct("<8sI4x")
+    RECORD = struct.Struct("<dB119s")
+    
+    # Flag values: the result type of an entry, or a continuation record.
+    # INT (decimal text) is only read, from logs written before HEX_INT
+    FLOAT, TEXT, INT, DECIMAL, FRACTION, HEX_INT = range(6)
+    CONTINUATION = 0x80
+    _KINDS = {int: HEX_INT, decimal.Decimal: DECIMAL, Fraction: FRACTION}
+    _PARSERS = {INT: int, DECIMAL: decimal.Decimal, FRACTION: Fraction, HEX_INT: lambda text: int(text, 16)}
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._map = None
+        self._mapped_size = 0
+        # Record index of every entry; None while no entry spans several
+        # records, so entry i is simply record i
+        self._starts = None
+        self._scanned = 0
+        with open(path, "ab+") as f:
+            f.seek(0)
+            header = f.read(self.HEADER.size)
+            if not header:
+                f.write(self.HEADER.pack(self.MAGIC, self.RECORD.size))
+            elif len(header) < self.HEADER.size or \
+                    self.HEADER.unpack(header) != (self.MAGIC, self.RECORD.size):
+                raise ValueError(f"Not a calculator history file: {path}")
+        self._file = open(path, "ab", buffering=0)
+    
+    def append(self, operation: str, result):
+        """Append one entry (a single write, so concurrent writers do not interleave)"""
+        text, flag = operation, self.FLOAT
+        try:
+            value = float(result)
+        except (TypeError, OverflowError):
+            value = math.nan
+        if type(result) is not float:
+            flag = self._KINDS.get(type(result), self.TEXT)
+            text = f"{operation}\0{result:x}" if flag == self.HEX_INT else f"{operation}\0{result}"
+        
+        data = text.encode("utf-8")
+        size = self.RECORD.size - 9
+        records = [self.RECORD.pack(value, flag, data[:size])]
+        for offset in range(size, len(data), size):
+            records.append(self.RECORD.pack(math.nan, self.CONTINUATION, data[offset:offset + size]))
+        self._file.write(b"".join(records))
+    
+    def _refresh(self):
+        """Remap the file if it grew and index the entries appended since"""
+        size = os.path.getsize(self.path)
+        if size == self._mapped_size:
+            return
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if size > self.HEADER.size:
+            with open(self.path, "rb") as f:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._mapped_size = size
+        
+        records = max(0, size - self.HEADER.size) // self.RECORD.size
+        if records > self._scanned:
+            first = self.HEADER.size + self._scanned * self.RECORD.size + 8
+            flags = self._map[first:self.HEADER.size + records * self.RECORD.size:self.RECORD.size]
+            if self._starts is None and max(flags) >= self.CONTINUATION:
+                self._starts = array("q", range(self._scanned))
+            if self._starts is not None:
+                self._starts.extend(self._scanned + i for i, flag in enumerate(flags)
+                                    if flag < self.CONTINUATION)
+            self._scanned = records
+    
+    def _count(self) -> int:
+        return self._scanned if self._starts is None else len(self._starts)
+    
+    def __len__(self) -> int:
+        self._refresh()
+        return self._count()
+    
+    def _read(self, index: int, backend=None) -> Tuple[str, Any]:
+        if self._starts is None:
+            record, end = index, index + 1
+        else:
+            record = self._starts[index]
+            end = self._starts[index + 1] if index + 1 < len(self._starts) else self._scanned
+        offset = self.HEADER.size + record * self.RECORD.size
+        value, flag, data = self.RECORD.unpack_from(self._map, offset)
+        for extra in range(record + 1, end):
+            data = data.rstrip(b"\0") + self.RECORD.unpack_from(
+                self._map, self.HEADER.size + extra * self.RECORD.size)[2]
+        text = data.rstrip(b"\0").decode("utf-8", errors="ignore")
+        if flag == self.FLOAT:
+            return text, value
+        text, _, value = text.partition("\0")
+        parser = self._PARSERS.get(flag)
+        if parser is not None:
+            value = parser(value)
+            if backend is not None and flag not in (self.INT, self.HEX_INT):
+                value = backend.number(value)
+        return text, value
+    
+    def __getitem__(self, index: int) -> Tuple[str, Any]:
+        count = self._count()
+        if not -count <= index < count:
+            # Only look at the file again when the index is past what is known
+            count = len(self)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError("history index out of range")
+        return self._read(index)
+    
+    def tail(self, count: int, backend=None) -> List[Tuple[str, Any]]:
+        """The most recent `count` entries, oldest first
+        
+        Exact results (ints, Decimals, Fractions) come back as that type, or
+        converted by backend.number when a backend is given; ints are kept.
+        """
+        total = len(self)
+        return [self._read(index, backend) for index in range(max(0, total - count), total)]
+    
+    def replay(self, buffer: HistoryBuffer, backend=None):
+        """Load the most recent entries that fit into a history buffer"""
+        for operation, result in self.tail(buffer.capacity, backend):
+            buffer.append(operation, result)
+    
+    def clear(self):
+        """Drop all records, keeping the header"""
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._mapped_size = 0
+        self._starts = None
+        self._scanned = 0
+        with open(self.path, "r+b") as f:
+            f.truncate(self.HEADER.size)
+    
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+
+class _MemoTable:
+    """Cached results of one function with LRU or LFU eviction"""
+    
+    def __init__(self, policy: str = "lru"):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache policy: {policy}")
+        self.policy = policy
+        self.entries = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # LRU keeps one recency-ordered dict; LFU keeps one per use count
+        # so the least frequently (then least recently) used key is found in O(1)
+        self._order = OrderedDict()
+        self._counts = {}
+        self._buckets = {}
+        self._min_count = 0
+    
+    def _touch(self, key):
+        if self.policy == "lru":
+            self._order.move_to_end(key)
+            return
+        count = self._counts[key]
+        bucket = self._buckets[count]
+        del bucket[key]
+        if not bucket:
+            del self._buckets[count]
+            if self._min_count == count:
+                self._min_count = count + 1
+        self._counts[key] = count + 1
+        self._buckets.setdefault(count + 1, OrderedDict())[key] = None
+    
+    def get(self, key):
+        """Return (True, value) on a hit, (False, None) on a miss"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+        self.hits += 1
+        self._touch(key)
+        return True, entry[0]
+    
+    def put(self, key, value, size: int):
+        self.entries[key] = (value, size)
+        self.bytes += size
+        if self.policy == "lru":
+            self._order[key] = None
+        else:
+            self._counts[key] = 1
+            self._buckets.setdefault(1, OrderedDict())[key] = None
+            self._min_count = 1
+    
+    def evict(self) -> int:
+        """Drop the entry chosen by the policy; return the bytes freed"""
+        if self.policy == "lru":
+            key, _ = self._order.popitem(last=False)
+        else:
+            bucket = self._buckets[self._min_count]
+            key, _ = bucket.popitem(last=False)
+            if not bucket:
+                del self._buckets[self._min_count]
+                self._min_count = min(self._buckets, default=0)
+            del self._counts[key]
+        _, size = self.entries.pop(key)
+        self.bytes -= size
+        self.evictions += 1
+        return size
+    
+    def clear(self):
+        self.entries.clear()
+        self._order.clear()
+        self._counts.clear()
+        self._buckets.clear()
+        self._min_count = 0
+        self.bytes = 0
+
+
+class MemoCache:
+    """Memoizes expensive engine functions within a shared memory budget
+    
+    Each cached function has its own table and eviction policy ("lru" or
+    "lfu"). Entry sizes are measured with sys.getsizeof, so a 1000! result
+    counts for its real size. When the budget is exceeded, entries are
+    evicted from whichever table holds the most bytes.
+    """
+    
+    DEFAULT_POLICIES = {"factorial": "lfu", "power": "lru", "log": "lru"}
+    
+    def __init__(self, budget_bytes: int = 64 * 1024 * 1024, policies: Optional[dict] = None):
+        if budget_bytes <= 0:
+            raise ValueError("Cache budget must be positive")
+        self.budget_bytes = budget_bytes
+        self.bytes = 0
+        self.tables = {name: _MemoTable(policy)
+                       for name, policy in (policies or self.DEFAULT_POLICIES).items()}
+    
+    def call(self, name: str, function, *args):
+        """Return function(*args), from the cache when possible"""
+        table = self.tables.get(name)
+        if table is None:
+            return function(*args)
+        # Types are part of the key: 2, 2.0 and Decimal(2) hash alike but
+        # give different results
+        key = tuple((type(arg), arg) for arg in args)
+        found, value = table.get(key)
+        if found:
+            return value
+        value = function(*args)
+        size = sys.getsizeof(value) + sum(sys.getsizeof(arg) for arg in args)
+        if size <= self.budget_bytes:
+            table.put(key, value, size)
+            self.bytes += size
+            while self.bytes > self.budget_bytes:
+                self.bytes -= max(self.tables.values(), key=lambda t: t.bytes).evict()
+        return value
+    
+    def stats(self) -> dict:
+        """Hit/miss counters and memory use per function"""
+        return {
+            "budget_bytes": self.budget_bytes,
+            "bytes": self.bytes,
+            "functions": {
+                name: {
+                    "policy": table.policy,
+                    "entries": len(table.entries),
+                    "bytes": table.bytes,
+                    "hits": table.hits,
+                    "misses": table.misses,
+                    "evictions": table.evictions,
+                }
+                for name, table in self.tables.items()
+            },
+        }
+    
+    def clear(self):
+        for table in self.tables.values():
+            table.clear()
+        self.bytes = 0
+
+
+class Instrumentation:
+    """Counts, latencies and errors of calculator operations
+    
+    Operations are named by stage, e.g. 'engine.add', 'expression.tokenize',
+    'expression.parse', 'expression.compile', 'expression.codegen' and
+    'expression.evaluate'. The most recent `window` latencies per operation
+    are kept for percentiles.
+    Hooks are called as hook(name, seconds, error) for every recorded
+    operation, so timings can also be forwarded to an external profiler.
+    """
+    
+    QUANTILES = (0.5, 0.9, 0.99)
+    
+    def __init__(self, window: int = 10000):
+        self.window = window
+        self.counts = {}
+        self.totals = {}
+        self.samples = {}
+        self.errors = {}
+        self.hooks = []
+    
+    def add_hook(self, hook):
+        self.hooks.append(hook)
+    
+    def _samples(self, name: str) -> deque:
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+            self.counts[name] = 0
+            self.totals[name] = 0.0
+        return samples
+    
+    def record(self, name: str, seconds: float, error: Optional[BaseException] = None):
+        samples = self._samples(name)
+        self.counts[name] += 1
+        self.totals[name] += seconds
+        samples.append(seconds)
+        if error is not None:
+            key = (name, type(error).__name__)
+            self.errors[key] = self.errors.get(key, 0) + 1
+        for hook in self.hooks:
+            hook(name, seconds, error)
+    
+    def measure(self, name: str, function, *args, **kwargs):
+        """Call function(*args, **kwargs), recording its latency and any error"""
+        start = perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self.record(name, perf_counter() - start, e)
+            raise
+        self.record(name, perf_counter() - start)
+        return result
+    
+    def wrap(self, name: str, function):
+        """function instrumented under name"""
+        def instrumented(*args, **kwargs):
+            return self.measure(name, function, *args, **kwargs)
+        instrumented.__wrapped__ = function
+        return instrumented
+    
+    def reset(self):
+        self.counts.clear()
+        self.totals.clear()
+        self.samples.clear()
+        self.errors.clear()
+    
+    def state(self) -> dict:
+        """Picklable raw state, for merging results from worker processes"""
+        return {
+            "counts": dict(self.counts),
+            "totals": dict(self.totals),
+            "samples": {name: list(samples) for name, samples in self.samples.items()},
+            "errors": dict(self.errors),
+        }
+    
+    def merge(self, state: dict):
+        """Add the raw state of another Instrumentation (see state())"""
+        for name, samples in state["samples"].items():
+            self._samples(name).extend(samples)
+            self.counts[name] += state["counts"][name]
+            self.totals[name] += state["totals"][name]
+        for key, count in state["errors"].items():
+            self.errors[key] = self.errors.get(key, 0) + count
+    
+    def snapshot(self) -> dict:
+        """Per-operation counts, cumulative and percentile latency (seconds) and errors"""
+        operations = {}
+        for name in sorted(self.counts):
+            samples = sorted(self.samples[name])
+            entry = {
+                "count": self.counts[name],
+                "total_seconds": self.totals[name],
+                "mean_seconds": self.totals[name] / self.counts[name] if self.counts[name] else 0.0,
+            }
+            for quantile in self.QUANTILES:
+                index = min(len(samples) - 1, int(quantile * len(samples)))
+                entry[f"p{quantile * 100:g}_seconds"] = samples[index] if samples else None
+            entry["errors"] = {error: count for (operation, error), count in sorted(self.errors.items())
+                               if operation == name}
+            operations[name] = entry
+        return operations
+    
+    def to_json(self) -> str:
+        import json
+        return json.dumps(self.snapshot(), indent=2)
+    
+    def to_prometheus(self, prefix: str = "calculator") -> str:
+        """Prometheus text exposition format (latency as a summary, errors as a counter)"""
+        metric = f"{prefix}_operation_seconds"
+        lines = [f"# HELP {metric} Latency of calculator operations",
+                 f"# TYPE {metric} summary"]
+        snapshot = self.snapshot()
+        for name, entry in snapshot.items():
+            for quantile in self.QUANTILES:
+                value = entry[f"p{quantile * 100:g}_seconds"]
+                if value is not None:
+                    lines.append(f'{metric}{{operation="{name}",quantile="{quantile:g}"}} {value!r}')
+            lines.append(f'{metric}_sum{{operation="{name}"}} {entry["total_seconds"]!r}')
+            lines.append(f'{metric}_count{{operation="{name}"}} {entry["count"]}')
+        errors = f"{prefix}_operation_errors_total"
+        lines += [f"# HELP {errors} Errors raised by calculator operations",
+                  f"# TYPE {errors} counter"]
+        for (name, error), count in sorted(self.errors.items()):
+            lines.append(f'{errors}{{operation="{name}",error="{error}"}} {count}')
+        return "\n".join(lines) + "\n"
+    
+    def export(self, format: str = "json") -> str:
+        if format == "json":
+            return self.to_json()
+        if format == "prometheus":
+            return self.to_prometheus()
+        raise ValueError(f"Unknown metrics format '{format}' (choose json or prometheus)")
+
+
+# Instrumentation of the expression pipeline (None: disabled, no overhead)
+_INSTRUMENTATION: Optional[Instrumentation] = None
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation]) -> Optional[Instrumentation]:
+    """Install (or with None, remove) pipeline instrumentation; returns the previous one"""
+    global _INSTRUMENTATION
+    previous, _INSTRUMENTATION = _INSTRUMENTATION, instrumentation
+    return previous
+
+
 class CalculatorEngine:
     """Handles all mathematical operations and calculations"""
     
-    def __init__(self):
-        self.current_value = 0.0
-        self.memory = 0.0
-        self.history = []
+    INSTRUMENTED_OPERATIONS = (
+        "add", "subtract", "multiply", "divide", "power", "square_root", "factorial",
+        "sin", "cos", "tan", "log", "ln", "percent", "matmul", "transpose",
+        "determinant", "solve", "batch",
+    )
+    
+    def __init__(self, history_size: int = 10, history_path: Optional[str] = None,
+                 backend=None, cache: Optional[MemoCache] = None,
+                 instrumentation: Optional[Instrumentation] = None):
+        self.backend = get_backend(backend)
+        self.cache = cache
+        self.instrumentation = instrumentation
+        if instrumentation is not None:
+            # Instance attributes shadow the methods, so uninstrumented
+            # engines pay nothing
+            for name in self.INSTRUMENTED_OPERATIONS:
+                setattr(self, name, instrumentation.wrap(f"engine.{name}", getattr(self, name)))
+        self.current_value = self.backend.number(0)
+        self.memory = self.backend.number(0)
+        self.history = HistoryBuffer(history_size)
+        self.history_log = HistoryLog(history_path) if history_path else None
+        if self.history_log is not None:
+            self.history_log.replay(self.history, self.backend)
     
     def add(self, a: float, b: float) -> float:
         """Addition: a + b"""
-        return a + b
+        return self.backend.add(a, b)
     
     def subtract(self, a: float, b: float) -> float:
         """Subtraction: a - b"""
-        return a - b
+        return self.backend.subtract(a, b)
     
     def multiply(self, a: float, b: float) -> float:
         """Multiplication: a * b"""
-        return a * b
+        return self.backend.multiply(a, b)
     
     def divide(self, a: float, b: float) -> float:
         """Division: a / b"""
         if b == 0:
             raise ValueError("Cannot divide by zero")
-        return a / b
+        return self.backend.divide(a, b)
     
     def power(self, a: float, b: float) -> float:
         """Power: a ^ b"""
-        return a ** b
+        if self.cache is not None:
+            return self.cache.call("power", self.backend.power, a, b)
+        return self.backend.power(a, b)
     
     def square_root(self, a: float) -> float:
         """Square root: √a"""
         if a < 0:
             raise ValueError("Cannot calculate square root of negative number")
-        return math.sqrt(a)
+        return self.backend.sqrt(a)
     
     def factorial(self, a: float) -> int:
         """Factorial: a!"""
         if a < 0:
             raise ValueError("Factorial not defined for negative numbers")
-        if not isinstance(a, int):
-            a = int(a)
-        return math.factorial(a)
+        if self.cache is not None:
+            return self.cache.call("factorial", self.backend.factorial, int(a))
+        return self.backend.factorial(int(a))
     
     def sin(self, a: float, degrees: bool = False) -> float:
         """Sine function"""
         if degrees:
-            a = math.radians(a)
-        return math.sin(a)
+            a = self.backend.radians(a)
+        return self.backend.sin(a)
     
     def cos(self, a: float, degrees: bool = False) -> float:
         """Cosine function"""
         if degrees:
-            a = math.radians(a)
-        return math.cos(a)
+            a = self.backend.radians(a)
+        return self.backend.cos(a)
     
     def tan(self, a: float, degrees: bool = False) -> float:
         """Tangent function"""
         if degrees:
-            a = math.radians(a)
-        return math.tan(a)
+            a = self.backend.radians(a)
+        return self.backend.tan(a)
     
     def log(self, a: float, base: float = 10) -> float:
         """Logarithm"""
         if a <= 0:
             raise ValueError("Logarithm undefined for non-positive numbers")
+        if self.cache is not None:
+            return self.cache.call("log", self._log, a, base)
+        return self._log(a, base)
+    
+    def _log(self, a, base):
         if base == 10:
-            return math.log10(a)
+            return self.backend.log10(a)
         elif base == 2:
-            return math.log2(a)
+            return self.backend.log2(a)
         else:
-            return math.log(a, base)
+            return self.backend.log(a, base)
     
     def ln(self, a: float) -> float:
         """Natural logarithm"""
         if a <= 0:
             raise ValueError("Natural logarithm undefined for non-positive numbers")
-        return math.log(a)
+        return self.backend.ln(a)
     
     def percent(self, a: float) -> float:
         """Convert to percentage"""
-        return a / 100
+        return self.backend.divide(a, 100)
+    
+    def matmul(self, a: Matrix, b: Matrix):
+        """Matrix product: a @ b"""
+        return _require_matrix(a, "matmul") @ _require_matrix(b, "matmul")
+    
+    def transpose(self, a: Matrix) -> Matrix:
+        """Matrix transpose"""
+        return matrix_transpose(a)
+    
+    def determinant(self, a: Matrix) -> float:
+        """Determinant of a square matrix"""
+        return matrix_det(a)
+    
+    def solve(self, a: Matrix, b: Matrix) -> Matrix:
+        """Solve the linear system a @ x = b"""
+        return matrix_solve(a, b)
     
     def memory_store(self, value: float):
         """Store value in memory"""
@@ -112,19 +1269,130 @@ class CalculatorEngine:
         """Clear memory"""
         self.memory = 0.0
     
+    def warm_cache(self, path: str) -> int:
+        """Pre-compute cached functions from a file; return the number of entries
+        
+        Each line holds a function name and its arguments, e.g.
+        'factorial 1000', 'power 3 4000' or 'log 1000 7'. Blank lines and
+        lines starting with # are ignored.
+        """
+        if self.cache is None:
+            raise ValueError("Caching is not enabled")
+        count = 0
+        with open(path, encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                fields = line.split()
+                if not fields or fields[0].startswith("#"):
+                    continue
+                name, args = fields[0], fields[1:]
+                if name not in ("factorial", "power", "log") or \
+                        not 1 <= len(args) <= (1 if name == "factorial" else 2):
+                    raise ValueError(f"{path}:{line_number}: cannot warm '{line.strip()}'")
+                getattr(self, name)(*[self.backend.number(arg) for arg in args])
+                count += 1
+        return count
+    
     def add_to_history(self, operation: str, result: float):
         """Add calculation to history"""
-        self.history.append(f"{operation} = {result}")
-        if len(self.history) > 10:
-            self.history.pop(0)
+        # Log first: if the entry cannot be written, the buffer is left as it was
+        if self.history_log is not None:
+            self.history_log.append(operation, result)
+        self.history.append(operation, result)
     
     def clear_history(self):
         """Clear calculation history"""
         self.history.clear()
+        if self.history_log is not None:
+            self.history_log.clear()
     
-    def get_history(self) -> list:
-        """Get calculation history"""
-        return self.history.copy()
+    def get_history(self, limit: Optional[int] = None) -> list:
+        """Get calculation history (the most recent `limit` entries if given)"""
+        return self.history.format(limit)
+    
+    def batch(self, operation: str, a, b=None, degrees: bool = False,
+              base: float = 10, errors: str = "raise"):
+        """Apply an operation element-wise over arrays (or any buffer) of operands
+        
+        errors="raise" raises ValueError for the first invalid element,
+        errors="mask" returns a numpy masked array with invalid elements masked.
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("Batch evaluation requires numpy")
+        if errors not in ("raise", "mask"):
+            raise ValueError("errors must be 'raise' or 'mask'")
+        operations = _batch_operations()
+        if operation not in operations:
+            raise ValueError(f"Unknown batch operation: {operation}")
+        
+        arity, function, invalid, message = operations[operation]
+        operands = [np.asarray(a, dtype=float)]
+        if arity == 2:
+            if b is None:
+                raise ValueError(f"{operation} requires two operands")
+            operands.append(np.asarray(b, dtype=float))
+        operands = np.broadcast_arrays(*operands)
+        
+        mask = invalid(*operands) if invalid else None
+        with np.errstate(all="ignore"):
+            if operation in ("sin", "cos", "tan"):
+                result = function(np.radians(operands[0]) if degrees else operands[0])
+            elif operation == "log":
+                result = _batch_log(operands[0], base)
+            else:
+                result = function(*operands)
+        
+        if mask is None or not mask.any():
+            return np.ma.masked_array(result, mask=False) if errors == "mask" else result
+        if errors == "raise":
+            index = np.unravel_index(np.argmax(mask), mask.shape)
+            index = index[0] if len(index) == 1 else index
+            raise ValueError(f"{message} (element {index})")
+        return np.ma.masked_array(result, mask=mask)
+
+
+_FACTORIAL_TABLE = None
+
+
+def _batch_factorial(a):
+    """Float factorials via a lookup table (results above 170! overflow to inf)"""
+    global _FACTORIAL_TABLE
+    if _FACTORIAL_TABLE is None:
+        _FACTORIAL_TABLE = np.array([float(math.factorial(i)) for i in range(171)])
+    n = np.trunc(a)
+    index = np.clip(np.nan_to_num(n, nan=0.0), 0, 170).astype(np.intp)
+    return np.where((n >= 0) & (n <= 170), _FACTORIAL_TABLE[index], np.inf)
+
+
+def _batch_log(a, base):
+    if base == 10:
+        return np.log10(a)
+    elif base == 2:
+        return np.log2(a)
+    return np.log(a) / np.log(base)
+
+
+@lru_cache(maxsize=None)
+def _batch_operations() -> dict:
+    """operation -> (arity, ufunc, invalid-element predicate, engine error message)"""
+    _load_numpy()
+    return {
+        "add": (2, np.add, None, None),
+        "subtract": (2, np.subtract, None, None),
+        "multiply": (2, np.multiply, None, None),
+        "divide": (2, np.divide, lambda a, b: b == 0, "Cannot divide by zero"),
+        "power": (2, np.power, None, None),
+        "square_root": (1, np.sqrt,
+                        lambda a: a < 0, "Cannot calculate square root of negative number"),
+        "factorial": (1, _batch_factorial,
+                      lambda a: a < 0, "Factorial not defined for negative numbers"),
+        "sin": (1, np.sin, None, None),
+        "cos": (1, np.cos, None, None),
+        "tan": (1, np.tan, None, None),
+        "log": (1, None, lambda a: a <= 0, "Logarithm undefined for non-positive numbers"),
+        "ln": (1, np.log,
+               lambda a: a <= 0, "Natural logarithm undefined for non-positive numbers"),
+        "percent": (1, lambda a: a / 100, None, None),
+    }
 
 # ============================================================================
 # Part 2: Command-Line Interface (CLI)
@@ -133,8 +1401,13 @@ class CalculatorEngine:
 class CommandLineCalculator:
     """Command-line calculator interface"""
     
-    def __init__(self):
-        self.calc = CalculatorEngine()
+    def __init__(self, history_path: Optional[str] = None, backend=None,
+                 cache: Optional[MemoCache] = None):
+        # Instrumentation is cheap next to interactive input, so always record;
+        # expression stages are only routed to it while run() is active
+        self.instrumentation = Instrumentation()
+        self.calc = CalculatorEngine(history_path=history_path, backend=backend, cache=cache,
+                                     instrumentation=self.instrumentation)
         self.running = True
     
     def display_menu(self):
@@ -161,9 +1434,14 @@ class CommandLineCalculator:
         print("  mr  : Memory Recall")
         print("  m+  : Memory Add")
         print("  mc  : Memory Clear")
+        print("\nExpressions:")
+        print("  =   : Evaluate an expression, e.g. 2^10 + √16 - sin(30)")
+        print("        matrices: [1, 2; 3, 4] @ [5, 6], det(A), transpose(A), solve(A, b)")
         print("\nOther Commands:")
         print("  h   : History")
         print("  c   : Clear History")
+        print("  k   : Cache Statistics")
+        print("  p   : Profiling Metrics (JSON or Prometheus)")
         print("  m   : Menu")
         print("  q   : Quit")
         print("="*50)
@@ -175,7 +1453,7 @@ class CommandLineCalculator:
                 value = input(prompt)
                 if value.lower() == 'q':
                     return None
-                return float(value)
+                return self.calc.backend.number(value)
             except ValueError:
                 print("Invalid input. Please enter a number.")
     
@@ -208,7 +1486,7 @@ class CommandLineCalculator:
                 result = self.calc.power(a, b)
                 operation_str = f"{a} ^ {b}"
             
-            print(f"\nResult: {operation_str} = {result}")
+            print(f"\nResult: {operation_str} = {format_result(result)}")
             self.calc.add_to_history(operation_str, result)
             
         except ValueError as e:
@@ -251,7 +1529,7 @@ class CommandLineCalculator:
                 result = self.calc.percent(a)
                 operation_str = f"{a}%"
             
-            print(f"\nResult: {operation_str} = {result}")
+            print(f"\nResult: {operation_str} = {format_result(result)}")
             self.calc.add_to_history(operation_str, result)
             
         except ValueError as e:
@@ -259,6 +1537,18 @@ class CommandLineCalculator:
         except Exception as e:
             print(f"Unexpected error: {e}")
     
+    def handle_expression(self):
+        """Evaluate a typed expression"""
+        expr = input("Enter expression: ").strip()
+        if not expr or expr.lower() == 'q':
+            return
+        try:
+            result = evaluate(expr, self.calc.backend)
+            print(f"\nResult: {expr} = {format_result(result)}")
+            self.calc.add_to_history(expr, result)
+        except ValueError as e:
+            print(f"Error: {e}")
+    
     def handle_memory(self, command: str):
         """Handle memory operations"""
         if command == 'ms':
@@ -278,8 +1568,37 @@ class CommandLineCalculator:
             self.calc.memory_clear()
             print("Memory cleared")
     
+    def show_cache_stats(self):
+        """Print hit/miss counters of the memoizing cache"""
+        if self.calc.cache is None:
+            print("Caching is not enabled (start with --cache-budget)")
+            return
+        stats = self.calc.cache.stats()
+        print(f"\nCache: {stats['bytes']:,} of {stats['budget_bytes']:,} bytes")
+        for name, table in stats["functions"].items():
+            print(f"  {name:<10} {table['policy']}  entries={table['entries']}  "
+                  f"hits={table['hits']}  misses={table['misses']}  evictions={table['evictions']}")
+    
+    def show_metrics(self):
+        """Print operation counts, latencies and errors recorded this session"""
+        if not self.instrumentation.counts:
+            print("No operations recorded yet")
+            return
+        choice = input("Format - json or prometheus [json]: ").strip().lower() or "json"
+        try:
+            print(self.instrumentation.export("prometheus" if choice.startswith("p") else choice))
+        except ValueError as e:
+            print(f"Error: {e}")
+    
     def run(self):
         """Run the command-line calculator"""
+        previous = set_instrumentation(self.instrumentation)
+        try:
+            self._command_loop()
+        finally:
+            set_instrumentation(previous)
+    
+    def _command_loop(self):
         self.display_menu()
         
         while self.running:
@@ -302,12 +1621,18 @@ class CommandLineCalculator:
             elif command == 'c':
                 self.calc.clear_history()
                 print("History cleared")
+            elif command == 'k':
+                self.show_cache_stats()
+            elif command == 'p':
+                self.show_metrics()
             elif command in ['+', '-', '*', '/', '^']:
                 self.handle_basic_operation(command)
             elif command in ['sqrt', 'fact', 'sin', 'cos', 'tan', 'log', 'ln', '%']:
                 self.handle_function(command)
             elif command in ['ms', 'mr', 'm+', 'mc']:
                 self.handle_memory(command)
+            elif command == '=':
+                self.handle_expression()
             else:
                 print("Invalid command. Type 'm' to see the menu.")
 
@@ -315,25 +1640,36 @@ class CommandLineCalculator:
 # Part 3: Graphical User Interface (GUI)
 # ============================================================================
 
-try:
+# tkinter is only imported (and GraphicalCalculator only defined) when the GUI
+# front end is chosen, so the engine never depends on a GUI toolkit
+GUI_AVAILABLE = importlib.util.find_spec("tkinter") is not None
+
+
+def load_gui():
+    """Import tkinter and define GraphicalCalculator on first use of the GUI"""
+    global tk, ttk, messagebox, scrolledtext, GraphicalCalculator
+    if "GraphicalCalculator" in globals():
+        return GraphicalCalculator
+    
     import tkinter as tk
     from tkinter import ttk, messagebox, scrolledtext
-    GUI_AVAILABLE = True
-except ImportError:
-    GUI_AVAILABLE = False
-
-if GUI_AVAILABLE:
+    
     class GraphicalCalculator:
         """Graphical calculator interface using Tkinter"""
         
-        def __init__(self, root):
+        # Idle time after the last keystroke before the live preview is recomputed
+        PREVIEW_DELAY_MS = 120
+        
+        def __init__(self, root, history_path: Optional[str] = None, backend=None,
+                     cache: Optional[MemoCache] = None):
             self.root = root
             self.root.title("Python Calculator")
             self.root.geometry("500x700")
             self.root.resizable(True, True)
             
             # Initialize calculator engine
-            self.calc = CalculatorEngine()
+            self.calc = CalculatorEngine(history_path=history_path, backend=backend, cache=cache)
+            self.history_shown = 0
             
             # Variables
             self.display_text = tk.StringVar(value="0")
@@ -342,6 +1678,12 @@ if GUI_AVAILABLE:
             self.last_operation = ""
             self.reset_display = False
             
+            # Live preview of the running result while typing
+            self.preview = LivePreview(self.calc.backend)
+            self.preview_text = tk.StringVar(value="")
+            self.live_preview = tk.BooleanVar(value=True)
+            self.preview_job = None
+            
             # Configure colors
             self.setup_styles()
             
@@ -400,6 +1742,18 @@ if GUI_AVAILABLE:
             )
             display_label.pack(fill=tk.BOTH, expand=True)
             
+            # Running result while typing
+            preview_label = tk.Label(
+                display_frame,
+                textvariable=self.preview_text,
+                bg=self.display_bg,
+                fg="#888888",
+                font=("Arial", 11),
+                anchor=tk.E,
+                padx=20
+            )
+            preview_label.pack(fill=tk.X, pady=(0, 5))
+            
             # History display
             history_frame = tk.Frame(main_frame, bg=self.history_bg)
             history_frame.pack(fill=tk.X, pady=(0, 10))
@@ -413,6 +1767,19 @@ if GUI_AVAILABLE:
             )
             history_label.pack(anchor=tk.W, padx=10, pady=(5, 0))
             
+            preview_toggle = tk.Checkbutton(
+                history_frame,
+                text="Live preview",
+                variable=self.live_preview,
+                command=self.schedule_preview,
+                bg=self.history_bg,
+                fg=self.history_fg,
+                selectcolor=self.display_bg,
+                activebackground=self.history_bg,
+                font=("Arial", 9)
+            )
+            preview_toggle.place(relx=1.0, x=-10, y=3, anchor=tk.NE)
+            
             self.history_text = scrolledtext.ScrolledText(
                 history_frame,
                 height=4,
@@ -544,17 +1911,8 @@ if GUI_AVAILABLE:
                 self.calculate()
                 return
             
-            # Handle special cases
-            if value == "²":
-                self.current_input += "**2"
-            elif value == "³":
-                self.current_input += "**3"
-            elif value == "√":
-                self.current_input += "math.sqrt("
-            elif value in ["sin(", "cos(", "tan(", "log(", "ln("]:
-                self.current_input += value
-            else:
-                self.current_input += value
+            # Display symbols (², ³, √, π, ...) are understood by the evaluator
+            self.current_input += value
             
             self.update_display()
         
@@ -562,6 +1920,26 @@ if GUI_AVAILABLE:
             """Update the display with current input"""
             display = self.current_input if self.current_input else "0"
             self.display_text.set(display)
+            self.schedule_preview()
+        
+        def schedule_preview(self):
+            """Debounce the live preview so keystrokes never wait for evaluation"""
+            if self.preview_job is not None:
+                self.root.after_cancel(self.preview_job)
+            self.preview_job = self.root.after(self.PREVIEW_DELAY_MS, self.update_preview)
+        
+        def update_preview(self):
+            """Show the running result of the expression typed so far"""
+            self.preview_job = None
+            if not self.live_preview.get() or self.reset_display or not self.current_input:
+                self.preview_text.set("")
+                return
+            value = self.preview.update(self.current_input)
+            try:
+                self.preview_text.set("" if value is None else f"= {format_result(value)}")
+            except ValueError:
+                # e.g. a Fraction whose parts are too long for str()
+                self.preview_text.set("")
         
         def calculate(self):
             """Calculate the current expression"""
@@ -569,45 +1947,23 @@ if GUI_AVAILABLE:
                 return
             
             try:
-                # Prepare expression for evaluation
-                expr = self.current_input
-                
-                # Replace display symbols with Python math symbols
-                expr = expr.replace("×", "*")
-                expr = expr.replace("÷", "/")
-                expr = expr.replace("−", "-")
-                expr = expr.replace("^", "**")
-                
-                # Handle percentage
-                if "%" in expr:
-                    expr = expr.replace("%", "/100")
-                
-                # Handle factorial
-                import re
-                expr = re.sub(r'(\d+)!', r'math.factorial(\1)', expr)
-                
-                # Safe evaluation
-                allowed_names = {
-                    k: v for k, v in math.__dict__.items() 
-                    if not k.startswith("__")
-                }
-                
-                result = eval(expr, {"__builtins__": {}}, allowed_names)
+                expression = self.current_input
+                result = evaluate(expression, self.calc.backend)
                 
                 # Update expression display
                 self.expression_text.set(f"{self.current_input} =")
                 
                 # Update current input with result
-                self.current_input = str(result)
+                self.current_input = format_result(result)
                 self.update_display()
                 
                 # Add to history
-                history_entry = f"{self.current_input} = {result}"
-                self.calc.add_to_history(history_entry, result)
+                self.calc.add_to_history(expression, result)
                 self.update_history()
                 
                 # Set flag to reset on next input
                 self.reset_display = True
+                self.preview_text.set("")
                 
             except Exception as e:
                 messagebox.showerror("Calculation Error", f"Error: {str(e)}")
@@ -618,6 +1974,7 @@ if GUI_AVAILABLE:
             self.expression_text.set("")
             self.display_text.set("0")
             self.reset_display = False
+            self.preview_text.set("")
         
         def backspace(self):
             """Remove last character from input"""
@@ -655,16 +2012,27 @@ if GUI_AVAILABLE:
             messagebox.showinfo("Memory", "Memory cleared")
         
         def update_history(self):
-            """Update history display"""
-            history = self.calc.get_history()
+            """Update history display, inserting only entries added since the last update"""
+            history = self.calc.history
+            new_count = history.appended - self.history_shown
+            if new_count < 0:
+                # History was cleared since the last update
+                self.history_shown = 0
+                new_count = history.appended
+            new_count = min(new_count, len(history))
+            
             self.history_text.configure(state='normal')
-            self.history_text.delete(1.0, tk.END)
+            if self.history_shown == 0:
+                self.history_text.delete(1.0, tk.END)
             
-            for entry in reversed(history):
-                self.history_text.insert(tk.END, entry + "\n")
+            # Newest entries are shown first
+            for entry in self.calc.get_history(new_count):
+                self.history_text.insert(1.0, entry + "\n")
             
+            # Drop lines that have fallen out of the history buffer
+            self.history_text.delete(f"{len(history) + 1}.0", tk.END)
             self.history_text.configure(state='disabled')
-            self.history_text.see(tk.END)
+            self.history_shown = history.appended
         
         def on_key_press(self, event):
             """Handle keyboard input"""
@@ -680,13 +2048,68 @@ if GUI_AVAILABLE:
                 self.clear_all()
             elif key.lower() == 'c':
                 self.clear_all()
+    
+    return GraphicalCalculator
+
+
+def __getattr__(name):
+    # Module attribute access to GraphicalCalculator defines it on demand
+    if name == "GraphicalCalculator" and GUI_AVAILABLE:
+        return load_gui()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # ============================================================================
 # Part 4: Main Application Controller
 # ============================================================================
 
-def main():
+def parse_arguments(argv: Optional[List[str]] = None) -> "argparse.Namespace":
+    """Parse command-line options"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Python Calculator Application")
+    parser.add_argument("--batch", nargs="?", const="-", metavar="FILE",
+                        help="evaluate one expression per line from FILE (or stdin) without prompts")
+    parser.add_argument("-o", "--output", metavar="FILE",
+                        help="write batch results to FILE instead of stdout")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="number of worker processes for batch mode")
+    parser.add_argument("--chunk-size", type=int, default=1000,
+                        help="lines per worker task in batch mode")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default="float",
+                        help="number type used for calculations")
+    parser.add_argument("--history-file", default=DEFAULT_HISTORY_PATH, metavar="FILE",
+                        help="persistent history log shared by the CLI and GUI "
+                             "(default: $CALCULATOR_HISTORY or ~/.calculator_history.bin)")
+    parser.add_argument("--no-history", dest="history_file", action="store_const", const=None,
+                        help="keep history in memory only")
+    parser.add_argument("--metrics", metavar="FILE",
+                        help="write batch-mode timing metrics to FILE ('-' for stderr)")
+    parser.add_argument("--metrics-format", choices=["json", "prometheus"], default="json",
+                        help="format of --metrics output")
+    parser.add_argument("--cache-budget", type=int, metavar="BYTES",
+                        help="memoize factorial, power and log within BYTES of memory")
+    parser.add_argument("--cache-warm", metavar="FILE",
+                        help="pre-compute cached results listed in FILE at startup")
+    return parser.parse_args(argv)
+
+
+def make_cache(args) -> Optional[MemoCache]:
+    """Memoizing cache requested on the command line, if any"""
+    if args.cache_budget is None and args.cache_warm is None:
+        return None
+    if args.cache_budget is None:
+        return MemoCache()
+    return MemoCache(args.cache_budget)
+
+
+def main(argv: Optional[List[str]] = None):
     """Main function to run the calculator application"""
+    args = parse_arguments(argv)
+    if args.batch is not None:
+        run_batch_file(args.batch, args.output, args.workers, args.chunk_size, args.backend,
+                       args.metrics, args.metrics_format)
+        return 0
+    
     print("="*60)
     print("PYTHON CALCULATOR APPLICATION")
     print("="*60)
@@ -716,14 +2139,19 @@ def main():
             
             if choice == '1':
                 # Run CLI calculator
-                cli_calc = CommandLineCalculator()
+                cli_calc = CommandLineCalculator(args.history_file, args.backend, make_cache(args))
+                if args.cache_warm:
+                    cli_calc.calc.warm_cache(args.cache_warm)
                 cli_calc.run()
                 break
             
             elif choice == '2' and GUI_AVAILABLE:
                 # Run GUI calculator
+                gui_class = load_gui()
                 root = tk.Tk()
-                app = GraphicalCalculator(root)
+                app = gui_class(root, args.history_file, args.backend, make_cache(args))
+                if args.cache_warm:
+                    app.calc.warm_cache(args.cache_warm)
                 root.mainloop()
                 break
             
@@ -743,55 +2171,1947 @@ def main():
             break
 
 # ============================================================================
-# Part 5: Expression Parser (Advanced Feature)
+# Part 5: Expression Compiler
+# ============================================================================
+
+class ExprNode(NamedTuple):
+    """Immutable expression tree node (equal sub-trees compare and hash equal)"""
+    kind: str           # 'num', 'const', 'var', 'value', 'unary', 'binary', 'call', 'matrix', 'unit', 'convert'
+    value: Any          # literal text, constant/variable/function name, folded number, operator,
+                        # shape or unit terms
+    children: tuple = ()
+
+
+_TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<num>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<name>[A-Za-z_][A-Za-z_0-9]*)
+  | (?P<op>\*\*|[-+*/^!%²³√π(),×÷−@\[\];])
+""", re.VERBOSE)
+
+# Display symbols used by the GUI, normalised while tokenizing
+_SYMBOL_ALIASES = {"**": "^", "×": "*", "÷": "/", "−": "-"}
+
+# Constants and functions understood by the compiler (trig works in degrees,
+# log is base 10, matching the original parse_expression behaviour)
+_CONSTANTS = {"π": "pi", "e": "e"}
+_FUNCTIONS = {"sin": 1, "cos": 1, "tan": 1, "log": 1, "ln": 1, "sqrt": 1,
+              "det": 1, "transpose": 1, "solve": 2}
+
+# Binding powers for the Pratt parser
+_INFIX_POWER = {"+": 10, "-": 10, "*": 20, "/": 20, "@": 20, "^": 40}
+_PREFIX_POWER = 30
+_SQRT_POWER = 45
+_POSTFIX_POWER = 50
+
+_POSTFIX_OPERATORS = {
+    "!": lambda node: ExprNode("call", "fact", (node,)),
+    "%": lambda node: ExprNode("call", "percent", (node,)),
+    "²": lambda node: ExprNode("binary", "^", (node, ExprNode("num", "2"))),
+    "³": lambda node: ExprNode("binary", "^", (node, ExprNode("num", "3"))),
+}
+
+
+def tokenize(expr: str, start: int = 0, ends: Optional[list] = None) -> List[Tuple[str, str, int]]:
+    """Split an expression into (kind, text, position) tokens
+    
+    Scanning begins at start; if ends is given, the end position of each
+    token is appended to it (used to re-tokenize only the edited tail).
+    """
+    tokens = []
+    pos = start
+    length = len(expr)
+    match = _TOKEN_PATTERN.match
+    while pos < length:
+        m = match(expr, pos)
+        if not m:
+            raise ValueError("Invalid characters in expression")
+        kind = m.lastgroup
+        if kind != "space":
+            text = m.group()
+            text = _SYMBOL_ALIASES.get(text, text)
+            tokens.append((kind, text, pos))
+            if ends is not None:
+                ends.append(m.end())
+        pos = m.end()
+    return tokens
+
+
+class _Parser:
+    """Pratt parser turning a token list into an ExprNode tree"""
+
+    def __init__(self, tokens: List[Tuple[str, str, int]]):
+        self.tokens = tokens
+        self.index = 0
+
+    def peek(self) -> Optional[Tuple[str, str, int]]:
+        if self.index < len(self.tokens):
+            return self.tokens[self.index]
+        return None
+
+    def advance(self) -> Tuple[str, str, int]:
+        token = self.peek()
+        if token is None:
+            raise ValueError("Unexpected end of expression")
+        self.index += 1
+        return token
+
+    def expect(self, text: str):
+        token = self.advance()
+        if token[1] != text:
+            raise ValueError(f"Expected '{text}' at position {token[2]}, got '{token[1]}'")
+
+    def parse(self) -> ExprNode:
+        node = self.expression(0)
+        token = self.peek()
+        if token is not None and token[:2] == ("name", "to"):
+            self.index += 1
+            if not _is_unit(self.peek()):
+                raise ValueError(f"Expected a unit after 'to' at position {token[2]}")
+            node = ExprNode("convert", self.units(), (node,))
+            token = self.peek()
+        if token is not None:
+            raise ValueError(f"Unexpected '{token[1]}' at position {token[2]}")
+        return node
+
+    def expression(self, rbp: int) -> ExprNode:
+        left = self.prefix(self.advance())
+        while True:
+            token = self.peek()
+            if token is None:
+                break
+            text = token[1]
+            if text in _POSTFIX_OPERATORS:
+                if _POSTFIX_POWER <= rbp:
+                    break
+                self.index += 1
+                left = _POSTFIX_OPERATORS[text](left)
+                continue
+            lbp = _INFIX_POWER.get(text) if token[0] == "op" else None
+            if lbp is None or lbp <= rbp:
+                break
+            self.index += 1
+            # Power is right-associative, everything else left-associative
+            right = self.expression(lbp - 1 if text == "^" else lbp)
+            left = ExprNode("binary", text, (left, right))
+        return left
+
+    def prefix(self, token: Tuple[str, str, int]) -> ExprNode:
+        kind, text, pos = token
+        if kind == "num":
+            node = ExprNode("num", text)
+            if _is_unit(self.peek()):
+                node = ExprNode("unit", self.units(), (node,))
+            return node
+        if text in _CONSTANTS:
+            return ExprNode("const", _CONSTANTS[text])
+        if text in ("-", "+"):
+            return ExprNode("unary", text, (self.expression(_PREFIX_POWER),))
+        if text == "√":
+            return ExprNode("call", "sqrt", (self.expression(_SQRT_POWER),))
+        if text == "(":
+            node = self.expression(0)
+            self.expect(")")
+            if _is_unit(self.peek()):
+                node = ExprNode("unit", self.units(), (node,))
+            return node
+        if text == "[":
+            return self.matrix(pos)
+        if kind == "name":
+            if text not in _FUNCTIONS:
+                following = self.peek()
+                if following is not None and following[1] == "(":
+                    raise ValueError(f"Unknown function '{text}' at position {pos}")
+                if text.startswith("_") or keyword.iskeyword(text):
+                    raise ValueError(f"Invalid variable name '{text}' at position {pos}")
+                node = ExprNode("var", text)
+                if _is_unit(following):
+                    node = ExprNode("unit", self.units(), (node,))
+                return node
+            self.expect("(")
+            args = [self.expression(0)]
+            while self.peek() is not None and self.peek()[1] == ",":
+                self.index += 1
+                args.append(self.expression(0))
+            self.expect(")")
+            if len(args) != _FUNCTIONS[text]:
+                raise ValueError(f"{text}() takes {_FUNCTIONS[text]} argument(s), got {len(args)}")
+            return ExprNode("call", text, tuple(args))
+        raise ValueError(f"Unexpected '{text}' at position {pos}")
+
+    def units(self) -> Tuple[Tuple[str, int], ...]:
+        """Unit suffix such as km, km/h or kg*m/s^2 as (name, exponent) terms"""
+        terms = []
+        sign = 1
+        while True:
+            name = self.advance()[1]
+            exponent = 1
+            token = self.peek()
+            if token is not None and token[1] in ("²", "³"):
+                self.index += 1
+                exponent = 2 if token[1] == "²" else 3
+            elif token is not None and token[1] == "^":
+                self.index += 1
+                negative = self.peek() is not None and self.peek()[1] == "-"
+                if negative:
+                    self.index += 1
+                kind, text, pos = self.advance()
+                if kind != "num" or not text.isdigit():
+                    raise ValueError(f"Unit exponent must be an integer at position {pos}")
+                exponent = -int(text) if negative else int(text)
+            terms.append((name, sign * exponent))
+            # Only continue through * or / when another unit follows
+            token = self.peek()
+            following = self.tokens[self.index + 1] if self.index + 1 < len(self.tokens) else None
+            if token is None or token[1] not in ("*", "/") or not _is_unit(following):
+                return tuple(terms)
+            sign = -1 if token[1] == "/" else 1
+            self.index += 1
+
+    def matrix(self, pos: int) -> ExprNode:
+        """Matrix literal after '[': [1, 2, 3], [1, 2; 3, 4] or [[1, 2], [3, 4]]"""
+        rows = [[self.expression(0)]]
+        while True:
+            token = self.advance()
+            if token[1] == ",":
+                rows[-1].append(self.expression(0))
+            elif token[1] == ";":
+                rows.append([self.expression(0)])
+            elif token[1] == "]":
+                break
+            else:
+                raise ValueError(f"Expected ',', ';' or ']' at position {token[2]}, got '{token[1]}'")
+        if len(rows) == 1 and all(node.kind == "matrix" and len(node.value) == 1 for node in rows[0]):
+            rows = [list(node.children) for node in rows[0]]
+        if any(len(row) != len(rows[0]) for row in rows):
+            raise ValueError(f"Matrix rows must have the same length (at position {pos})")
+        shape = (len(rows[0]),) if len(rows) == 1 else (len(rows), len(rows[0]))
+        return ExprNode("matrix", shape, tuple(node for row in rows for node in row))
+
+
+def parse(expr: str) -> ExprNode:
+    """Parse an expression string into an ExprNode tree"""
+    expr = expr.strip()
+    if not expr:
+        raise ValueError("Empty expression")
+    instrumentation = _INSTRUMENTATION
+    if instrumentation is None:
+        return _Parser(tokenize(expr)).parse()
+    tokens = instrumentation.measure("expression.tokenize", tokenize, expr)
+    return instrumentation.measure("expression.parse", _Parser(tokens).parse)
+
+
+# ----------------------------------------------------------------------------
+# Units
+# ----------------------------------------------------------------------------
+
+# Dimensions are exponent tuples over the SI base quantities
+_BASE_DIMENSIONS = ("m", "kg", "s", "A", "K", "mol", "cd")
+_DIMENSIONLESS = (0,) * len(_BASE_DIMENSIONS)
+
+
+def _dimension(**exponents) -> Tuple[int, ...]:
+    return tuple(exponents.get(name, 0) for name in _BASE_DIMENSIONS)
+
+
+# Units whose size is given directly in SI base units: name -> (factor, dimension)
+_UNIT_ROOTS = {
+    "m": ("1", _dimension(m=1)),
+    "kg": ("1", _dimension(kg=1)),
+    "s": ("1", _dimension(s=1)),
+    "A": ("1", _dimension(A=1)),
+    "K": ("1", _dimension(K=1)),
+    "mol": ("1", _dimension(mol=1)),
+    "cd": ("1", _dimension(cd=1)),
+    "N": ("1", _dimension(kg=1, m=1, s=-2)),
+    "J": ("1", _dimension(kg=1, m=2, s=-2)),
+    "W": ("1", _dimension(kg=1, m=2, s=-3)),
+    "Pa": ("1", _dimension(kg=1, m=-1, s=-2)),
+    "Hz": ("1", _dimension(s=-1)),
+    "V": ("1", _dimension(kg=1, m=2, s=-3, A=-1)),
+    "ohm": ("1", _dimension(kg=1, m=2, s=-3, A=-2)),
+    "L": ("0.001", _dimension(m=3)),
+    "mph": ("0.44704", _dimension(m=1, s=-1)),
+}
+
+# Conversion graph edges: 1 unit = factor * target
+_UNIT_EDGES = [
+    ("g", "0.001", "kg"), ("t", "1000", "kg"), ("lb", "0.45359237", "kg"), ("oz", "1/16", "lb"),
+    ("in", "0.0254", "m"), ("ft", "12", "in"), ("yd", "3", "ft"), ("mi", "5280", "ft"),
+    ("nmi", "1852", "m"), ("min", "60", "s"), ("h", "60", "min"), ("day", "24", "h"),
+    ("week", "7", "day"), ("bar", "100000", "Pa"), ("atm", "101325", "Pa"),
+    ("psi", "6894.757293168361", "Pa"), ("cal", "4.184", "J"), ("Wh", "3600", "J"),
+    ("hp", "745.69987158227022", "W"),
+]
+
+_UNIT_PREFIXES = {"G": "1000000000", "M": "1000000", "k": "1000", "c": "1/100",
+                  "m": "1/1000", "u": "1/1000000", "n": "1/1000000000"}
+_PREFIXED_UNITS = ("m", "g", "s", "L", "N", "J", "W", "Pa", "Hz", "V", "A", "mol", "Wh", "cal")
+
+# Preferred names for result dimensions (anything else is spelt in base units)
+_DISPLAY_UNITS = ("m", "kg", "s", "A", "K", "mol", "cd", "N", "J", "W", "Pa", "V", "ohm")
+
+
+@lru_cache(maxsize=None)
+def _unit_table() -> MappingProxyType:
+    """Every unit resolved to (SI factor, dimension) by walking the conversion graph once"""
+    edges = {name: (Fraction(factor), target) for name, factor, target in _UNIT_EDGES}
+    for prefix, scale in _UNIT_PREFIXES.items():
+        for unit in _PREFIXED_UNITS:
+            name = prefix + unit
+            if prefix == "c" and unit not in ("m", "L"):
+                continue
+            if name not in _UNIT_ROOTS and name not in edges and name != "kg":
+                edges[name] = (Fraction(scale), unit)
+    table = {name: (Fraction(factor), dimension) for name, (factor, dimension) in _UNIT_ROOTS.items()}
+    
+    def resolve(name):
+        if name not in table:
+            factor, target = edges[name]
+            target_factor, dimension = resolve(target)
+            table[name] = (factor * target_factor, dimension)
+        return table[name]
+    
+    for name in edges:
+        resolve(name)
+    return MappingProxyType(table)
+
+
+def _is_unit(token: Optional[Tuple[str, str, int]]) -> bool:
+    return token is not None and token[0] == "name" and token[1] in _unit_table()
+
+
+@lru_cache(maxsize=1024)
+def _resolve_units(terms: Tuple[Tuple[str, int], ...]) -> Tuple[Fraction, Tuple[int, ...]]:
+    """SI factor and dimension of a compound unit such as km/h or kg*m/s^2"""
+    table = _unit_table()
+    factor = Fraction(1)
+    dimension = _DIMENSIONLESS
+    for name, exponent in terms:
+        unit_factor, unit_dimension = table[name]
+        factor *= unit_factor ** exponent
+        dimension = tuple(d + u * exponent for d, u in zip(dimension, unit_dimension))
+    return factor, dimension
+
+
+def _format_units(terms: Tuple[Tuple[str, int], ...]) -> str:
+    numerator = [name if e == 1 else f"{name}^{e}" for name, e in terms if e > 0]
+    denominator = [name if e == -1 else f"{name}^{-e}" for name, e in terms if e < 0]
+    text = "*".join(numerator) or "1"
+    return text + "".join(f"/{part}" for part in denominator)
+
+
+def _format_dimension(dimension: Tuple[int, ...]) -> str:
+    table = _unit_table()
+    for name in _DISPLAY_UNITS:
+        if table[name][1] == dimension:
+            return name
+    return _format_units(tuple((name, e) for name, e in zip(_BASE_DIMENSIONS, dimension) if e))
+
+
+def _factor_node(node: ExprNode, factor: Fraction) -> ExprNode:
+    """node scaled by a conversion factor (folds to a single multiply)"""
+    if factor == 1:
+        return node
+    if factor.denominator == 1:
+        scale = ExprNode("num", str(factor.numerator))
+    else:
+        scale = ExprNode("binary", "/", (ExprNode("num", str(factor.numerator)),
+                                         ExprNode("num", str(factor.denominator))))
+    return ExprNode("binary", "*", (node, scale))
+
+
+def _constant_exponent(node: ExprNode) -> int:
+    try:
+        value = _interpret(node, BACKENDS["float"])
+    except (ValueError, ArithmeticError, TypeError):
+        value = None
+    if value is None or value != int(value):
+        raise ValueError("Quantities with units can only be raised to constant integer powers")
+    return int(value)
+
+
+def _check_units(node: ExprNode) -> Tuple[ExprNode, Tuple[int, ...]]:
+    """Replace unit literals by SI conversion factors, checking dimensions"""
+    kind, op, children = node
+    if kind == "unit":
+        child, dimension = _check_units(children[0])
+        factor, unit_dimension = _resolve_units(op)
+        return _factor_node(child, factor), tuple(map(operator.add, dimension, unit_dimension))
+    if not children:
+        return node, _DIMENSIONLESS
+    checked = [_check_units(child) for child in children]
+    node = ExprNode(kind, op, tuple(child for child, _ in checked))
+    dimensions = [dimension for _, dimension in checked]
+    
+    if kind == "unary":
+        return node, dimensions[0]
+    if kind == "matrix":
+        if any(dimension != dimensions[0] for dimension in dimensions):
+            raise ValueError("Matrix elements must all have the same units")
+        return node, dimensions[0]
+    if kind == "binary":
+        left, right = dimensions
+        if op in ("+", "-"):
+            if left != right:
+                verb = "add" if op == "+" else "subtract"
+                raise ValueError(f"Cannot {verb} {_format_dimension(left)} and {_format_dimension(right)}")
+            return node, left
+        if op in ("*", "@"):
+            return node, tuple(map(operator.add, left, right))
+        if op == "/":
+            return node, tuple(map(operator.sub, left, right))
+        if right != _DIMENSIONLESS:
+            raise ValueError("Exponents must be dimensionless")
+        if left == _DIMENSIONLESS:
+            return node, left
+        exponent = _constant_exponent(node.children[1])
+        return node, tuple(d * exponent for d in left)
+    if kind == "call":
+        if op == "sqrt":
+            if any(d % 2 for d in dimensions[0]):
+                raise ValueError(f"Cannot take the square root of {_format_dimension(dimensions[0])}")
+            return node, tuple(d // 2 for d in dimensions[0])
+        if op in ("percent", "transpose"):
+            return node, dimensions[0]
+        for dimension in dimensions:
+            if dimension != _DIMENSIONLESS:
+                raise ValueError(f"{op}() needs a dimensionless argument, got {_format_dimension(dimension)}")
+        return node, _DIMENSIONLESS
+    return node, _DIMENSIONLESS
+
+
+def _contains_units(node: ExprNode) -> bool:
+    return node.kind in ("unit", "convert") or any(_contains_units(child) for child in node.children)
+
+
+def resolve_units(tree: ExprNode) -> Tuple[ExprNode, Optional[str]]:
+    """Check the dimensions of a parsed tree and lower its units to SI factors
+    
+    Returns the unit-free tree and the unit of its result (None when the
+    result is dimensionless). A top-level 'to UNIT' conversion scales the
+    result into that unit. Mismatched dimensions raise ValueError here, at
+    compile time, rather than when the expression is evaluated.
+    """
+    target = None
+    if tree.kind == "convert":
+        target = tree.value
+        tree = tree.children[0]
+    tree, dimension = _check_units(tree)
+    if target is not None:
+        factor, target_dimension = _resolve_units(target)
+        if target_dimension != dimension:
+            raise ValueError(f"Cannot convert {_format_dimension(dimension)} to {_format_units(target)}")
+        return _factor_node(tree, 1 / factor), _format_units(target)
+    if dimension == _DIMENSIONLESS:
+        return tree, None
+    return tree, _format_dimension(dimension)
+
+
+class Quantity(NamedTuple):
+    """Result of an expression with units"""
+    value: Any
+    unit: str
+    
+    def __str__(self) -> str:
+        return f"{format_result(self.value)} {self.unit}"
+
+
+def _count_subtrees(node: ExprNode, counts: dict):
+    """Count occurrences of each non-leaf sub-tree (repeats are not descended into)"""
+    if not node.children:
+        return
+    seen = counts.get(node, 0)
+    counts[node] = seen + 1
+    if not seen:
+        for child in node.children:
+            _count_subtrees(child, counts)
+
+
+class _CodeGenerator:
+    """Emits Python source for an ExprNode tree
+    
+    Literals are hoisted into (deduplicated) constants and sub-trees that occur
+    more than once are computed once and reused through assignment expressions.
+    """
+
+    def __init__(self, backend: FloatBackend, tree: ExprNode):
+        self.backend = backend
+        self.constants = {}
+        self._constant_names = {}
+        self._temporaries = {}
+        self._counts = {}
+        _count_subtrees(tree, self._counts)
+
+    def _constant(self, value) -> str:
+        key = (type(value), value)
+        name = self._constant_names.get(key)
+        if name is None:
+            name = self._constant_names[key] = f"_k{len(self.constants)}"
+            self.constants[name] = value
+        return name
+
+    def emit(self, node: ExprNode) -> str:
+        if self._counts.get(node, 0) > 1:
+            name = self._temporaries.get(node)
+            if name is not None:
+                return name
+            name = self._temporaries[node] = f"_t{len(self._temporaries)}"
+            return f"({name} := {self._emit(node)})"
+        return self._emit(node)
+
+    def _emit(self, node: ExprNode) -> str:
+        kind = node.kind
+        if kind == "num":
+            return self._constant(self.backend.number(node.value))
+        if kind == "value":
+            return self._constant(node.value)
+        if kind in ("const", "var"):
+            return node.value
+        if kind == "unary":
+            return f"({node.value}{self.emit(node.children[0])})"
+        if kind == "binary":
+            left, right = node.children
+            if node.value == "^":
+                return f"_pow({self.emit(left)}, {self.emit(right)})"
+            return f"({self.emit(left)}{node.value}{self.emit(right)})"
+        if kind == "call":
+            args = ", ".join(self.emit(child) for child in node.children)
+            return f"{node.value}({args})"
+        if kind == "matrix":
+            values = "".join(f"{self.emit(child)}, " for child in node.children)
+            return f"_matrix({node.value!r}, ({values}))"
+        raise ValueError(f"Unknown node kind '{kind}'")
+
+
+def _is_number(node: ExprNode, number) -> bool:
+    return node.kind == "value" and node.value == number
+
+
+def _simplify(node: ExprNode) -> ExprNode:
+    """Remove identity operations such as x*1, x+0, x/1, x^1 and --x"""
+    kind, op, children = node
+    if kind == "unary":
+        child = children[0]
+        if op == "+":
+            return child
+        if child.kind == "unary" and child.value == "-":
+            return child.children[0]
+        return node
+    if kind != "binary":
+        return node
+    left, right = children
+    if op == "+":
+        if _is_number(left, 0):
+            return right
+        if _is_number(right, 0):
+            return left
+    elif op == "-":
+        if _is_number(right, 0):
+            return left
+        if _is_number(left, 0):
+            return ExprNode("unary", "-", (right,))
+    elif op == "*":
+        if _is_number(left, 1):
+            return right
+        if _is_number(right, 1):
+            return left
+    elif op in ("/", "^"):
+        if _is_number(right, 1):
+            return left
+    return node
+
+
+def _fold(node: ExprNode, backend: FloatBackend) -> ExprNode:
+    kind = node.kind
+    if kind in ("value", "var"):
+        return node
+    if kind in ("num", "const"):
+        return ExprNode("value", _interpret(node, backend))
+    children = tuple(_fold(child, backend) for child in node.children)
+    node = ExprNode(kind, node.value, children)
+    if all(child.kind == "value" for child in children):
+        try:
+            return ExprNode("value", _interpret(node, backend))
+        except Exception:
+            # Leave failing sub-trees (1/0, √-1, ...) to raise at evaluation time
+            return node
+    return _simplify(node)
+
+
+def optimize(tree: ExprNode, backend=None) -> ExprNode:
+    """Fold constant sub-trees and remove identity operations"""
+    backend = get_backend(backend)
+    if backend.context is not None:
+        with decimal.localcontext(backend.context):
+            return _fold(tree, backend)
+    return _fold(tree, backend)
+
+
+_BINARY_OPERATORS = {
+    "+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv,
+    "@": operator.matmul,
+}
+_UNARY_OPERATORS = {"-": operator.neg, "+": operator.pos}
+
+# Evaluations served by the tree interpreter before code is generated; most
+# one-off expressions never pay for compile()
+_COMPILE_THRESHOLD = 2
+
+
+def _interpret(node: ExprNode, backend: FloatBackend, env: Optional[dict] = None):
+    """Evaluate a tree directly (cheaper than code generation for one-off use)"""
+    kind = node.kind
+    if kind == "num":
+        return backend.number(node.value)
+    if kind == "value":
+        return node.value
+    if kind == "var":
+        try:
+            return env[node.value]
+        except (KeyError, TypeError):
+            raise ValueError(f"No value for variable '{node.value}'")
+    if kind == "const":
+        return backend.namespace[node.value]
+    if kind == "binary":
+        left, right = node.children
+        left, right = _interpret(left, backend, env), _interpret(right, backend, env)
+        if node.value == "^":
+            return backend.power(left, right)
+        return _BINARY_OPERATORS[node.value](left, right)
+    if kind == "unary":
+        return _UNARY_OPERATORS[node.value](_interpret(node.children[0], backend, env))
+    if kind == "call":
+        return backend.namespace[node.value](*[_interpret(child, backend, env) for child in node.children])
+    if kind == "matrix":
+        return backend.matrix(node.value, [_interpret(child, backend, env) for child in node.children])
+    raise ValueError(f"Unknown node kind '{kind}'")
+
+
+def _collect_variables(node: ExprNode, names: dict):
+    if node.kind == "var":
+        names.setdefault(node.value, None)
+    for child in node.children:
+        _collect_variables(child, names)
+
+
+_VECTOR_NAMESPACE = None
+
+_MATRIX_FUNCTIONS = frozenset({"det", "transpose", "solve"})
+
+
+def _contains_matrices(node: ExprNode) -> bool:
+    if node.kind == "matrix" or (node.kind == "call" and node.value in _MATRIX_FUNCTIONS) \
+            or (node.kind == "binary" and node.value == "@"):
+        return True
+    return any(_contains_matrices(child) for child in node.children)
+
+
+def _vector_factorial(a):
+    """Factorial over an array; negative or non-integer points are nan, as evaluate() rejects them"""
+    a = np.asarray(a, dtype=float)
+    return np.where((a < 0) | (a != np.trunc(a)), np.nan, _batch_factorial(a))
+
+
+def _vector_namespace() -> MappingProxyType:
+    """NumPy namespace for evaluating generated code over whole arrays"""
+    global _VECTOR_NAMESPACE
+    if _VECTOR_NAMESPACE is None:
+        _load_numpy()
+        _VECTOR_NAMESPACE = MappingProxyType({
+            "__builtins__": {},
+            "pi": math.pi,
+            "e": math.e,
+            "sin": lambda a: np.sin(np.radians(a)),
+            "cos": lambda a: np.cos(np.radians(a)),
+            "tan": lambda a: np.tan(np.radians(a)),
+            "log": np.log10,
+            "ln": np.log,
+            "sqrt": np.sqrt,
+            "fact": _vector_factorial,
+            "percent": lambda a: a / 100,
+            "_pow": np.power,
+        })
+    return _VECTOR_NAMESPACE
+
+
+class CompiledExpression:
+    """An expression compiled once into a Python code object and reusable closure
+    
+    The first evaluations walk the tree; once an expression is reused it is
+    compiled to a code object so further calls run at native-lambda speed.
+    Literals are converted by the backend, so the same tree can be evaluated
+    with floats, Decimals or Fractions. Variables (in order of first use)
+    become the parameters of the compiled function: f(1, 2) or f(x=1, y=2).
+    """
+
+    def __init__(self, text: str, tree: ExprNode, backend: Optional[FloatBackend] = None,
+                 variables: Optional[Tuple[str, ...]] = None):
+        self.text = text
+        self.tree = tree
+        self.backend = get_backend(backend)
+        if variables is None:
+            names = {}
+            _collect_variables(tree, names)
+            variables = tuple(names)
+        self.variables = variables
+        self.unit = None    # unit of the result for expressions with unit literals
+        self._derivatives = {}
+        self._function = None
+        self._vector_function = None
+        self._source = None
+        self._constants = None
+        self._calls = 0
+
+    @property
+    def source(self) -> str:
+        """Generated Python source for the expression"""
+        if self._source is None:
+            self._generate()
+        return self._source
+
+    def _generate(self):
+        if _INSTRUMENTATION is not None:
+            return _INSTRUMENTATION.measure("expression.codegen", self._generate_code)
+        return self._generate_code()
+
+    def _generate_code(self):
+        tree = optimize(self.tree, self.backend)
+        generator = _CodeGenerator(self.backend, tree)
+        self._source = generator.emit(tree)
+        self._constants = generator.constants
+        self._function = self._build(self.backend.namespace)
+        return self._function
+
+    def _build(self, base_namespace: dict):
+        namespace = dict(base_namespace)
+        namespace.update(self._constants)
+        code = compile(f"lambda {', '.join(self.variables)}: {self._source}", "<expression>", "eval")
+        return eval(code, namespace)
+
+    def _evaluate(self, args, kwargs):
+        function = self._function
+        if function is None:
+            self._calls += 1
+            if self._calls < _COMPILE_THRESHOLD:
+                env = dict(zip(self.variables, args))
+                if kwargs:
+                    env.update(kwargs)
+                return _interpret(self.tree, self.backend, env)
+            function = self._generate()
+        return function(*args, **kwargs)
+
+    def __call__(self, *args, **kwargs) -> float:
+        if self.backend.context is not None:
+            with decimal.localcontext(self.backend.context):
+                return self._evaluate(args, kwargs)
+        return self._evaluate(args, kwargs)
+
+    @cached_property
+    def vectorizable(self) -> bool:
+        """Whether vectorized() can evaluate this expression (NumPy, float backend, no matrices)"""
+        return NUMPY_AVAILABLE and self.backend.name == "float" and not _contains_matrices(self.tree)
+
+    def vectorized(self):
+        """The compiled function evaluated with NumPy ufuncs over whole arrays
+        
+        Only available for the float backend and expressions without
+        matrices; invalid points give nan/inf instead of raising.
+        """
+        if not NUMPY_AVAILABLE:
+            raise ImportError("Vectorized evaluation requires numpy")
+        if self.backend.name != "float":
+            raise ValueError("Vectorized evaluation is only available for the float backend")
+        if not self.vectorizable:
+            raise ValueError("Matrix expressions cannot be vectorized")
+        if self._vector_function is None:
+            if self._source is None:
+                self._generate()
+            self._vector_function = self._build(_vector_namespace())
+        return self._vector_function
+
+    def derivative(self, variable: Optional[str] = None) -> "CompiledExpression":
+        """Symbolic derivative with respect to a variable, compiled and cached
+        
+        The derivative takes the same parameters as this expression, so both
+        can be called with the same arguments.
+        """
+        if variable is None:
+            if len(self.variables) != 1:
+                raise ValueError("Specify which variable to differentiate by")
+            variable = self.variables[0]
+        compiled = self._derivatives.get(variable)
+        if compiled is None:
+            tree = optimize(differentiate(self.tree, variable), self.backend)
+            compiled = CompiledExpression(format_tree(tree), tree, self.backend, self.variables)
+            self._derivatives[variable] = compiled
+        return compiled
+
+    def __repr__(self) -> str:
+        return f"CompiledExpression({self.text!r})"
+
+
+@lru_cache(maxsize=4096)
+def _compile_cached(expr: str, backend: FloatBackend) -> CompiledExpression:
+    tree = parse(expr)
+    if _INSTRUMENTATION is not None:
+        return _INSTRUMENTATION.measure("expression.compile", _build_compiled, expr, tree, backend)
+    return _build_compiled(expr, tree, backend)
+
+
+def _build_compiled(expr: str, tree: ExprNode, backend: FloatBackend) -> CompiledExpression:
+    unit = None
+    if _contains_units(tree):
+        tree, unit = resolve_units(tree)
+    compiled = CompiledExpression(expr, tree, backend)
+    compiled.unit = unit
+    return compiled
+
+
+def _with_unit(compiled: CompiledExpression, value):
+    """value as a Quantity in the expression's result unit, if it has one"""
+    return value if compiled.unit is None else Quantity(value, compiled.unit)
+
+
+def compile_expression(expr: str, backend=None) -> CompiledExpression:
+    """Compile an expression, reusing the cached result for repeated text"""
+    return _compile_cached(expr, get_backend(backend))
+
+
+def evaluate(expr: str, backend=None, variables: Optional[dict] = None):
+    """Evaluate an expression through the shared compiled-expression cache
+    
+    This is the single evaluation path used by ExpressionParser, the CLI, the
+    GUI and batch mode. Any failure is raised as ValueError.
+    """
+    compiled = compile_expression(expr, backend)
+    
+    values = {}
+    if compiled.variables:
+        variables = variables or {}
+        missing = [name for name in compiled.variables if name not in variables]
+        if missing:
+            raise ValueError(f"No value for variable(s): {', '.join(missing)}")
+        number = compiled.backend.number
+        values = {name: number(variables[name]) for name in compiled.variables}
+    
+    try:
+        if _INSTRUMENTATION is None:
+            result = compiled(**values)
+        else:
+            result = _INSTRUMENTATION.measure("expression.evaluate", compiled, **values)
+    except ZeroDivisionError:
+        raise ValueError("Error evaluating expression: division by zero")
+    except Exception as e:
+        raise ValueError(f"Error evaluating expression: {str(e)}")
+    return _with_unit(compiled, result)
+
+
+def sweep(expr, values: dict, backend=None, chunk_size: int = 65536):
+    """Evaluate an expression over the Cartesian product of variable values
+    
+    values maps each variable to a sequence (list, range, array) of values.
+    Yields results in row-major order (the last variable varies fastest) in
+    chunks of up to chunk_size points: NumPy arrays from the vectorized path
+    when NumPy is available and the backend is float, lists otherwise.
+    Points where the expression is undefined evaluate to nan. Both paths give
+    the same values: elements the NumPy call leaves non-finite are re-run as
+    scalars, and a chunk holding an exact result beyond the float range
+    (x! for x >= 171) becomes an object array. Expressions with units yield
+    each chunk as a Quantity.
+    """
+    compiled = expr if isinstance(expr, CompiledExpression) else compile_expression(expr, backend)
+    missing = [name for name in compiled.variables if name not in values]
+    if missing:
+        raise ValueError(f"No value for variable(s): {', '.join(missing)}")
+    axes = [values[name] for name in compiled.variables]
+    
+    if compiled.vectorizable:
+        _load_numpy()
+        function = compiled.vectorized()
+        axes = [np.asarray(axis, dtype=float).ravel() for axis in axes]
+        shape = tuple(len(axis) for axis in axes)
+        total = int(np.prod(shape)) if shape else 1
+        for start in range(0, total, chunk_size):
+            flat = np.arange(start, min(start + chunk_size, total))
+            indices = np.unravel_index(flat, shape) if shape else ()
+            columns = [axis[index] for axis, index in zip(axes, indices)]
+            with np.errstate(all="ignore"):
+                result = np.array(np.broadcast_to(np.asarray(function(*columns), dtype=float), flat.shape))
+            for i in np.flatnonzero(~np.isfinite(result)).tolist():
+                try:
+                    value = compiled(*[float(column[i]) for column in columns])
+                except (ValueError, ArithmeticError):
+                    value = math.nan
+                try:
+                    result[i] = value
+                except (OverflowError, TypeError):
+                    result = result.astype(object)
+                    result[i] = value
+            yield _with_unit(compiled, result)
+        return
+    
+    points = itertools.product(*[list(axis) for axis in axes])
+    number = compiled.backend.number
+    while True:
+        chunk = list(itertools.islice(points, chunk_size))
+        if not chunk:
+            return
+        results = []
+        for point in chunk:
+            try:
+                results.append(compiled(*[number(value) for value in point]))
+            except (ValueError, ArithmeticError):
+                results.append(math.nan)
+        yield _with_unit(compiled, results)
+
+
+# Tokens after which an expression cannot end; dropped when previewing
+_DANGLING_TOKENS = frozenset("+-*/^@(,;[√") | {"to"}
+_CLOSING = {"(": ")", "[": "]"}
+# Op tokens after which + or - is binary: closing brackets, postfix
+# operators and constants such as π
+_OPERAND_ENDINGS = frozenset(_CLOSING.values()) | set(_POSTFIX_OPERATORS) | set(_CONSTANTS)
+
+
+class LivePreview:
+    """Running result of an expression that is still being typed
+    
+    Tokens before the edit point are kept between updates and only the edited
+    tail is re-tokenized. The value of everything before the last top-level
+    + or - is cached, so typing into the final term only parses and evaluates
+    that term. Incomplete input is previewed by dropping trailing operators
+    and closing open brackets. Exact powers and factorials are limited to
+    MAX_EXACT_BITS bits here, so a preview never holds up typing.
+    """
+    
+    MAX_EXACT_BITS = 1 << 15    # about 10,000 digits
+    
+    def __init__(self, backend=None):
+        self.backend = get_backend(backend)
+        self.text = ""
+        self.tokens = []
+        self.ends = []
+        self._prefix = None
+        self._prefix_value = None
+    
+    def _retokenize(self, text: str):
+        common = len(os.path.commonprefix([self.text, text]))
+        # Tokens ending near the edit point may change: "12" -> "123", and a
+        # number can absorb up to two following characters ("1e+" -> "1e+5")
+        keep = 0
+        while keep < len(self.ends) and self.ends[keep] < common - 2:
+            keep += 1
+        del self.tokens[keep:], self.ends[keep:]
+        start = self.ends[-1] if self.ends else 0
+        self.text = text
+        try:
+            self.tokens += tokenize(text, start, self.ends)
+        except ValueError:
+            # Keep the valid prefix so the next edit can still reuse it
+            self.text = text[:start]
+            raise
+    
+    def _complete(self) -> list:
+        """Tokens trimmed and closed into the longest complete expression"""
+        tokens = list(self.tokens)
+        while tokens and (tokens[-1][1] in _DANGLING_TOKENS or tokens[-1][1] in _FUNCTIONS):
+            tokens.pop()
+        opened = []
+        for _, text, _ in tokens:
+            if text in _CLOSING:
+                opened.append(_CLOSING[text])
+            elif opened and text == opened[-1]:
+                opened.pop()
+        end = len(self.text)
+        return tokens + [("op", closing, end) for closing in reversed(opened)]
+    
+    def _evaluate(self, tokens: list):
+        tree = _Parser(tokens).parse()
+        unit = None
+        if _contains_units(tree):
+            tree, unit = resolve_units(tree)
+        if self.backend.context is not None:
+            with decimal.localcontext(self.backend.context):
+                value = _interpret(tree, self.backend)
+        else:
+            value = _interpret(tree, self.backend)
+        return value if unit is None else Quantity(value, unit)
+    
+    @staticmethod
+    def _split(tokens: list) -> int:
+        """Index of the last top-level binary + or -, or 0 if there is none"""
+        depth = 0
+        split = 0
+        for index, (kind, text, _) in enumerate(tokens):
+            if text in _CLOSING:
+                depth += 1
+            elif text in (")", "]"):
+                depth -= 1
+            elif text == "to":
+                return 0
+            elif depth == 0 and text in ("+", "-") and index > 0:
+                previous_kind, previous, _ = tokens[index - 1]
+                if previous_kind in ("num", "name") or previous in _OPERAND_ENDINGS:
+                    split = index
+        return split
+    
+    def update(self, text: str):
+        """Preview value for the current text, or None if it cannot be evaluated yet"""
+        limit = _exact_bits_limit.set(self.MAX_EXACT_BITS)
+        try:
+            if text != self.text:
+                self._retokenize(text)
+            tokens = self._complete()
+            if not tokens:
+                return None
+            split = self._split(tokens)
+            if split:
+                prefix = self.text[:tokens[split][2]]
+                if prefix != self._prefix:
+                    self._prefix, self._prefix_value = prefix, self._evaluate(tokens[:split])
+                left = self._prefix_value
+                right = self._evaluate(tokens[split + 1:])
+                if not isinstance(left, Quantity) and not isinstance(right, Quantity):
+                    if self.backend.context is not None:
+                        with decimal.localcontext(self.backend.context):
+                            return left + right if tokens[split][1] == "+" else left - right
+                    return left + right if tokens[split][1] == "+" else left - right
+            return self._evaluate(tokens)
+        except Exception:
+            return None
+        finally:
+            _exact_bits_limit.reset(limit)
+
+# ============================================================================
+# Part 6: Calculus (Derivatives, Roots, Integrals and Series)
+# ============================================================================
+
+_ZERO = ExprNode("num", "0")
+_ONE = ExprNode("num", "1")
+# d/dx sin(x°) = cos(x°)·π/180, since trig functions work in degrees
+_DEGREE = ExprNode("binary", "/", (ExprNode("const", "pi"), ExprNode("num", "180")))
+
+
+def _depends_on(node: ExprNode, variable: str) -> bool:
+    if node.kind == "var":
+        return node.value == variable
+    return any(_depends_on(child, variable) for child in node.children)
+
+
+def _is_zero(node: ExprNode) -> bool:
+    return (node.kind == "num" and float(node.value) == 0) or _is_number(node, 0)
+
+
+def _add(left: ExprNode, right: ExprNode) -> ExprNode:
+    if _is_zero(left):
+        return right
+    if _is_zero(right):
+        return left
+    return ExprNode("binary", "+", (left, right))
+
+
+def _sub(left: ExprNode, right: ExprNode) -> ExprNode:
+    if _is_zero(right):
+        return left
+    if _is_zero(left):
+        return ExprNode("unary", "-", (right,))
+    return ExprNode("binary", "-", (left, right))
+
+
+def _mul(left: ExprNode, right: ExprNode) -> ExprNode:
+    # Dropping 0*x terms keeps derivative trees small; the terms they remove
+    # could only ever contribute 0 (or nan where x itself is undefined)
+    if _is_zero(left) or _is_zero(right):
+        return _ZERO
+    return ExprNode("binary", "*", (left, right))
+
+
+def _div(left: ExprNode, right: ExprNode) -> ExprNode:
+    if _is_zero(left):
+        return _ZERO
+    return ExprNode("binary", "/", (left, right))
+
+
+def _call(name: str, arg: ExprNode) -> ExprNode:
+    return ExprNode("call", name, (arg,))
+
+
+def differentiate(node: ExprNode, variable: str) -> ExprNode:
+    """Symbolic derivative of an expression tree with respect to a variable"""
+    kind, op, children = node
+    if not _depends_on(node, variable):
+        return _ZERO
+    if kind == "matrix":
+        return ExprNode("matrix", op, tuple(differentiate(child, variable) for child in children))
+    if kind == "var":
+        return _ONE
+    if kind == "unary":
+        inner = differentiate(children[0], variable)
+        return _sub(_ZERO, inner) if op == "-" else inner
+    if kind == "binary":
+        f, g = children
+        df, dg = differentiate(f, variable), differentiate(g, variable)
+        if op == "+":
+            return _add(df, dg)
+        if op == "-":
+            return _sub(df, dg)
+        if op == "*":
+            return _add(_mul(df, g), _mul(f, dg))
+        if op == "/":
+            return _div(_sub(_mul(df, g), _mul(f, dg)), ExprNode("binary", "^", (g, ExprNode("num", "2"))))
+        # Power rule when the exponent is constant, exponential rule otherwise
+        if not _depends_on(g, variable):
+            power = ExprNode("binary", "^", (f, _sub(g, _ONE)))
+            return _mul(_mul(g, power), df)
+        return _mul(node, _add(_mul(dg, _call("ln", f)), _div(_mul(g, df), f)))
+    if kind == "call":
+        u = children[0]
+        du = differentiate(u, variable)
+        if op == "sin":
+            return _mul(_mul(_call("cos", u), _DEGREE), du)
+        if op == "cos":
+            return _sub(_ZERO, _mul(_mul(_call("sin", u), _DEGREE), du))
+        if op == "tan":
+            return _div(_mul(_DEGREE, du), ExprNode("binary", "^", (_call("cos", u), ExprNode("num", "2"))))
+        if op == "ln":
+            return _div(du, u)
+        if op == "log":
+            return _div(du, _mul(u, _call("ln", ExprNode("num", "10"))))
+        if op == "sqrt":
+            return _div(du, _mul(ExprNode("num", "2"), node))
+        if op == "percent":
+            return _div(du, ExprNode("num", "100"))
+        raise ValueError(f"Cannot differentiate {op}()")
+    raise ValueError(f"Unknown node kind '{kind}'")
+
+
+_CONSTANT_SYMBOLS = {name: symbol for symbol, name in _CONSTANTS.items()}
+_ATOM_POWER = 100
+
+
+def format_tree(node: ExprNode, required: int = 0) -> str:
+    """Expression text for a tree, with only the parentheses it needs"""
+    kind, op, children = node
+    if kind == "num":
+        text, power = op, _ATOM_POWER
+    elif kind == "value":
+        integral = isinstance(op, float) and op.is_integer() and abs(op) < 1e15
+        text = str(int(op)) if integral else str(op)
+        power = _PREFIX_POWER if text.startswith("-") else \
+            _INFIX_POWER["/"] if "/" in text else _ATOM_POWER
+    elif kind == "const":
+        text, power = _CONSTANT_SYMBOLS.get(op, op), _ATOM_POWER
+    elif kind == "var":
+        text, power = op, _ATOM_POWER
+    elif kind == "unary":
+        text, power = op + format_tree(children[0], _PREFIX_POWER), _PREFIX_POWER
+    elif kind == "binary":
+        power = _INFIX_POWER[op]
+        # Left-associative operators need the tighter binding on the right,
+        # power (right-associative) on the left
+        left_power, right_power = (power + 1, power) if op == "^" else (power, power + 1)
+        text = f"{format_tree(children[0], left_power)}{op}{format_tree(children[1], right_power)}"
+    elif kind in ("unit", "convert"):
+        if kind == "convert":
+            text, power = f"{format_tree(children[0])} to {_format_units(op)}", 0
+        else:
+            text, power = f"{format_tree(children[0], _POSTFIX_POWER + 1)} {_format_units(op)}", _POSTFIX_POWER
+    elif kind == "matrix":
+        values = [format_tree(child) for child in children]
+        cols = op[-1]
+        text = "[" + "; ".join(", ".join(values[i:i + cols]) for i in range(0, len(values), cols)) + "]"
+        power = _ATOM_POWER
+    elif op in ("fact", "percent"):
+        symbol = "!" if op == "fact" else "%"
+        text, power = format_tree(children[0], _ATOM_POWER) + symbol, _POSTFIX_POWER
+    else:
+        args = ", ".join(format_tree(child) for child in children)
+        text, power = f"{op}({args})", _ATOM_POWER
+    return f"({text})" if power < required else text
+
+
+def _solve_setup(expr, variable: Optional[str], variables: Optional[dict], backend,
+                 action: str = "solve for", constant_ok: bool = False):
+    """Resolve the compiled expression, the unknown and the fixed variable values
+    
+    With constant_ok, an expression that does not use the variable is
+    accepted (integrating or summing a constant is well defined).
+    """
+    compiled = expr if isinstance(expr, CompiledExpression) else compile_expression(expr, backend)
+    variables = variables or {}
+    free = [name for name in compiled.variables if name not in variables]
+    if variable is None and not free:
+        if not constant_ok:
+            raise ValueError(f"Expression has no variable to {action}")
+    elif variable is None:
+        if len(free) != 1:
+            raise ValueError(f"Specify which variable to {action}")
+        variable = free[0]
+    if variable not in compiled.variables and not constant_ok:
+        raise ValueError(f"Expression does not depend on '{variable}'")
+    missing = [name for name in free if name != variable]
+    if missing:
+        raise ValueError(f"No value for variable(s): {', '.join(missing)}")
+    fixed = {name: variables[name] for name in compiled.variables
+             if name != variable and name in variables}
+    return compiled, variable, fixed
+
+
+def _newton(function, derivative, x, tol, max_iterations: int):
+    """Newton iteration in the backend's number type; None if it does not converge"""
+    for _ in range(max_iterations):
+        fx = function(x)
+        if fx == 0:
+            return x
+        step = fx / derivative(x)
+        x = x - step
+        if abs(step) <= tol * (1 + abs(x)):
+            return x
+    return None
+
+
+def _brent(function, a: float, b: float, tol: float, max_iterations: int) -> float:
+    """Brent's method on a sign-changing bracket [a, b] (in floats)"""
+    fa, fb = function(a), function(b)
+    if fa == 0:
+        return a
+    if fb == 0:
+        return b
+    if (fa > 0) == (fb > 0):
+        raise ValueError("Bracket does not contain a sign change")
+    c, fc = a, fa
+    d = e = b - a
+    for _ in range(max_iterations):
+        if (fb > 0) == (fc > 0):
+            c, fc = a, fa
+            d = e = b - a
+        if abs(fc) < abs(fb):
+            a, b, c = b, c, b
+            fa, fb, fc = fb, fc, fb
+        tolerance = 2 * sys.float_info.epsilon * abs(b) + tol / 2
+        middle = (c - b) / 2
+        if abs(middle) <= tolerance or fb == 0:
+            return b
+        if abs(e) >= tolerance and abs(fa) > abs(fb):
+            # Inverse quadratic interpolation (secant when only two points differ)
+            s = fb / fa
+            if a == c:
+                p, q = 2 * middle * s, 1 - s
+            else:
+                q, r = fa / fc, fb / fc
+                p = s * (2 * middle * q * (q - r) - (b - a) * (r - 1))
+                q = (q - 1) * (r - 1) * (s - 1)
+            if p > 0:
+                q = -q
+            p = abs(p)
+            if 2 * p < min(3 * middle * q - abs(tolerance * q), abs(e * q)):
+                e, d = d, p / q
+            else:
+                d = e = middle
+        else:
+            d = e = middle
+        a, fa = b, fb
+        b += d if abs(d) > tolerance else math.copysign(tolerance, middle)
+        fb = function(b)
+    raise ValueError(f"Brent's method did not converge in {max_iterations} iterations")
+
+
+def solve(expr, variable: Optional[str] = None, start=1, bracket: Optional[Tuple[float, float]] = None,
+          variables: Optional[dict] = None, backend=None, tol: float = 1e-12,
+          max_iterations: int = 100):
+    """Find a root of f(variable) = 0
+    
+    With a bracket (a, b) where f changes sign, Brent's method is used and
+    always converges. Otherwise Newton's method runs from start using the
+    symbolic derivative. variables gives values for any other variables.
+    """
+    compiled, variable, fixed = _solve_setup(expr, variable, variables, backend)
+    number = compiled.backend.number
+    fixed = {name: number(value) for name, value in fixed.items()}
+    
+    def guarded(function):
+        def call(x):
+            try:
+                return function(**fixed, **{variable: x})
+            except ZeroDivisionError:
+                raise
+            except Exception as e:
+                raise ValueError(f"Error evaluating expression: {str(e)}") from None
+        return call
+    
+    if bracket is not None:
+        function = guarded(compiled)
+        try:
+            return _brent(lambda x: float(function(number(x))), float(bracket[0]), float(bracket[1]),
+                          tol, max_iterations)
+        except ZeroDivisionError:
+            raise ValueError("Error evaluating expression: division by zero")
+    try:
+        root = _newton(guarded(compiled), guarded(compiled.derivative(variable)),
+                       number(start), number(tol), max_iterations)
+    except ZeroDivisionError:
+        root = None
+    if root is None:
+        raise ValueError(f"Newton's method did not converge from {variable}={start}")
+    return root
+
+
+def solve_many(expr, starts, variable: Optional[str] = None, variables: Optional[dict] = None,
+               backend=None, tol: float = 1e-12, max_iterations: int = 100):
+    """Run Newton's method from many starting points at once
+    
+    With NumPy and the float backend every iteration is one vectorized call
+    over the points still iterating, and a float array is returned. Otherwise
+    a list is returned. Points that do not converge give nan.
+    """
+    compiled, variable, fixed = _solve_setup(expr, variable, variables, backend)
+    if not compiled.vectorizable:
+        roots = []
+        for start in starts:
+            try:
+                roots.append(solve(compiled, variable, start, None, fixed, None, tol, max_iterations))
+            except ValueError:
+                roots.append(math.nan)
+        return roots
+    
+    _load_numpy()
+    function = compiled.vectorized()
+    derivative = compiled.derivative(variable).vectorized()
+    fixed = {name: float(value) for name, value in fixed.items()}
+    x = np.asarray(starts, dtype=float).ravel()
+    roots = np.full(x.shape, np.nan)
+    active = np.arange(x.size)
+    with np.errstate(all="ignore"):
+        for _ in range(max_iterations):
+            if not active.size:
+                break
+            step = function(**fixed, **{variable: x}) / derivative(**fixed, **{variable: x})
+            x = x - step
+            finite = np.isfinite(x)
+            converged = finite & (np.abs(step) <= tol * (1 + np.abs(x)))
+            roots[active[converged]] = x[converged]
+            iterating = finite & ~converged
+            active, x = active[iterating], x[iterating]
+    return roots
+
+
+# 15-point Gauss-Kronrod rule on [-1, 1]; the embedded 7-point Gauss rule
+# uses every other node and the difference of the two estimates the error
+_KRONROD_NODES = (0.991455371120812639206854697526329, 0.949107912342758524526189684047851,
+                  0.864864423359769072789712788640926, 0.741531185599394439863864773280788,
+                  0.586087235467691130294144845693013, 0.405845151377397166906606412076961,
+                  0.207784955007898467600689403773245)
+_KRONROD_WEIGHTS = (0.022935322010529224963732008058970, 0.063092092629978553290700663189204,
+                    0.104790010322250183839876322541518, 0.140653259715525918745189590510238,
+                    0.169004726639267902826583426598550, 0.190350578064785409913256402421014,
+                    0.204432940075298892414161999234649)
+_KRONROD_CENTRE_WEIGHT = 0.209482141084727828012999174891714
+_GAUSS_WEIGHTS = (0.129484966168869693270611432679082, 0.279705391489276667901467771423780,
+                  0.381830050505118944950369775488975)
+_GAUSS_CENTRE_WEIGHT = 0.417959183673469387755102040816327
+
+_GK_NODES = tuple(-x for x in _KRONROD_NODES) + (0.0,) + _KRONROD_NODES[::-1]
+_GK_KRONROD = _KRONROD_WEIGHTS + (_KRONROD_CENTRE_WEIGHT,) + _KRONROD_WEIGHTS[::-1]
+_GK_GAUSS = (0, _GAUSS_WEIGHTS[0], 0, _GAUSS_WEIGHTS[1], 0, _GAUSS_WEIGHTS[2], 0,
+             _GAUSS_CENTRE_WEIGHT, 0, _GAUSS_WEIGHTS[2], 0, _GAUSS_WEIGHTS[1], 0, _GAUSS_WEIGHTS[0], 0)
+
+
+def _point_evaluator(compiled: CompiledExpression, variable: Optional[str], fixed: dict):
+    """Function mapping a list of variable values to a list of float results
+    
+    Uses one vectorized NumPy call when available (float backend), otherwise
+    evaluates point by point. Undefined points give nan.
+    """
+    uses_variable = variable in compiled.variables
+    if compiled.vectorizable:
+        _load_numpy()
+        function = compiled.vectorized()
+        fixed = {name: float(value) for name, value in fixed.items()}
+        
+        def evaluate_points(points):
+            points = np.asarray(points, dtype=float)
+            with np.errstate(all="ignore"):
+                result = function(**fixed, **{variable: points}) if uses_variable else function(**fixed)
+            return np.broadcast_to(np.asarray(result, dtype=float), points.shape)
+        return evaluate_points
+    
+    number = compiled.backend.number
+    fixed = {name: number(value) for name, value in fixed.items()}
+    
+    def evaluate_points(points):
+        results = []
+        for point in points:
+            try:
+                value = compiled(**fixed, **{variable: number(point)}) if uses_variable else compiled(**fixed)
+                results.append(float(value))
+            except (ValueError, ArithmeticError, TypeError):
+                results.append(math.nan)
+        return results
+    return evaluate_points
+
+
+def integrate(expr, a: float, b: float, variable: Optional[str] = None,
+              variables: Optional[dict] = None, backend=None, tol: float = 1e-10,
+              max_intervals: int = 4096):
+    """Definite integral of an expression from a to b (in floats)
+    
+    Adaptive Gauss-Kronrod quadrature: every round evaluates the 15 nodes of
+    all unfinished intervals in one vectorized call, keeps intervals whose
+    error estimate is within their share of tol and bisects the rest. It
+    stops as soon as the total error estimate is within tol. The result is
+    a Quantity when the integrand has units (the variable is dimensionless).
+    """
+    compiled, variable, fixed = _solve_setup(expr, variable, variables, backend,
+                                             "integrate over", constant_ok=True)
+    a, b = float(a), float(b)
+    if not (math.isfinite(a) and math.isfinite(b)):
+        raise ValueError("Integration limits must be finite")
+    if a == b:
+        return _with_unit(compiled, 0.0)
+    if a > b:
+        result = integrate(compiled, b, a, variable, fixed, None, tol, max_intervals)
+        return _with_unit(compiled, -result.value) if compiled.unit is not None else -result
+    
+    evaluate_points = _point_evaluator(compiled, variable, fixed)
+    width = b - a
+    intervals = [(a, b)]
+    accepted = 0.0
+    accepted_error = 0.0
+    compensation = 0.0
+    while intervals:
+        points = [(lo + hi) / 2 + (hi - lo) / 2 * node for lo, hi in intervals for node in _GK_NODES]
+        values = evaluate_points(points)
+        if not isinstance(values, list):
+            # As Python floats, inf * 0 in the sums below is nan without a NumPy warning
+            values = values.tolist()
+        estimates = []
+        for index, (lo, hi) in enumerate(intervals):
+            fx = values[index * 15:(index + 1) * 15]
+            half = (hi - lo) / 2
+            kronrod = half * math.fsum(w * f for w, f in zip(_GK_KRONROD, fx))
+            gauss = half * math.fsum(w * f for w, f in zip(_GK_GAUSS, fx))
+            if not math.isfinite(kronrod):
+                raise ValueError(f"Integrand is not finite on [{lo}, {hi}]")
+            estimates.append((lo, hi, kronrod, abs(kronrod - gauss)))
+        
+        pending = math.fsum(estimate[2] for estimate in estimates)
+        error = accepted_error + math.fsum(estimate[3] for estimate in estimates)
+        if error <= tol:
+            return _with_unit(compiled, accepted + (pending + compensation))
+        
+        remaining = []
+        for lo, hi, kronrod, interval_error in estimates:
+            if interval_error <= tol * (hi - lo) / width:
+                # Neumaier summation of accepted pieces
+                total = accepted + kronrod
+                if abs(accepted) >= abs(kronrod):
+                    compensation += (accepted - total) + kronrod
+                else:
+                    compensation += (kronrod - total) + accepted
+                accepted = total
+                accepted_error += interval_error
+            else:
+                middle = (lo + hi) / 2
+                remaining += [(lo, middle), (middle, hi)]
+        if len(remaining) > max_intervals:
+            raise ValueError(f"Integral did not converge (estimate {accepted + pending}, error {error:.3g})")
+        intervals = remaining
+    return _with_unit(compiled, accepted + compensation)
+
+
+def series_sum(expr, start: int, stop, variable: Optional[str] = None,
+               variables: Optional[dict] = None, backend=None, tol: Optional[float] = None,
+               chunk_size: int = 65536, max_terms: int = 100_000_000):
+    """Sum of an expression for variable = start, start+1, ..., stop (inclusive)
+    
+    Terms are evaluated in vectorized chunks; each chunk is summed pairwise by
+    NumPy and chunk totals are combined with Neumaier (Kahan) summation. The
+    Decimal and Fraction backends sum exactly in their own number type.
+    With tol given, finite ranges stop early once a chunk adds less than tol
+    relative to the total.
+    
+    stop may be math.inf. Terms are then summed in blocks of doubling length
+    and the remaining tail is estimated from the ratio of the last two block
+    sums (exact for geometric and power-law terms such as 1/n^2); summation
+    stops once the sum plus that estimate changes by less than tol (default
+    1e-8) relative to itself. The estimate is not a strict error bound.
+    """
+    compiled, variable, fixed = _solve_setup(expr, variable, variables, backend,
+                                             "sum over", constant_ok=True)
+    start = int(start)
+    infinite = stop == math.inf
+    if infinite and tol is None:
+        tol = 1e-8
+    if tol is not None and compiled.backend.name == "decimal":
+        tol = compiled.backend.number(tol)
+    stop = None if infinite else int(stop)
+    if stop is not None and stop < start:
+        return compiled.backend.number(0)
+    
+    exact = compiled.backend.name != "float"
+    if exact:
+        number = compiled.backend.number
+        fixed = {name: number(value) for name, value in fixed.items()}
+        uses_variable = variable in compiled.variables
+        
+        def evaluate_points(points):
+            try:
+                return [compiled(**fixed, **{variable: number(n)}) if uses_variable else compiled(**fixed)
+                        for n in points]
+            except ZeroDivisionError:
+                raise ValueError("Error evaluating expression: division by zero")
+            except Exception as e:
+                raise ValueError(f"Error evaluating expression: {str(e)}")
+    else:
+        evaluate_points = _point_evaluator(compiled, variable, fixed)
+    
+    zero = compiled.backend.number(0)
+    total = zero
+    compensation = 0.0
+    
+    def add_terms(first: int, count: int):
+        """Add the terms first .. first+count-1 to the total; returns their sum"""
+        nonlocal total, compensation
+        if first - start >= max_terms:
+            raise ValueError(f"Series did not converge within {max_terms} terms")
+        values = evaluate_points(range(first, first + count))
+        if exact:
+            chunk = sum(values, zero)
+            total += chunk
+            return chunk
+        chunk = float(np.sum(values)) if NUMPY_AVAILABLE else math.fsum(values)
+        if not math.isfinite(chunk):
+            bad = next(first + i for i, value in enumerate(values) if not math.isfinite(value))
+            raise ValueError(f"Term is undefined at {variable}={bad}")
+        updated = total + chunk
+        if abs(total) >= abs(chunk):
+            compensation += (total - updated) + chunk
+        else:
+            compensation += (chunk - updated) + total
+        total = updated
+        return chunk
+    
+    if not infinite:
+        n = start
+        while n <= stop:
+            count = min(chunk_size, stop - n + 1)
+            chunk = add_terms(n, count)
+            n += count
+            if tol is not None and abs(chunk) <= tol * abs(total + compensation):
+                break
+        return total if exact else total + compensation
+    
+    n = start
+    size = min(chunk_size, 1024)
+    previous_block = previous_estimate = None
+    while True:
+        block = zero
+        for first in range(n, n + size, chunk_size):
+            block += add_terms(first, min(chunk_size, n + size - first))
+        n += size
+        # Blocks end at start + 1024 * 2^k, so power-law terms give block
+        # sums in a steady ratio
+        size = n - start
+        estimate = total if exact else total + compensation
+        if previous_block:
+            # Block sums of geometric or power-law terms shrink by a steady
+            # ratio, so the tail is a geometric series in that ratio
+            ratio = block / previous_block
+            if 0 < ratio < 1:
+                estimate += block * ratio / (1 - ratio)
+        if previous_estimate is not None and abs(estimate - previous_estimate) <= tol * abs(estimate):
+            return estimate
+        previous_block, previous_estimate = block, estimate
+
+
+# ============================================================================
+# Part 7: Expression Parser (Advanced Feature)
 # ============================================================================
 
 class ExpressionParser:
     """Advanced mathematical expression parser"""
     
     @staticmethod
-    def parse_expression(expr: str) -> float:
-        """Parse and evaluate a mathematical expression"""
-        # Remove whitespace
-        expr = expr.strip()
+    def parse_expression(expr: str, backend=None, variables: Optional[dict] = None) -> float:
+        """Parse and evaluate a mathematical expression
         
-        if not expr:
-            raise ValueError("Empty expression")
+        backend selects the number type: "float" (default), "decimal",
+        "fraction" or a backend instance such as DecimalBackend(precision=50).
+        variables maps variable names used in the expression to values.
+        """
+        return evaluate(expr, backend, variables)
+    
+    @staticmethod
+    def compile(expr: str, backend=None) -> CompiledExpression:
+        """Compile an expression once for repeated evaluation"""
+        return compile_expression(expr, backend)
+    
+    @staticmethod
+    def sweep(expr: str, values: dict, backend=None, chunk_size: int = 65536):
+        """Evaluate an expression over a grid of variable values (see sweep())"""
+        return sweep(expr, values, backend, chunk_size)
+    
+    @staticmethod
+    def derivative(expr: str, variable: Optional[str] = None, backend=None) -> CompiledExpression:
+        """Compiled symbolic derivative of an expression (its text is in .text)"""
+        return compile_expression(expr, backend).derivative(variable)
+    
+    @staticmethod
+    def solve(expr: str, variable: Optional[str] = None, start=1, bracket=None,
+              variables: Optional[dict] = None, backend=None):
+        """Find a root of expr = 0 (see solve())"""
+        return solve(expr, variable, start, bracket, variables, backend)
+    
+    @staticmethod
+    def solve_many(expr: str, starts, variable: Optional[str] = None,
+                   variables: Optional[dict] = None, backend=None):
+        """Newton's method from many starting points at once (see solve_many())"""
+        return solve_many(expr, starts, variable, variables, backend)
+    
+    @staticmethod
+    def integrate(expr: str, a: float, b: float, variable: Optional[str] = None,
+                  variables: Optional[dict] = None, backend=None, tol: float = 1e-10) -> float:
+        """Definite integral of expr from a to b (see integrate())"""
+        return integrate(expr, a, b, variable, variables, backend, tol)
+    
+    @staticmethod
+    def sum(expr: str, variables: Optional[dict] = None, backend=None,
+            tol: Optional[float] = None, **ranges):
+        """Sum expr over an inclusive range given as a keyword, e.g. sum("1/n^2", n=(1, 1000))
         
-        # Check for invalid characters
-        valid_pattern = r'^[0-9+\-*/().\s^!√πe\sincostanlog]+$'
-        if not re.match(valid_pattern, expr.replace(" ", "")):
-            raise ValueError("Invalid characters in expression")
+        The upper limit may be math.inf (see series_sum()).
+        """
+        if len(ranges) != 1:
+            raise ValueError("Give exactly one summation range, e.g. n=(1, 100)")
+        (variable, (start, stop)), = ranges.items()
+        return series_sum(expr, start, stop, variable, variables, backend, tol)
+
+# ============================================================================
+# Part 8: Headless Batch Mode
+# ============================================================================
+
+def evaluate_line(line: str, backend=None) -> str:
+    """Evaluate one input line, returning the output line (without newline)"""
+    expr = line.strip()
+    if not expr:
+        return ""
+    try:
+        return format_result(evaluate(expr, backend))
+    except ValueError as e:
+        return f"Error: {e}"
+
+
+def _evaluate_chunk(lines: List[str], backend: Optional[str] = None, instrumented: bool = False):
+    """Worker entry point: evaluate a chunk of lines in order
+    
+    When instrumented, returns (results, metrics state) so the parent can
+    merge the worker's measurements.
+    """
+    if not instrumented:
+        return [evaluate_line(line, backend) + "\n" for line in lines]
+    instrumentation = Instrumentation()
+    previous = set_instrumentation(instrumentation)
+    try:
+        results = [evaluate_line(line, backend) + "\n" for line in lines]
+    finally:
+        set_instrumentation(previous)
+    return results, instrumentation.state()
+
+
+def _read_chunks(source, chunk_size: int):
+    chunk = []
+    for line in source:
+        chunk.append(line)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def run_batch(source, output, workers: int = 1, chunk_size: int = 1000,
+              backend: Optional[str] = None,
+              instrumentation: Optional[Instrumentation] = None) -> int:
+    """Stream expressions from source to output, one result line per input line
+    
+    With workers > 1 the input is sharded into chunks evaluated by a process
+    pool; at most 2 * workers chunks are in flight so memory stays bounded.
+    If instrumentation is given, pipeline timings (including those of worker
+    processes) are recorded into it. Returns the number of lines evaluated.
+    """
+    count = 0
+    if workers <= 1:
+        previous = set_instrumentation(instrumentation) if instrumentation is not None else None
+        try:
+            for line in source:
+                output.write(evaluate_line(line, backend) + "\n")
+                count += 1
+        finally:
+            if instrumentation is not None:
+                set_instrumentation(previous)
+        return count
+    
+    from concurrent.futures import ProcessPoolExecutor
+    
+    instrumented = instrumentation is not None
+    
+    def collect(future):
+        result = future.result()
+        if instrumented:
+            result, state = result
+            instrumentation.merge(state)
+        output.writelines(result)
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in _read_chunks(source, chunk_size):
+            pending.append(pool.submit(_evaluate_chunk, chunk, backend, instrumented))
+            count += len(chunk)
+            if len(pending) >= workers * 2:
+                collect(pending.popleft())
+        while pending:
+            collect(pending.popleft())
+    return count
+
+
+def run_batch_file(path: str, output_path: Optional[str] = None, workers: int = 1,
+                   chunk_size: int = 1000, backend: Optional[str] = None,
+                   metrics_path: Optional[str] = None, metrics_format: str = "json") -> int:
+    """Run batch mode on a file path ('-' for stdin) writing to a path or stdout
+    
+    With metrics_path, pipeline metrics are written there afterwards ('-'
+    for stderr) as JSON or Prometheus text.
+    """
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    output = sys.stdout if output_path in (None, "-") else open(output_path, "w", encoding="utf-8")
+    instrumentation = Instrumentation() if metrics_path else None
+    try:
+        count = run_batch(source, output, workers, chunk_size, backend, instrumentation)
+        if instrumentation is not None:
+            report = instrumentation.export(metrics_format)
+            if metrics_path == "-":
+                sys.stderr.write(report)
+            else:
+                with open(metrics_path, "w", encoding="utf-8") as f:
+                    f.write(report)
+        return count
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+        else:
+            output.flush()
+
+# ============================================================================
+# Part 9: Parallel Evaluation
+# ============================================================================
+
+def _backend_spec(backend) -> tuple:
+    """Picklable description of a backend for worker processes"""
+    backend = get_backend(backend)
+    if backend.name == "decimal":
+        return ("decimal", backend.context.prec)
+    return (backend.name,)
+
+
+@lru_cache(maxsize=16)
+def _backend_from_spec(spec: tuple) -> FloatBackend:
+    if spec[0] == "decimal" and spec[1] != BACKENDS["decimal"].context.prec:
+        return DecimalBackend(spec[1])
+    return BACKENDS[spec[0]]
+
+
+def _evaluate_expressions(expressions: List[str], spec: tuple) -> Tuple[list, dict]:
+    """Worker task: evaluate a chunk of expression strings, capturing errors per item"""
+    backend = _backend_from_spec(spec)
+    results = []
+    errors = {}
+    for index, expr in enumerate(expressions):
+        try:
+            results.append(evaluate(expr, backend))
+        except Exception as e:
+            results.append(None)
+            errors[index] = str(e)
+    return results, errors
+
+
+def _evaluate_shared(expr: str, spec: tuple, names: List[str], count: int,
+                     start: int, stop: int) -> dict:
+    """Worker task: evaluate rows start:stop of shared input columns into the shared output
+    
+    names holds the shared memory block of each input column followed by the
+    output block. Returns {row: error message} for rows that failed.
+    """
+    from multiprocessing import shared_memory
+    blocks = [shared_memory.SharedMemory(name=name) for name in names]
+    views = [block.buf.cast("d") for block in blocks]
+    try:
+        *columns, output = views
+        backend = _backend_from_spec(spec)
+        compiled = compile_expression(expr, backend)
+        rows = range(start, stop)
         
-        # Replace symbols
-        expr = expr.replace("^", "**")
-        expr = expr.replace("√", "math.sqrt")
-        expr = expr.replace("π", str(math.pi))
-        expr = expr.replace("e", str(math.e))
+        if compiled.vectorizable:
+            # One vectorized call; non-finite rows are re-run as scalars so
+            # they report the same result or error as evaluate() would
+            _load_numpy()
+            arrays = [np.frombuffer(column, dtype=float, count=count)[start:stop] for column in columns]
+            with np.errstate(all="ignore"):
+                values = np.broadcast_to(compiled.vectorized()(*arrays), (stop - start,))
+            np.frombuffer(output, dtype=float, count=count)[start:stop] = values
+            rows = [start + i for i in np.flatnonzero(~np.isfinite(values)).tolist()]
+            del arrays, values
         
-        # Handle functions
-        expr = re.sub(r'sin\(', 'math.sin(math.radians(', expr)
-        expr = re.sub(r'cos\(', 'math.cos(math.radians(', expr)
-        expr = re.sub(r'tan\(', 'math.tan(math.radians(', expr)
-        expr = re.sub(r'log\(', 'math.log10(', expr)
-        expr = re.sub(r'ln\(', 'math.log(', expr)
+        errors = {}
+        number = backend.number
+        for row in rows:
+            try:
+                output[row] = float(evaluate(expr, backend, {name: number(column[row])
+                                                           for name, column in zip(compiled.variables, columns)}))
+            except Exception as e:
+                output[row] = math.nan
+                errors[row] = str(e)
+        return errors
+    finally:
+        for view in views:
+            view.release()
+        for block in blocks:
+            block.close()
+
+
+class ParallelEvaluator:
+    """Evaluates large batches of expressions across a pool of worker processes
+    
+    Big-int factorials and high-precision arithmetic hold the GIL, so threads
+    cannot help; processes can. Results keep input order and a failing item
+    never stops the batch: every method returns (results, errors) where
+    errors maps item index to the error message.
+    
+    The chunk size is tuned automatically: a pilot of a few items is
+    evaluated in-process and chunks are sized to take about
+    target_task_seconds each. Use as a context manager to reuse one pool
+    across calls.
+    """
+    
+    PILOT_ITEMS = 32
+    
+    def __init__(self, workers: Optional[int] = None, backend=None,
+                 target_task_seconds: float = 0.05):
+        self.workers = workers or os.cpu_count() or 1
+        self.backend = get_backend(backend)
+        self.target_task_seconds = target_task_seconds
+        self._pool = None
+    
+    def __enter__(self):
+        from concurrent.futures import ProcessPoolExecutor
+        self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self
+    
+    def __exit__(self, *exc):
+        self._pool.shutdown()
+        self._pool = None
+    
+    def chunk_size(self, seconds_per_item: float, count: int) -> int:
+        """Items per task: about target_task_seconds of work, but at least 4 tasks per worker"""
+        per_task = self.target_task_seconds / max(seconds_per_item, 1e-9)
+        most = max(1, -(-count // (self.workers * 4)))
+        return max(1, min(int(per_task), most))
+    
+    def _run(self, tasks):
+        """Run (function, args) tasks in order with at most 2 * workers in flight"""
+        if self._pool is None:
+            with self:
+                yield from self._run(tasks)
+            return
+        pending = deque()
+        for function, args in tasks:
+            pending.append(self._pool.submit(function, *args))
+            if len(pending) >= self.workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    
+    def evaluate(self, expressions, chunk_size: Optional[int] = None) -> Tuple[list, dict]:
+        """Evaluate expression strings; results are exact (ints, Decimals, ...), None where failed"""
+        expressions = list(expressions)
+        spec = _backend_spec(self.backend)
+        start = perf_counter()
+        results, errors = _evaluate_expressions(expressions[:self.PILOT_ITEMS], spec)
+        done = len(results)
+        if chunk_size is None:
+            chunk_size = self.chunk_size((perf_counter() - start) / max(done, 1), len(expressions) - done)
+        if done == len(expressions):
+            return results, errors
+        if self.workers <= 1:
+            rest, rest_errors = _evaluate_expressions(expressions[done:], spec)
+            results += rest
+            errors.update({done + index: message for index, message in rest_errors.items()})
+            return results, errors
+        
+        offsets = range(done, len(expressions), chunk_size)
+        tasks = ((_evaluate_expressions, (expressions[offset:offset + chunk_size], spec))
+                 for offset in offsets)
+        for offset, (chunk, chunk_errors) in zip(offsets, self._run(tasks)):
+            results += chunk
+            errors.update({offset + index: message for index, message in chunk_errors.items()})
+        return results, errors
+    
+    def evaluate_values(self, expr: str, columns: dict,
+                        chunk_size: Optional[int] = None) -> Tuple[array, dict]:
+        """Evaluate one expression for every row of equal-length numeric input columns
         
-        # Handle factorial
-        expr = re.sub(r'(\d+)!', r'math.factorial(\1)', expr)
+        Inputs and outputs live in shared memory as float64 buffers, so only
+        row ranges and error messages cross process boundaries. Failed rows
+        are nan in the returned array('d').
+        """
+        from multiprocessing import shared_memory
         
-        # Safe evaluation
-        allowed_names = {k: v for k, v in math.__dict__.items() 
-                        if not k.startswith("__")}
+        compiled = compile_expression(expr, self.backend)
+        missing = [name for name in compiled.variables if name not in columns]
+        if missing:
+            raise ValueError(f"No value for variable(s): {', '.join(missing)}")
+        inputs = [array("d", columns[name]) for name in compiled.variables]
+        count = len(inputs[0]) if inputs else 1
+        if any(len(column) != count for column in inputs):
+            raise ValueError("Input columns must have the same length")
         
+        spec = _backend_spec(self.backend)
+        blocks = []
         try:
-            result = eval(expr, {"__builtins__": {}}, allowed_names)
-            return result
-        except Exception as e:
-            raise ValueError(f"Error evaluating expression: {str(e)}")
+            for column in inputs + [None]:
+                block = shared_memory.SharedMemory(create=True, size=max(8, 8 * count))
+                blocks.append(block)
+                if column is not None:
+                    block.buf[:8 * count] = column.tobytes()
+            names = [block.name for block in blocks]
+            
+            pilot = min(count, self.PILOT_ITEMS)
+            start = perf_counter()
+            errors = _evaluate_shared(expr, spec, names, count, 0, pilot)
+            if chunk_size is None:
+                chunk_size = self.chunk_size((perf_counter() - start) / max(pilot, 1), count - pilot)
+            if pilot < count:
+                if self.workers <= 1:
+                    errors.update(_evaluate_shared(expr, spec, names, count, pilot, count))
+                else:
+                    tasks = ((_evaluate_shared, (expr, spec, names, count, offset, min(offset + chunk_size, count)))
+                             for offset in range(pilot, count, chunk_size))
+                    for chunk_errors in self._run(tasks):
+                        errors.update(chunk_errors)
+            
+            results = array("d")
+            results.frombytes(bytes(blocks[-1].buf[:8 * count]))
+            return results, dict(sorted(errors.items()))
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
 
 # ============================================================================
 # Run the application
 # ============================================================================
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Calculator Benchmarks
+Measures throughput of the calculator engine and expression compiler,
+saves baselines as JSON and compares runs to catch regressions
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from datetime import datetime
+
+from Calculator import (BACKENDS, CalculatorEngine, ExpressionParser, HistoryBuffer,
+                        _compile_cached, compile_expression)
+
+# ============================================================================
+# Part 1: Measurement
+# ============================================================================
+
+def ops_per_second(function, number: int) -> float:
+    """Best-of-three throughput of a zero-argument callable"""
+    best = min(timeit.repeat(function, number=number, repeat=3))
+    return number / best if best > 0 else float("inf")
+
+
+def allocation_profile(function, number: int) -> dict:
+    """Peak traced memory during `number` calls and bytes still held afterwards, per call"""
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for _ in range(number):
+            function()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "peak_bytes": max(0, peak - start),
+        "retained_bytes_per_op": max(0, current - start) / number,
+    }
+
+
+def measure(function, number: int, allocations: bool = True) -> dict:
+    """Throughput and (optionally) allocation figures for one benchmark"""
+    result = {"ops_per_sec": ops_per_second(function, number)}
+    if allocations:
+        result.update(allocation_profile(function, max(1, number // 10)))
+    return result
+
+# ============================================================================
+# Part 2: Engine Methods
+# ============================================================================
+
+ENGINE_CALLS = [
+    ("add", lambda calc: calc.add(1.5, 2.25)),
+    ("subtract", lambda calc: calc.subtract(1.5, 2.25)),
+    ("multiply", lambda calc: calc.multiply(1.5, 2.25)),
+    ("divide", lambda calc: calc.divide(1.0, 3.0)),
+    ("power", lambda calc: calc.power(3.0, 40.0)),
+    ("square_root", lambda calc: calc.square_root(2.0)),
+    ("factorial", lambda calc: calc.factorial(20)),
+    ("factorial_big", lambda calc: calc.factorial(1000)),
+    ("sin", lambda calc: calc.sin(30.0, degrees=True)),
+    ("cos", lambda calc: calc.cos(60.0, degrees=True)),
+    ("tan", lambda calc: calc.tan(45.0, degrees=True)),
+    ("log", lambda calc: calc.log(1000.0)),
+    ("log_base", lambda calc: calc.log(1000.0, 7)),
+    ("ln", lambda calc: calc.ln(10.0)),
+    ("percent", lambda calc: calc.percent(50.0)),
+    ("memory_add", lambda calc: calc.memory_add(1.0)),
+]
+
+
+def bench_engine(number: int, allocations: bool = True) -> dict:
+    """Each CalculatorEngine method with the default float backend"""
+    calc = CalculatorEngine()
+    return {
+        f"engine.{name}": measure(lambda call=call: call(calc), number, allocations)
+        for name, call in ENGINE_CALLS
+    }
+
+# ============================================================================
+# Part 3: Expression Parsing
+# ============================================================================
+
+def _long_expression(terms: int = 200) -> str:
+    return "+".join(f"{i}*{i % 7 + 1}/{i % 3 + 2}" for i in range(1, terms + 1))
+
+
+def _nested_expression(depth: int = 60) -> str:
+    return "(" * depth + "1" + "".join(f"+{i})" for i in range(depth))
+
+
+EXPRESSION_CORPUS = {
+    "short": "2+3*4",
+    "scientific": "sin(30)*2+log(100)^2-√16",
+    "long": _long_expression(),
+    "nested": _nested_expression(),
+}
+
+
+def bench_expressions(number: int, allocations: bool = True) -> dict:
+    """parse_expression on the corpus, cold (cache cleared) and warm (cached)"""
+    results = {}
+    parse = ExpressionParser.parse_expression
+    for name, expr in EXPRESSION_CORPUS.items():
+        def cold(expr=expr):
+            _compile_cached.cache_clear()
+            return parse(expr)
+        results[f"parse.{name}.cold"] = measure(cold, max(1, number // 20), allocations)
+        parse(expr)
+        parse(expr)
+        results[f"parse.{name}.warm"] = measure(lambda expr=expr: parse(expr), number, allocations)
+    return results
+
+# ============================================================================
+# Part 4: History Insertion
+# ============================================================================
+
+HISTORY_CAPACITIES = [10, 1000, 100000, 1000000]
+
+
+def bench_history(number: int, allocations: bool = True) -> dict:
+    """add_to_history into ring buffers of several capacities (filled, so every append evicts)"""
+    results = {}
+    for capacity in HISTORY_CAPACITIES:
+        buffer = HistoryBuffer(capacity)
+        for i in range(capacity):
+            buffer.append("1+1", 2.0)
+        results[f"history.append.{capacity}"] = measure(
+            lambda buffer=buffer: buffer.append("1+1", 2.0), number, allocations)
+        results[f"history.format.{capacity}"] = measure(
+            lambda buffer=buffer: buffer.format(10), max(1, number // 10), allocations)
+    return results
+
+# ============================================================================
+# Part 5: Backend Comparison
+# ============================================================================
+
+# (expression, value of x): each uses x so constant folding cannot reduce
+# it to a stored result and the backend's arithmetic is what gets timed
+BACKEND_EXPRESSIONS = [
+    ("0.1+0.2*x-4/7", 3),
+    ("(x/3+1/7)^3", 1),
+    ("2^x+3^40", 64),
+    ("√x*√8", 2),
+    ("sin(x)+cos(2*x)", 30),
+    ("ln(e^x)+log(1000)", 2),
+    ("x!/(x-2)!", 25),
+]
+
+BACKEND_OPERATIONS = [
+    ("add", lambda calc, n: calc.add(n(1.5), n(2.25))),
+    ("divide", lambda calc, n: calc.divide(n(1), n(3))),
+    ("power", lambda calc, n: calc.power(n(3), n(40))),
+    ("square_root", lambda calc, n: calc.square_root(n(2))),
+    ("sin", lambda calc, n: calc.sin(n(30), degrees=True)),
+    ("log", lambda calc, n: calc.log(n(1000))),
+    ("factorial", lambda calc, n: calc.factorial(500)),
+]
+
+
+def bench_backends(number: int, allocations: bool = False) -> dict:
+    """Throughput of engine operations and compiled expressions per backend"""
+    results = {}
+    for name, backend in BACKENDS.items():
+        calc = CalculatorEngine(backend=backend)
+        number_of = backend.number
+        for label, operation in BACKEND_OPERATIONS:
+            results[f"backend.{name}.engine.{label}"] = measure(
+                lambda operation=operation: operation(calc, number_of), number, allocations)
+        for expr, x in BACKEND_EXPRESSIONS:
+            compiled = compile_expression(expr, backend)
+            x = number_of(x)
+            compiled(x)
+            results[f"backend.{name}.{expr}"] = measure(lambda compiled=compiled, x=x: compiled(x),
+                                                        number, allocations)
+    return results
+
+
+def print_backend_table(results: dict):
+    """Print ops/sec per backend benchmark with one column per backend"""
+    names = list(BACKENDS)
+    table = {}
+    for key, result in results.items():
+        if key.startswith("backend."):
+            _, backend, label = key.split(".", 2)
+            table.setdefault(label, {})[backend] = result["ops_per_sec"]
+    if not table:
+        return
+    print("\nBackend throughput (ops/sec)")
+    print(f"{'benchmark':<24}" + "".join(f"{name:>14}" for name in names))
+    print("-" * (24 + 14 * len(names)))
+    for label, rates in table.items():
+        print(f"{label:<24}" + "".join(f"{rates.get(name, 0):>14,.0f}" for name in names))
+
+# ============================================================================
+# Part 6: Cold Start
+# ============================================================================
+
+CALCULATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+STARTUP_COMMANDS = [
+    ("interpreter", [sys.executable, "-c", "pass"], None),
+    ("import", [sys.executable, "-c", "import Calculator"], None),
+    ("batch_cli", [sys.executable, "Calculator.py", "--batch", "--no-history"], b"1+1\n"),
+    ("gui_import", [sys.executable, "-c", "import Calculator; Calculator.load_gui()"], None),
+]
+
+STARTUP_RUNS = 5
+
+
+def time_startup(command: list, stdin: bytes = None, runs: int = STARTUP_RUNS) -> float:
+    """Best wall-clock time of a fresh interpreter running `command`"""
+    best = float("inf")
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, input=stdin, cwd=CALCULATOR_DIR, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def bench_startup(number: int, allocations: bool = False) -> dict:
+    """Cold-start time of the interpreter, library import, batch CLI and GUI imports"""
+    results = {}
+    for name, command, stdin in STARTUP_COMMANDS:
+        try:
+            seconds = time_startup(command, stdin)
+        except subprocess.CalledProcessError:
+            continue
+        results[f"startup.{name}"] = {"ops_per_sec": 1 / seconds, "seconds": seconds}
+    return results
+
+# ============================================================================
+# Part 7: Baselines and Reporting
+# ============================================================================
+
+SUITES = {
+    "engine": bench_engine,
+    "expressions": bench_expressions,
+    "history": bench_history,
+    "backends": bench_backends,
+    "startup": bench_startup,
+}
+
+
+def run_suites(names: list, number: int, allocations: bool = True) -> dict:
+    results = {}
+    for name in names:
+        print(f"Running {name} benchmarks...", file=sys.stderr)
+        results.update(SUITES[name](number, allocations))
+    return results
+
+
+def print_results(results: dict):
+    """Print ops/sec and allocation figures for non-backend benchmarks"""
+    print(f"{'benchmark':<32}{'ops/sec':>16}{'peak KiB':>12}{'B/op kept':>12}")
+    print("-" * 72)
+    for key, result in results.items():
+        if key.startswith("backend."):
+            continue
+        if "seconds" in result:
+            print(f"{key:<32}{result['seconds'] * 1000:>13.1f} ms")
+            continue
+        peak = result.get("peak_bytes")
+        kept = result.get("retained_bytes_per_op")
+        print(f"{key:<32}{result['ops_per_sec']:>16,.0f}"
+              f"{'' if peak is None else f'{peak / 1024:.1f}':>12}"
+              f"{'' if kept is None else f'{kept:.1f}':>12}")
+    print_backend_table(results)
+
+
+def save_baseline(results: dict, path: str):
+    """Write results plus machine details to a JSON baseline file"""
+    data = {
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    print(f"\nBaseline saved to {path}")
+
+
+def compare_baseline(results: dict, path: str, threshold: float) -> list:
+    """Print throughput changes against a baseline; return benchmarks slower than threshold"""
+    with open(path, encoding="utf-8") as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    print(f"\nComparison with {path} (regression threshold {threshold:.0%})")
+    print(f"{'benchmark':<40}{'baseline':>14}{'current':>14}{'change':>10}")
+    print("-" * 78)
+    for key, result in results.items():
+        if key not in baseline:
+            continue
+        old = baseline[key]["ops_per_sec"]
+        new = result["ops_per_sec"]
+        change = new / old - 1 if old else 0.0
+        flag = ""
+        if change < -threshold:
+            flag = "  REGRESSION"
+            regressions.append(key)
+        print(f"{key:<40}{old:>14,.0f}{new:>14,.0f}{change:>+10.1%}{flag}")
+    return regressions
+
+# ============================================================================
+# Run the benchmarks
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator benchmarks")
+    parser.add_argument("--number", type=int, default=20000,
+                        help="calls per timing run")
+    parser.add_argument("--suite", action="append", choices=sorted(SUITES),
+                        help="suite to run (repeatable, default: all)")
+    parser.add_argument("--no-allocations", action="store_true",
+                        help="skip tracemalloc allocation profiling")
+    parser.add_argument("--save", metavar="FILE",
+                        help="save results as a JSON baseline")
+    parser.add_argument("--compare", metavar="FILE",
+                        help="compare results with a saved JSON baseline")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="fractional slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    results = run_suites(args.suite or list(SUITES), args.number, not args.no_allocations)
+    print_results(results)
+
+    if args.save:
+        save_baseline(results, args.save)
+    if args.compare:
+        regressions = compare_baseline(results, args.compare, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) found")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Calculator Server
+Shares one warm calculator engine with other tools over a local socket
+
+Protocol: newline-delimited JSON. Each request line is an object such as
+    {"id": 1, "expr": "sin(x)*y", "variables": {"x": 30, "y": 2}, "backend": "float"}
+and gets one response line, in request order:
+    {"id": 1, "result": 1.0, "latency_us": 41.7}
+    {"id": 2, "error": "Error evaluating expression: division by zero", "latency_us": 12.0}
+latency_us is the time spent evaluating that request. Non-finite results
+are sent as the strings "nan", "inf" and "-inf", keeping every line valid
+JSON. {"op": "stats"} returns request counts and latency percentiles.
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from fractions import Fraction
+
+from Calculator import NUMPY_AVAILABLE, Matrix, Quantity, compile_expression, evaluate, format_result
+
+if NUMPY_AVAILABLE:
+    import numpy as np
+
+# ============================================================================
+# Part 1: Request Evaluation
+# ============================================================================
+
+# Requests sharing an expression are evaluated as one NumPy call once a
+# pipelined batch holds at least this many of them
+VECTORIZE_THRESHOLD = 8
+
+MAX_LINE_BYTES = 1 << 20
+
+
+def _json_value(value):
+    """Results JSON cannot represent directly (Decimal, Fraction, complex, nan, inf, huge ints) become strings"""
+    if isinstance(value, Quantity):
+        return {"value": _json_value(value.value), "unit": value.unit}
+    if isinstance(value, Matrix):
+        return _json_value(value.tolist())
+    if isinstance(value, list):
+        return [_json_value(item) for item in value]
+    if isinstance(value, (Decimal, Fraction, complex)):
+        return str(value)
+    if type(value) is int and value.bit_length() > 14000:
+        # Past about 4300 digits Python cannot write the int as text
+        return format_result(value)
+    if NUMPY_AVAILABLE and isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and not math.isfinite(value):
+        return str(value)
+    return value
+
+
+def _evaluate_one(request: dict) -> dict:
+    started = time.perf_counter()
+    try:
+        result = evaluate(request["expr"], request.get("backend"), request.get("variables"))
+        response = {"result": _json_value(result)}
+    except Exception as e:
+        # A bad request must never take down the connection
+        response = {"error": str(e)}
+    response["latency_us"] = round((time.perf_counter() - started) * 1e6, 1)
+    return response
+
+
+def _has_factorial(node) -> bool:
+    return (node.kind == "call" and node.value == "fact") or any(_has_factorial(child) for child in node.children)
+
+
+def _evaluate_vectorized(requests: list) -> list:
+    """Evaluate requests that share one float expression with a single NumPy call
+
+    Elements that come back non-finite are re-run through the scalar path so
+    they report the same result or error as an individual request would.
+    Expressions with a factorial are refused (ValueError): the scalar path
+    returns exact ints for them, which a float array cannot hold. The
+    shared call's time is split evenly over the requests.
+    """
+    started = time.perf_counter()
+    compiled = compile_expression(requests[0]["expr"])
+    if _has_factorial(compiled.tree):
+        raise ValueError("Factorials give exact ints and are evaluated one by one")
+    columns = [np.array([float(r["variables"][name]) for r in requests])
+               for name in compiled.variables]
+    with np.errstate(all="ignore"):
+        values = np.broadcast_to(compiled.vectorized()(*columns), (len(requests),))
+    share = round((time.perf_counter() - started) * 1e6 / len(requests), 1)
+    responses = []
+    for request, value in zip(requests, values.tolist()):
+        if math.isfinite(value):
+            result = value if compiled.unit is None else _json_value(Quantity(value, compiled.unit))
+            responses.append({"result": result, "latency_us": share})
+        else:
+            responses.append(_evaluate_one(request))
+    return responses
+
+
+def _vector_key(request: dict):
+    """Grouping key for requests that can share a vectorized evaluation, or None"""
+    expr = request.get("expr")
+    variables = request.get("variables")
+    if not NUMPY_AVAILABLE or not isinstance(expr, str) or not isinstance(variables, dict):
+        return None
+    if request.get("backend") not in (None, "float"):
+        return None
+    if not all(isinstance(v, (int, float)) for v in variables.values()):
+        return None
+    return expr, tuple(sorted(variables))
+
+
+def evaluate_requests(requests: list) -> list:
+    """Evaluate a batch of parsed requests, returning responses in the same order"""
+    responses = [None] * len(requests)
+    groups = {}
+    for index, request in enumerate(requests):
+        key = _vector_key(request)
+        if key is not None:
+            groups.setdefault(key, []).append(index)
+
+    for indices in groups.values():
+        if len(indices) < VECTORIZE_THRESHOLD:
+            continue
+        try:
+            batch = _evaluate_vectorized([requests[i] for i in indices])
+        except Exception:
+            # Anything the vectorized path cannot handle (matrices, odd
+            # variable values) is answered request by request instead
+            continue
+        for index, response in zip(indices, batch):
+            responses[index] = response
+
+    for index, request in enumerate(requests):
+        if responses[index] is None:
+            responses[index] = _evaluate_one(request)
+    return responses
+
+# ============================================================================
+# Part 2: Asyncio Server
+# ============================================================================
+
+class CalculationServer:
+    """Newline-delimited JSON calculation server with per-request latency"""
+
+    def __init__(self, latency_window: int = 10000, workers: int = 4):
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.requests = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=latency_window)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p):
+            if not latencies:
+                return None
+            return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))]
+
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "latency_us": {
+                "mean": sum(latencies) / len(latencies) if latencies else None,
+                "p50": percentile(50),
+                "p90": percentile(90),
+                "p99": percentile(99),
+                "max": latencies[-1] if latencies else None,
+            },
+        }
+
+    @staticmethod
+    def _with_id(request: dict, response: dict) -> dict:
+        return {"id": request["id"], **response} if "id" in request else response
+
+    async def handle_lines(self, lines: list) -> bytes:
+        """Evaluate every complete request line received in one read"""
+        parsed = []
+        responses = [None] * len(lines)
+        for index, line in enumerate(lines):
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("Request must be a JSON object")
+            except ValueError as e:
+                responses[index] = {"error": f"Invalid request: {e}"}
+                continue
+            if request.get("op") == "stats":
+                responses[index] = self._with_id(request, {"stats": self.stats()})
+            elif "expr" not in request:
+                responses[index] = self._with_id(request, {"error": "Missing 'expr'"})
+            else:
+                parsed.append((index, request))
+
+        # Evaluate off the event loop so one slow expression does not stall
+        # every other connection; the counters stay on the loop thread
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(self.executor, evaluate_requests, [r for _, r in parsed])
+        for (index, request), response in zip(parsed, results):
+            responses[index] = self._with_id(request, response)
+
+        output = []
+        for response in responses:
+            if "stats" not in response:
+                response.setdefault("latency_us", 0.0)
+                self.requests += 1
+                self.latencies.append(response["latency_us"])
+                if "error" in response:
+                    self.errors += 1
+            try:
+                output.append(json.dumps(response, allow_nan=False))
+            except ValueError as e:
+                self.errors += "error" not in response
+                output.append(json.dumps(self._with_id(response, {"error": f"Unencodable result: {e}"})))
+        return ("\n".join(output) + "\n").encode("utf-8")
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        pending = b""
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                pending += data
+                if b"\n" not in pending:
+                    if len(pending) > MAX_LINE_BYTES:
+                        writer.write(b'{"error": "Request line too long"}\n')
+                        break
+                    continue
+                *lines, pending = pending.split(b"\n")
+                lines = [line for line in lines if line.strip()]
+                if lines:
+                    writer.write(await self.handle_lines(lines))
+                    await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, address: str):
+        """Serve forever on 'HOST:PORT' (TCP) or a filesystem path (Unix socket)"""
+        if "/" in address or ":" not in address:
+            server = await asyncio.start_unix_server(self.handle_connection, path=address)
+        else:
+            host, _, port = address.rpartition(":")
+            server = await asyncio.start_server(self.handle_connection, host, int(port))
+        print(f"Calculator server listening on {address}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+# ============================================================================
+# Run the server
+# ============================================================================
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator server")
+    parser.add_argument("address", nargs="?", default="127.0.0.1:8765",
+                        help="HOST:PORT for TCP or a path for a Unix socket")
+    args = parser.parse_args(argv)
+
+    try:
+        asyncio.run(CalculationServer().serve(args.address))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
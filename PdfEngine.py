@@ -0,0 +1,890 @@
+#!/usr/bin/env python3
+"""
+PDF Engine
+Headless merge, split, compress and rename operations used by PDF Toolkit
+
+Every operation takes plain paths and an optional log callback, so it can
+run from the GUI, from scripts, or unattended from the command line:
+    python PdfEngine.py merge a.pdf b.pdf -o merged.pdf
+    python PdfEngine.py split report.pdf -d parts --ranges "1-3, 5"
+    python PdfEngine.py compress *.pdf -d compressed --level high --jobs 4
+    python PdfEngine.py rename old.pdf new.pdf
+    python PdfEngine.py info report.pdf
+
+Long operations also report per-page progress through an optional
+progress(done, total) callback; raising OperationCancelled from it stops
+the operation cleanly. JobRunner runs operations on a worker thread and
+streams these events through a queue, which is how the GUI stays responsive.
+"""
+
+import argparse
+import hashlib
+import io
+import mmap
+import multiprocessing
+import re
+import os
+import queue
+import sys
+import threading
+import zlib
+from array import array
+from collections import deque
+from importlib.util import find_spec
+from multiprocessing.util import Finalize
+from pathlib import Path
+from typing import Callable, List, NamedTuple, Optional, Sequence, Tuple
+
+import PyPDF2
+from PyPDF2.generic import (ArrayObject, DictionaryObject, EncodedStreamObject, IndirectObject,
+                            NameObject, NumberObject, StreamObject)
+
+# pdfplumber is only needed for the first-page text preview
+PDFPLUMBER_AVAILABLE = find_spec("pdfplumber") is not None
+
+# Pillow is only needed to recompress images
+PILLOW_AVAILABLE = find_spec("PIL") is not None
+
+# Per level: (image resolution in DPI at full-page size, JPEG quality)
+COMPRESSION_SETTINGS = {
+    "low": (300, 85),
+    "medium": (150, 75),
+    "high": (96, 55),
+}
+COMPRESSION_LEVELS = tuple(COMPRESSION_SETTINGS)
+
+# Images smaller than this are left alone; re-encoding them saves little
+MIN_IMAGE_BYTES = 8192
+
+# Default size of the split and compress process pools; each worker holds
+# its own parsed copy of the source, so one per CPU does not scale
+MAX_DEFAULT_WORKERS = 4
+
+Log = Optional[Callable[[str], None]]
+Progress = Optional[Callable[[int, int], None]]
+
+# ============================================================================
+# Part 1: Results and Helpers
+# ============================================================================
+
+class PdfResult(NamedTuple):
+    """Outcome of one PDF operation"""
+    outputs: List[str]
+    pages: int
+    input_size: int
+    output_size: int
+    stages: Optional[dict] = None    # bytes saved per compression stage
+
+    @property
+    def reduction(self) -> float:
+        """Size reduction in percent (negative when the output grew)"""
+        if not self.input_size:
+            return 0.0
+        return (1 - self.output_size / self.input_size) * 100
+
+
+class OperationCancelled(Exception):
+    """Raised from a progress callback to stop an operation"""
+
+
+def _log(log: Log, message: str):
+    if log is not None:
+        log(message)
+
+
+def _progress(progress: Progress, done: int, total: int):
+    if progress is not None:
+        progress(done, total)
+
+
+def _file_size(path) -> int:
+    return Path(path).stat().st_size
+
+
+def _default_workers() -> int:
+    return min(os.cpu_count() or 1, MAX_DEFAULT_WORKERS)
+
+
+def _process_pool(workers: int, initializer=None, initargs=()):
+    """Process pool whose workers are spawned rather than forked
+
+    Operations usually run on a JobRunner thread inside the Tk GUI, and
+    forking a multithreaded process can leave the child holding locks that
+    no thread will ever release.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                               initializer=initializer, initargs=initargs)
+
+
+def _map_pdf(path: str) -> PyPDF2.PdfReader:
+    """Reader over a read-only memory map of path
+
+    PyPDF2 copies a file given by path into memory whole; a map lets every
+    split worker share the OS page cache instead of holding its own copy,
+    and a merge can drop an input by closing its map.
+    """
+    with open(path, 'rb') as f:
+        return PyPDF2.PdfReader(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+
+def pdf_filename(name: str) -> str:
+    """Append the .pdf extension unless the name already has it"""
+    name = name.strip()
+    return name if name.lower().endswith('.pdf') else name + '.pdf'
+
+
+def parse_page_ranges(ranges_text: str, max_page: int) -> List[Tuple[int, int]]:
+    """Parse a page range string like '1-3, 5, 7-9' into (start, end) pairs"""
+    ranges = []
+    for part in (p.strip() for p in ranges_text.split(',')):
+        try:
+            if '-' in part:
+                start_str, end_str = part.split('-')
+                start, end = int(start_str.strip()), int(end_str.strip())
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise ValueError(f"Invalid page range '{part}'")
+        if not 1 <= start <= end <= max_page:
+            raise ValueError(f"Page range '{part}' is outside pages 1-{max_page}")
+        ranges.append((start, end))
+    if not ranges:
+        raise ValueError("No page ranges given")
+    return ranges
+
+# ============================================================================
+# Part 2: Operations
+# ============================================================================
+
+def page_count(path) -> int:
+    with open(path, 'rb') as f:
+        return len(PyPDF2.PdfReader(f).pages)
+
+
+def merge_pdfs(files: Sequence[str], output_path: str, log: Log = None,
+               progress: Progress = None, stream: bool = False) -> PdfResult:
+    """Merge files, in order, into output_path
+
+    With stream=True pages are written as each input is read and the input
+    is released before the next is opened, so memory does not grow with the
+    number of inputs; identical fonts and images are written once. Streaming
+    keeps pages, annotations and links but not bookmarks or form fields.
+    """
+    if len(files) < 2:
+        raise ValueError("At least 2 PDFs are needed to merge")
+    if stream:
+        return _stream_merge(files, output_path, log, progress)
+
+    readers = [PyPDF2.PdfReader(file) for file in files]
+    total = sum(len(reader.pages) for reader in readers)
+    merger = PyPDF2.PdfMerger()
+    try:
+        pages = 0
+        for file, reader in zip(files, readers):
+            merger.append(reader)
+            pages += len(reader.pages)
+            _log(log, f"Added: {Path(file).name}")
+            _progress(progress, pages, total)
+        merger.write(output_path)
+    finally:
+        merger.close()
+
+    _log(log, f"Successfully merged {len(files)} PDFs into {Path(output_path).name}")
+    return PdfResult([str(output_path)], pages, sum(_file_size(f) for f in files), _file_size(output_path))
+
+
+class _StreamingPdfWriter:
+    """Writes a PDF one object at a time as pages are added
+
+    Objects reachable from each added page are renumbered and written as
+    soon as they are reached, children before parents. An object that
+    serializes to the same bytes as one already written (the same embedded
+    font or logo in every statement, say) is referenced instead of written
+    again, which also dedupes the dictionaries that point at it.
+    """
+
+    def __init__(self, stream, flate: bool = False):
+        self.stream = stream
+        self.flate = flate    # Flate-compress streams written without a filter
+        # File offset of each object; objects 1 and 2 (catalog and page
+        # tree) are written last, once every page is known
+        self.offsets = array('q', [0, 0])
+        self.kids = array('q')
+        self.digests = {}
+        self.deduplicated = 0
+        self.deduplicated_bytes = 0
+        self.flate_saved = 0
+        stream.write(b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n")
+
+    def _reserve(self) -> int:
+        self.offsets.append(0)
+        return len(self.offsets)
+
+    def _write(self, number: int, obj):
+        buffer = io.BytesIO()
+        obj.write_to_stream(buffer, None)
+        self.offsets[number - 1] = self.stream.tell()
+        self.stream.write(b"%d 0 obj\n" % number + buffer.getvalue() + b"\nendobj\n")
+
+    def _copy(self, obj, refs: dict, active: dict):
+        """obj with its references renumbered, writing referenced objects first"""
+        if isinstance(obj, IndirectObject):
+            return IndirectObject(self._reference(obj, refs, active), 0, None)
+        if isinstance(obj, StreamObject):
+            copy = EncodedStreamObject()
+            copy.update({key: self._copy(value, refs, active) for key, value in obj.items() if key != "/Length"})
+            copy._data = obj._data
+            if self.flate and "/Filter" not in obj:
+                data = zlib.compress(obj._data, 9)
+                if len(data) < len(obj._data):
+                    self.flate_saved += len(obj._data) - len(data)
+                    copy[NameObject("/Filter")] = NameObject("/FlateDecode")
+                    copy._data = data
+            return copy
+        if isinstance(obj, DictionaryObject):
+            return DictionaryObject({key: self._copy(value, refs, active) for key, value in obj.items()})
+        if isinstance(obj, ArrayObject):
+            return ArrayObject(self._copy(value, refs, active) for value in obj)
+        return obj
+
+    def _reference(self, reference: IndirectObject, refs: dict, active: dict) -> int:
+        key = (reference.idnum, reference.generation)
+        if key in refs:
+            return refs[key]
+        if key in active:
+            # A cycle: the object needs its number before it can be written,
+            # so it is pinned there and not deduplicated
+            if active[key] is None:
+                active[key] = self._reserve()
+            return active[key]
+
+        active[key] = None
+        copy = self._copy(reference.get_object(), refs, active)
+        number = active.pop(key)
+        if number is None:
+            buffer = io.BytesIO()
+            copy.write_to_stream(buffer, None)
+            digest = hashlib.sha1(buffer.getvalue()).digest()
+            if digest in self.digests:
+                self.deduplicated += 1
+                self.deduplicated_bytes += len(buffer.getvalue())
+                refs[key] = self.digests[digest]
+                return refs[key]
+            number = self.digests[digest] = self._reserve()
+        self._write(number, copy)
+        refs[key] = number
+        return number
+
+    def add_pages(self, reader: PyPDF2.PdfReader, progress: Callable[[], None]) -> dict:
+        """Write every page of reader; returns {(idnum, generation): new number} for what it wrote"""
+        if reader.is_encrypted:
+            raise ValueError("Encrypted PDFs cannot be merged in streaming mode")
+        pages = reader.pages
+        # Links between pages of this input resolve to the new page numbers
+        refs = {}
+        numbers = []
+        for page in pages:
+            number = self._reserve()
+            refs[(page.indirect_reference.idnum, page.indirect_reference.generation)] = number
+            numbers.append(number)
+
+        active = {}
+        for page, number in zip(pages, numbers):
+            copy = DictionaryObject({key: self._copy(value, refs, active)
+                                     for key, value in page.items() if key != "/Parent"})
+            copy[NameObject("/Parent")] = IndirectObject(2, 0, None)
+            self._write(number, copy)
+            self.kids.append(number)
+            progress()
+        return refs
+
+    def close(self):
+        """Write the page tree, catalog, cross-reference table and trailer"""
+        self._write(2, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(IndirectObject(kid, 0, None) for kid in self.kids),
+            NameObject("/Count"): NumberObject(len(self.kids)),
+        }))
+        self._write(1, DictionaryObject({
+            NameObject("/Type"): NameObject("/Catalog"),
+            NameObject("/Pages"): IndirectObject(2, 0, None),
+        }))
+
+        xref = self.stream.tell()
+        self.stream.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.offsets) + 1))
+        self.stream.write(b"".join(b"%010d 00000 n \n" % offset for offset in self.offsets))
+        self.stream.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+                          % (len(self.offsets) + 1, xref))
+
+
+def _stream_merge(files: Sequence[str], output_path: str, log: Log, progress: Progress) -> PdfResult:
+    # Counting pages first costs a second parse of each input's page tree
+    # but lets progress report against the real total
+    total = sum(page_count(file) for file in files)
+    done = 0
+
+    def page_done():
+        nonlocal done
+        done += 1
+        _progress(progress, done, total)
+
+    with open(output_path, 'wb') as output:
+        writer = _StreamingPdfWriter(output)
+        for file in files:
+            reader = _map_pdf(file)
+            try:
+                writer.add_pages(reader, page_done)
+            finally:
+                reader.stream.close()
+            _log(log, f"Added: {Path(file).name}")
+        writer.close()
+
+    if writer.deduplicated:
+        _log(log, f"Shared {writer.deduplicated} repeated objects (fonts, images, ...)")
+    _log(log, f"Successfully merged {len(files)} PDFs into {Path(output_path).name}")
+    return PdfResult([str(output_path)], done, sum(_file_size(f) for f in files), _file_size(output_path))
+
+
+# Pages written per worker task when splitting, so single-page parts are
+# batched instead of costing one round trip each
+SPLIT_TASK_PAGES = 32
+
+_split_reader = None    # the source PDF, opened once per split worker process
+
+
+def _open_split_source(path: str):
+    global _split_reader
+    _split_reader = _map_pdf(path)
+    # Unmap when the worker exits (pool workers skip atexit handlers)
+    Finalize(None, _split_reader.stream.close, exitpriority=10)
+
+
+def _write_parts(parts: List[Tuple[str, int, int]], reader=None) -> List[Tuple[str, int, int]]:
+    """Write (output_path, start, end) parts from the split source"""
+    reader = reader or _split_reader
+    for output_path, start, end in parts:
+        writer = PyPDF2.PdfWriter()
+        for page_num in range(start - 1, end):
+            writer.add_page(reader.pages[page_num])
+        with open(output_path, 'wb') as out_file:
+            writer.write(out_file)
+    # Forget objects parsed for these parts so memory stays flat however
+    # many pages the source has
+    reader.resolved_objects.clear()
+    return parts
+
+
+def _split_tasks(parts: list) -> list:
+    tasks, task, pages = [], [], 0
+    for part in parts:
+        task.append(part)
+        pages += part[2] - part[1] + 1
+        if pages >= SPLIT_TASK_PAGES:
+            tasks.append(task)
+            task, pages = [], 0
+    return tasks + [task] if task else tasks
+
+
+def _pooled_map(pool, function, tasks: list, window: int):
+    """Yield function(task) results in task order, with at most window tasks in flight"""
+    pending = deque()
+    for task in tasks:
+        pending.append(pool.submit(function, task))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def split_pdf(path: str, output_dir: str, ranges=None, prefix: str = "split_",
+              log: Log = None, progress: Progress = None, workers: Optional[int] = None) -> PdfResult:
+    """Split into one PDF per page, or one per page range when ranges is given
+
+    ranges is a list of 1-based inclusive (start, end) pairs or a string
+    such as '1-3, 5'. The source is parsed once (once per worker) and parts
+    are written by a pool of worker processes (default: one per CPU, at
+    most MAX_DEFAULT_WORKERS). Parts already written are removed if
+    cancelled.
+    """
+    reader = _map_pdf(path)
+    pool = None
+    try:
+        total_pages = len(reader.pages)
+        if isinstance(ranges, str):
+            ranges = parse_page_ranges(ranges, total_pages)
+
+        if ranges is None:
+            names = [(f"{prefix}page_{page + 1}.pdf", page + 1, page + 1) for page in range(total_pages)]
+        else:
+            names = [(f"{prefix}part_{i + 1}.pdf", start, end) for i, (start, end) in enumerate(ranges)]
+        parts = [(str(Path(output_dir) / name), start, end) for name, start, end in names]
+        tasks = _split_tasks(parts)
+
+        workers = min(workers or _default_workers(), len(tasks))
+        if workers > 1:
+            pool = _process_pool(workers, _open_split_source, (path,))
+            finished = _pooled_map(pool, _write_parts, tasks, workers * 2)
+        else:
+            finished = (_write_parts(task, reader) for task in tasks)
+
+        total = sum(end - start + 1 for _, start, end in parts)
+        done = 0
+        for task in finished:
+            for output_path, start, end in task:
+                _log(log, f"Created: {Path(output_path).name}" +
+                          (f" (pages {start}-{end})" if ranges is not None else ""))
+                done += end - start + 1
+                _progress(progress, done, total)
+    except OperationCancelled:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        for output_path, _, _ in parts:
+            if os.path.exists(output_path):
+                os.remove(output_path)
+        raise
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        reader.stream.close()
+
+    if ranges is None:
+        _log(log, f"Successfully split PDF into {total_pages} individual pages")
+    else:
+        _log(log, f"Successfully split PDF into {len(ranges)} parts")
+    outputs = [output_path for output_path, _, _ in parts]
+    return PdfResult(outputs, total_pages, _file_size(path), sum(_file_size(o) for o in outputs))
+
+
+# Names used by a content stream, as raw bytes (#xx escapes not yet decoded)
+_NAME_PATTERN = re.compile(rb"/([^\s/\[\]()<>{}%]+)")
+
+_RESOURCE_CATEGORIES = ("/XObject", "/Font", "/ExtGState", "/Pattern", "/Shading", "/ColorSpace", "/Properties")
+
+
+def _content_names(page) -> Optional[set]:
+    """Every name appearing in the page's content streams, or None if they cannot be read"""
+    contents = page.get("/Contents")
+    if contents is None:
+        return None
+    contents = contents.get_object()
+    streams = contents if isinstance(contents, ArrayObject) else [contents]
+    try:
+        data = b"".join(stream.get_object().get_data() for stream in streams)
+    except Exception:
+        return None
+    return {re.sub(rb"#([0-9A-Fa-f]{2})", lambda m: bytes([int(m.group(1), 16)]), name)
+            for name in _NAME_PATTERN.findall(data)}
+
+
+def _strip_unused_resources(page) -> List[IndirectObject]:
+    """Drop page resources its content never names; returns the dropped references
+
+    Only the page's own content is inspected, so resources of form
+    XObjects it draws are kept as they are.
+    """
+    used = _content_names(page)
+    resources = page.get("/Resources")
+    if used is None or resources is None:
+        return []
+
+    stripped = []
+    resources = DictionaryObject(resources.get_object())
+    for category in _RESOURCE_CATEGORIES:
+        if category not in resources:
+            continue
+        kept = DictionaryObject()
+        for name, value in resources[category].get_object().items():
+            if name[1:].encode("utf-8") in used:
+                kept[name] = value
+            elif isinstance(value, IndirectObject):
+                stripped.append(value)
+        resources[NameObject(category)] = kept
+    page[NameObject("/Resources")] = resources
+    return stripped
+
+
+def _page_images(reader: PyPDF2.PdfReader) -> dict:
+    """{(idnum, generation): (image, largest (width, height) in points of a page drawing it)}"""
+    images = {}
+    for page in reader.pages:
+        resources = page.get("/Resources")
+        xobjects = resources.get_object().get("/XObject") if resources is not None else None
+        if xobjects is None:
+            continue
+        box = page.mediabox
+        size = (float(box.width), float(box.height))
+        for reference in xobjects.get_object().values():
+            if not isinstance(reference, IndirectObject):
+                continue
+            image = reference.get_object()
+            if image.get("/Subtype") != "/Image":
+                continue
+            key = (reference.idnum, reference.generation)
+            if key in images:
+                size = tuple(map(max, images[key][1], size))
+            images[key] = (image, size)
+    return images
+
+
+def _image_task(image, page_size: Tuple[float, float], dpi: int, quality: int) -> Optional[tuple]:
+    """Picklable recompression task for an image Pillow can re-encode, or None"""
+    if len(image._data) < MIN_IMAGE_BYTES or image.get("/BitsPerComponent") != 8:
+        return None
+    if any(key in image for key in ("/SMask", "/Mask", "/ImageMask", "/Decode")):
+        return None
+
+    filters = image.get("/Filter", [])
+    filters = [filters] if isinstance(filters, str) else list(filters)
+    if filters not in ([], ["/FlateDecode"], ["/DCTDecode"]):
+        return None
+
+    colorspace = image.get("/ColorSpace")
+    colorspace = colorspace.get_object() if colorspace is not None else None
+    if isinstance(colorspace, ArrayObject) and colorspace[0] == "/ICCBased":
+        components = colorspace[1].get_object().get("/N")
+    else:
+        components = {"/DeviceGray": 1, "/CalGray": 1, "/DeviceRGB": 3, "/CalRGB": 3}.get(colorspace)
+        if isinstance(colorspace, ArrayObject):
+            components = {"/CalGray": 1, "/CalRGB": 3}.get(colorspace[0])
+    if components not in (1, 3):
+        return None
+
+    parms = image.get("/DecodeParms")
+    parms = {key: int(value) for key, value in parms.get_object().items()} if isinstance(parms, DictionaryObject) else {}
+    max_size = (page_size[0] / 72 * dpi, page_size[1] / 72 * dpi)
+    return (image._data, filters, parms, int(image["/Width"]), int(image["/Height"]),
+            int(components), max_size, quality)
+
+
+def _recompress_image(task: tuple) -> Optional[Tuple[bytes, int, int]]:
+    """Decode, downsample and JPEG-encode one image; returns (data, width, height) or None"""
+    from PIL import Image
+    from PyPDF2.filters import FlateDecode
+
+    data, filters, parms, width, height, components, max_size, quality = task
+    try:
+        if filters == ["/DCTDecode"]:
+            image = Image.open(io.BytesIO(data))
+        else:
+            if filters == ["/FlateDecode"]:
+                data = FlateDecode.decode(data, parms)
+            image = Image.frombytes("L" if components == 1 else "RGB", (width, height), data)
+        if image.mode not in ("L", "RGB"):
+            return None
+
+        scale = min(1.0, max_size[0] / width, max_size[1] / height)
+        if scale < 1:
+            width, height = max(1, round(width * scale)), max(1, round(height * scale))
+            image = image.resize((width, height), Image.LANCZOS)
+
+        output = io.BytesIO()
+        image.save(output, "JPEG", quality=quality, optimize=True)
+        return output.getvalue(), width, height
+    except Exception:
+        return None
+
+
+def _recompress_images(reader: PyPDF2.PdfReader, level: str, workers: int, progress: Callable[[], None]) -> int:
+    """Replace images with smaller downsampled JPEGs in place; returns the bytes saved"""
+    dpi, quality = COMPRESSION_SETTINGS[level]
+    tasks = []
+    for image, page_size in _page_images(reader).values():
+        task = _image_task(image, page_size, dpi, quality)
+        if task is not None:
+            tasks.append((image, task))
+
+    workers = min(workers, len(tasks))
+    pool = None
+    if workers > 1:
+        pool = _process_pool(workers)
+        results = _pooled_map(pool, _recompress_image, [task for _, task in tasks], workers * 2)
+    else:
+        results = (_recompress_image(task) for _, task in tasks)
+
+    saved = 0
+    try:
+        for (image, _), result in zip(tasks, results):
+            if result is not None and len(result[0]) < len(image._data):
+                data, width, height = result
+                saved += len(image._data) - len(data)
+                image._data = data
+                image[NameObject("/Filter")] = NameObject("/DCTDecode")
+                image[NameObject("/Width")] = NumberObject(width)
+                image[NameObject("/Height")] = NumberObject(height)
+                image.pop("/DecodeParms", None)
+            progress()
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+    return saved
+
+
+def compress_pdf(path: str, output_path: str, level: str = "medium", log: Log = None,
+                 progress: Progress = None, workers: Optional[int] = None) -> PdfResult:
+    """Compress path into output_path at the given level
+
+    Stages: page resources the content never uses are dropped; images are
+    downsampled to the level's DPI (relative to the largest page drawing
+    them) and re-encoded as JPEG in a process pool; unfiltered streams are
+    Flate-compressed; and identical objects are written once. The result's
+    stages map each stage to the bytes it saved.
+    """
+    if level not in COMPRESSION_SETTINGS:
+        raise ValueError(f"Unknown compression level '{level}' (choose from {', '.join(COMPRESSION_LEVELS)})")
+
+    reader = _map_pdf(path)
+    try:
+        if reader.is_encrypted:
+            raise ValueError(f"{Path(path).name} is encrypted; decrypt it before compressing")
+        pages = reader.pages
+        stripped = []
+        for page in pages:
+            stripped += _strip_unused_resources(page)
+
+        images = len(_page_images(reader)) if PILLOW_AVAILABLE else 0
+        total = images + len(pages)
+        done = 0
+
+        def step():
+            nonlocal done
+            done += 1
+            _progress(progress, done, total)
+
+        stages = {}
+        if PILLOW_AVAILABLE:
+            stages["images"] = _recompress_images(reader, level, workers or _default_workers(), step)
+            done = images
+
+        try:
+            with open(output_path, 'wb') as output:
+                writer = _StreamingPdfWriter(output, flate=True)
+                written = writer.add_pages(reader, step)
+                writer.close()
+        except OperationCancelled:
+            os.remove(output_path)
+            raise
+
+        # Stripped resources only save anything if no other page kept them
+        unused = {(reference.idnum, reference.generation): reference.get_object() for reference in stripped}
+        stages["unused resources"] = sum(len(obj._data) for key, obj in unused.items()
+                                         if key not in written and isinstance(obj, StreamObject))
+    finally:
+        reader.stream.close()
+
+    stages["flate"] = writer.flate_saved
+    stages["duplicates"] = writer.deduplicated_bytes
+
+    result = PdfResult([str(output_path)], len(pages), _file_size(path), _file_size(output_path), stages)
+    for stage, saved in stages.items():
+        _log(log, f"  {stage}: {saved / 1024:.1f} KB saved")
+    _log(log, f"Compressed PDF: {result.input_size/(1024*1024):.2f} MB -> "
+              f"{result.output_size/(1024*1024):.2f} MB ({result.reduction:.1f}% reduction)")
+    return result
+
+
+def rename_pdf(path: str, new_filename: str, overwrite: bool = False, log: Log = None) -> str:
+    """Rename path within its directory; returns the new path"""
+    original_path = Path(path)
+    new_path = original_path.parent / pdf_filename(new_filename)
+    if new_path.exists() and not overwrite:
+        raise FileExistsError(f"A file named '{new_path.name}' already exists")
+
+    original_path.replace(new_path)
+    _log(log, f"Renamed: {original_path.name} -> {new_path.name}")
+    return str(new_path)
+
+
+def pdf_info(path: str, preview_chars: int = 200) -> dict:
+    """Size, page count, metadata and (with pdfplumber) a first-page text preview"""
+    with open(path, 'rb') as f:
+        reader = PyPDF2.PdfReader(f)
+        metadata = {(key[1:] if key.startswith('/') else key): str(value)
+                    for key, value in (reader.metadata or {}).items() if value}
+        info = {"file": Path(path).name, "size": _file_size(path),
+                "pages": len(reader.pages), "metadata": metadata, "preview": None}
+
+    if PDFPLUMBER_AVAILABLE:
+        import pdfplumber
+        try:
+            with pdfplumber.open(path) as pdf:
+                text = pdf.pages[0].extract_text() if pdf.pages else None
+            if text:
+                info["preview"] = text[:preview_chars] + "..." if len(text) > preview_chars else text
+        except Exception:
+            pass
+    return info
+
+# ============================================================================
+# Part 3: Background Jobs
+# ============================================================================
+
+class JobEvent(NamedTuple):
+    """One event from a running job
+
+    kind is "log", "progress", "done", "error" or "cancelled"; progress
+    events carry done/total pages, "done" carries the operation's result.
+    """
+    kind: str
+    message: str = ""
+    done: int = 0
+    total: int = 0
+    result: object = None
+
+
+class JobRunner:
+    """Runs one operation at a time on a worker thread, streaming JobEvents
+
+    The operation is called with log= and progress= callbacks that only
+    put events on the queue, so the caller (e.g. a Tk root.after poller)
+    reads them from its own thread via poll().
+    """
+
+    def __init__(self):
+        self.events = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, operation: Callable, *args, **kwargs):
+        if self.running:
+            raise RuntimeError("A job is already running")
+        self._cancel.clear()
+        self._thread = threading.Thread(target=self._run, args=(operation, args, kwargs), daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        """Ask the running job to stop at its next page"""
+        self._cancel.set()
+
+    def poll(self) -> List[JobEvent]:
+        """All events queued since the last poll"""
+        events = []
+        while True:
+            try:
+                events.append(self.events.get_nowait())
+            except queue.Empty:
+                return events
+
+    def _on_progress(self, done: int, total: int):
+        if self._cancel.is_set():
+            raise OperationCancelled()
+        self.events.put(JobEvent("progress", done=done, total=total))
+
+    def _run(self, operation, args, kwargs):
+        try:
+            result = operation(*args, log=lambda message: self.events.put(JobEvent("log", message)),
+                               progress=self._on_progress, **kwargs)
+        except OperationCancelled:
+            self.events.put(JobEvent("cancelled", "Operation cancelled"))
+        except Exception as e:
+            self.events.put(JobEvent("error", str(e)))
+        else:
+            self.events.put(JobEvent("done", result=result))
+
+# ============================================================================
+# Part 4: Command Line
+# ============================================================================
+
+def _compress_one(task: tuple) -> Tuple[str, Optional[PdfResult], Optional[str]]:
+    path, output_path, level = task
+    try:
+        # Files are already spread over processes, so each compresses its images serially
+        return path, compress_pdf(path, output_path, level, workers=1), None
+    except Exception as e:
+        return path, None, str(e)
+
+
+def _run_compress(args, log: Log) -> int:
+    if len(args.inputs) > 1 and not args.output_dir:
+        raise ValueError("Use --output-dir when compressing several files")
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        tasks = [(path, str(Path(args.output_dir) / Path(path).name), args.level) for path in args.inputs]
+    else:
+        tasks = [(args.inputs[0], args.output or "compressed.pdf", args.level)]
+
+    if args.jobs > 1 and len(tasks) > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=args.jobs) as pool:
+            results = list(pool.map(_compress_one, tasks))
+    else:
+        results = [_compress_one(task) for task in tasks]
+
+    failures = 0
+    for path, result, error in results:
+        if error is not None:
+            failures += 1
+            print(f"Error compressing {path}: {error}", file=sys.stderr)
+        else:
+            stages = ", ".join(f"{stage} {saved}" for stage, saved in result.stages.items())
+            _log(log, f"{Path(path).name}: {result.input_size} -> {result.output_size} bytes "
+                      f"({result.reduction:.1f}% reduction; saved by {stages})")
+    return 1 if failures else 0
+
+
+def parse_arguments(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Headless PDF operations")
+    parser.add_argument("-q", "--quiet", action="store_true", help="only report errors")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="merge PDFs in the given order")
+    merge.add_argument("inputs", nargs="+")
+    merge.add_argument("-o", "--output", default="merged.pdf")
+    merge.add_argument("--stream", action="store_true",
+                       help="write pages as inputs are read (bounded memory, no bookmarks)")
+
+    split = commands.add_parser("split", help="split a PDF into pages or page ranges")
+    split.add_argument("input")
+    split.add_argument("-d", "--output-dir", default=".")
+    split.add_argument("--ranges", help="page ranges such as '1-3, 5' (default: one file per page)")
+    split.add_argument("--prefix", default="split_")
+    split.add_argument("--jobs", type=int, help="parts written in parallel (default: one per CPU, at most 4)")
+
+    compress = commands.add_parser("compress", help="compress one or more PDFs")
+    compress.add_argument("inputs", nargs="+")
+    compress.add_argument("-o", "--output", help="output file for a single input")
+    compress.add_argument("-d", "--output-dir", help="output directory for several inputs")
+    compress.add_argument("--level", choices=COMPRESSION_LEVELS, default="medium")
+    compress.add_argument("--jobs", type=int, default=1, help="files compressed in parallel")
+
+    rename = commands.add_parser("rename", help="rename a PDF within its directory")
+    rename.add_argument("input")
+    rename.add_argument("name")
+    rename.add_argument("-f", "--force", action="store_true", help="replace an existing file")
+
+    info = commands.add_parser("info", help="show page count and metadata")
+    info.add_argument("input")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_arguments(argv)
+    log = None if args.quiet else print
+
+    try:
+        if args.command == "merge":
+            merge_pdfs(args.inputs, pdf_filename(args.output), log, stream=args.stream)
+        elif args.command == "split":
+            os.makedirs(args.output_dir, exist_ok=True)
+            split_pdf(args.input, args.output_dir, args.ranges, args.prefix, log, workers=args.jobs)
+        elif args.command == "compress":
+            return _run_compress(args, log)
+        elif args.command == "rename":
+            rename_pdf(args.input, args.name, args.force, log)
+        elif args.command == "info":
+            info = pdf_info(args.input)
+            print(f"File: {info['file']}\nSize: {info['size'] / 1024:.1f} KB\nPages: {info['pages']}")
+            for key, value in info["metadata"].items():
+                print(f"{key}: {value}")
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox, scrolledtext
 from pathlib import Path
-import PyPDF2
-import pdfplumber
 import io
 import os
 import sys
@@ -10,6 +8,12 @@ from datetime import datetime
 from PIL import Image, ImageTk
 import traceback
 
+from PdfEngine import (JobRunner, compress_pdf, merge_pdfs, page_count, parse_page_ranges,
+                       pdf_filename, pdf_info, rename_pdf, split_pdf)
+
+# How often the Tk thread drains progress events from a running job
+JOB_POLL_MS = 100
+
 class PDFToolkit:
     def __init__(self, root):
         self.root = root
@@ -36,6 +40,11 @@ class PDFToolkit:
         self.pdf_to_compress = None
         self.pdf_to_rename = None
         
+        # Merge, split and compress run on a worker thread
+        self.jobs = JobRunner()
+        self.job_name = None
+        self.job_done = None
+        
         self.setup_ui()
         
     def setup_ui(self):
@@ -104,6 +113,27 @@ class PDFToolkit:
         )
         status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
+        # Progress of the running job
+        progress_frame = tk.Frame(self.root, bg=self.bg_color)
+        progress_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+        
+        self.progress_var = tk.DoubleVar(value=0)
+        progress_bar = ttk.Progressbar(progress_frame, variable=self.progress_var, maximum=100)
+        progress_bar.pack(side=tk.LEFT, fill=tk.X, expand=True)
+        
+        self.cancel_button = tk.Button(
+            progress_frame,
+            text="Cancel",
+            command=self.cancel_job,
+            bg='#dc3545',
+            fg='white',
+            font=('Segoe UI', 9),
+            relief=tk.FLAT,
+            padx=10,
+            state=tk.DISABLED
+        )
+        self.cancel_button.pack(side=tk.RIGHT, padx=(5, 0))
+        
         # Initialize log
         self.log("PDF Toolkit Pro initialized")
         
@@ -610,8 +640,7 @@ class PDFToolkit:
             messagebox.showwarning("Missing Filename", "Please enter an output filename")
             return
         
-        if not output_filename.lower().endswith('.pdf'):
-            output_filename += '.pdf'
+        output_filename = pdf_filename(output_filename)
         
         output_path = filedialog.asksaveasfilename(
             title="Save Merged PDF As",
@@ -623,25 +652,15 @@ class PDFToolkit:
         if not output_path:
             return
         
-        try:
-            merger = PyPDF2.PdfMerger()
-            
-            for i, file in enumerate(self.files_to_merge):
-                merger.append(file)
-                self.log(f"Added: {Path(file).name}")
-            
-            merger.write(output_path)
-            merger.close()
-            
-            self.log(f"Successfully merged {len(self.files_to_merge)} PDFs into {Path(output_path).name}")
-            messagebox.showinfo("Success", f"Merged {len(self.files_to_merge)} PDFs successfully!\nSaved as: {Path(output_path).name}")
+        files = list(self.files_to_merge)
+        
+        def merged(result):
+            messagebox.showinfo("Success", f"Merged {len(files)} PDFs successfully!\nSaved as: {Path(output_path).name}")
             
             # Clear list after successful merge
             self.clear_merge_list()
-            
-        except Exception as e:
-            self.log(f"Error merging PDFs: {str(e)}", error=True)
-            messagebox.showerror("Error", f"Failed to merge PDFs:\n{str(e)}")
+        
+        self.start_job("merging PDFs", merged, merge_pdfs, files, output_path)
     
     # ===== SPLIT FUNCTIONS =====
     def select_split_pdf(self):
@@ -656,11 +675,9 @@ class PDFToolkit:
             
             # Get page count
             try:
-                with open(file, 'rb') as f:
-                    pdf = PyPDF2.PdfReader(f)
-                    page_count = len(pdf.pages)
-                    self.log(f"Selected PDF for splitting: {Path(file).name} ({page_count} pages)")
-                    self.status_var.set(f"Selected PDF with {page_count} pages")
+                pages = page_count(file)
+                self.log(f"Selected PDF for splitting: {Path(file).name} ({pages} pages)")
+                self.status_var.set(f"Selected PDF with {pages} pages")
             except Exception as e:
                 self.log(f"Error reading PDF: {str(e)}", error=True)
     
@@ -679,96 +696,43 @@ class PDFToolkit:
         if not output_dir:
             return
         
-        try:
-            with open(self.pdf_to_split, 'rb') as f:
-                pdf = PyPDF2.PdfReader(f)
-                total_pages = len(pdf.pages)
-                
-                if self.split_type.get() == "all":
-                    # Split into individual pages
-                    prefix = self.split_prefix_var.get().strip()
-                    
-                    for page_num in range(total_pages):
-                        output_filename = f"{prefix}page_{page_num + 1}.pdf"
-                        output_path = Path(output_dir) / output_filename
-                        
-                        writer = PyPDF2.PdfWriter()
-                        writer.add_page(pdf.pages[page_num])
-                        
-                        with open(output_path, 'wb') as out_file:
-                            writer.write(out_file)
-                        
-                        self.log(f"Created: {output_filename}")
-                    
-                    self.log(f"Successfully split PDF into {total_pages} individual pages")
-                    messagebox.showinfo("Success", f"Split PDF into {total_pages} individual pages")
-                    
-                else:
-                    # Split by ranges
-                    ranges_text = self.range_var.get().strip()
-                    if not ranges_text:
-                        messagebox.showwarning("No Ranges", "Please enter page ranges")
-                        return
-                    
-                    # Parse ranges
-                    ranges = self.parse_page_ranges(ranges_text, total_pages)
-                    if not ranges:
-                        messagebox.showwarning("Invalid Ranges", "Please enter valid page ranges")
-                        return
-                    
-                    prefix = self.split_prefix_var.get().strip()
-                    
-                    for i, (start, end) in enumerate(ranges):
-                        output_filename = f"{prefix}part_{i + 1}.pdf"
-                        output_path = Path(output_dir) / output_filename
-                        
-                        writer = PyPDF2.PdfWriter()
-                        for page_num in range(start - 1, end):
-                            writer.add_page(pdf.pages[page_num])
-                        
-                        with open(output_path, 'wb') as out_file:
-                            writer.write(out_file)
-                        
-                        self.log(f"Created: {output_filename} (pages {start}-{end})")
-                    
-                    self.log(f"Successfully split PDF into {len(ranges)} parts")
-                    messagebox.showinfo("Success", f"Split PDF into {len(ranges)} parts")
+        prefix = self.split_prefix_var.get().strip()
+        
+        if self.split_type.get() == "all":
+            # Split into individual pages
+            ranges = None
+        else:
+            # Split by ranges
+            ranges_text = self.range_var.get().strip()
+            if not ranges_text:
+                messagebox.showwarning("No Ranges", "Please enter page ranges")
+                return
             
+            try:
+                ranges = self.parse_page_ranges(ranges_text, page_count(self.pdf_to_split))
+            except Exception as e:
+                self.log(f"Error reading PDF: {str(e)}", error=True)
+                messagebox.showerror("Error", f"Failed to split PDF:\n{str(e)}")
+                return
+            if not ranges:
+                messagebox.showwarning("Invalid Ranges", "Please enter valid page ranges")
+                return
+        
+        def split(result):
+            if ranges is None:
+                messagebox.showinfo("Success", f"Split PDF into {result.pages} individual pages")
+            else:
+                messagebox.showinfo("Success", f"Split PDF into {len(result.outputs)} parts")
             self.status_var.set("PDF split completed")
-            
-        except Exception as e:
-            self.log(f"Error splitting PDF: {str(e)}", error=True)
-            messagebox.showerror("Error", f"Failed to split PDF:\n{str(e)}")
+        
+        self.start_job("splitting PDF", split, split_pdf, self.pdf_to_split, output_dir, ranges, prefix)
     
     def parse_page_ranges(self, ranges_text, max_page):
         """Parse page range string like '1-3, 5, 7-9'"""
-        ranges = []
-        parts = [p.strip() for p in ranges_text.split(',')]
-        
-        for part in parts:
-            if '-' in part:
-                try:
-                    start_str, end_str = part.split('-')
-                    start = int(start_str.strip())
-                    end = int(end_str.strip())
-                    
-                    if 1 <= start <= end <= max_page:
-                        ranges.append((start, end))
-                    else:
-                        return None
-                except:
-                    return None
-            else:
-                try:
-                    page = int(part.strip())
-                    if 1 <= page <= max_page:
-                        ranges.append((page, page))
-                    else:
-                        return None
-                except:
-                    return None
-        
-        return ranges
+        try:
+            return parse_page_ranges(ranges_text, max_page)
+        except ValueError:
+            return None
     
     # ===== COMPRESS FUNCTIONS =====
     def select_compress_pdf(self):
@@ -797,8 +761,7 @@ class PDFToolkit:
             messagebox.showwarning("Missing Filename", "Please enter an output filename")
             return
         
-        if not output_filename.lower().endswith('.pdf'):
-            output_filename += '.pdf'
+        output_filename = pdf_filename(output_filename)
         
         output_path = filedialog.asksaveasfilename(
             title="Save Compressed PDF As",
@@ -810,47 +773,19 @@ class PDFToolkit:
         if not output_path:
             return
         
-        try:
-            # Get original size
-            original_size = Path(self.pdf_to_compress).stat().st_size
-            
-            # Simple compression by rewriting the PDF
-            # Note: For more advanced compression, you would need additional libraries
-            # like pikepdf or ghostscript
-            reader = PyPDF2.PdfReader(self.pdf_to_compress)
-            writer = PyPDF2.PdfWriter()
-            
-            # Copy all pages
-            for page in reader.pages:
-                writer.add_page(page)
-            
-            # Apply compression based on selected level
-            compression = self.compression_level.get()
-            
-            # Write with compression
-            with open(output_path, 'wb') as output_file:
-                writer.write(output_file)
-            
-            # Get compressed size
-            compressed_size = Path(output_path).stat().st_size
-            
-            # Calculate compression ratio
-            ratio = (1 - compressed_size / original_size) * 100
-            
-            self.log(f"Compressed PDF: {original_size/(1024*1024):.2f} MB -> {compressed_size/(1024*1024):.2f} MB ({ratio:.1f}% reduction)")
+        def compressed(result):
             messagebox.showinfo(
                 "Success", 
                 f"PDF compressed successfully!\n\n"
-                f"Original: {original_size/(1024*1024):.2f} MB\n"
-                f"Compressed: {compressed_size/(1024*1024):.2f} MB\n"
-                f"Reduction: {ratio:.1f}%"
+                f"Original: {result.input_size/(1024*1024):.2f} MB\n"
+                f"Compressed: {result.output_size/(1024*1024):.2f} MB\n"
+                f"Reduction: {result.reduction:.1f}%"
             )
             
-            self.status_var.set(f"Compression complete: {ratio:.1f}% reduction")
-            
-        except Exception as e:
-            self.log(f"Error compressing PDF: {str(e)}", error=True)
-            messagebox.showerror("Error", f"Failed to compress PDF:\n{str(e)}")
+            self.status_var.set(f"Compression complete: {result.reduction:.1f}% reduction")
+        
+        self.start_job("compressing PDF", compressed, compress_pdf, self.pdf_to_compress, output_path,
+                       self.compression_level.get())
     
     # ===== RENAME FUNCTIONS =====
     def select_rename_pdf(self):
@@ -875,40 +810,28 @@ class PDFToolkit:
         self.preview_text.delete(1.0, tk.END)
         
         try:
-            with open(filepath, 'rb') as f:
-                reader = PyPDF2.PdfReader(f)
-                
-                metadata = reader.metadata
-                num_pages = len(reader.pages)
-                file_size = Path(filepath).stat().st_size
-                
-                preview_text = f"File: {Path(filepath).name}\n"
-                preview_text += f"Size: {file_size / 1024:.1f} KB\n"
-                preview_text += f"Pages: {num_pages}\n\n"
-                preview_text += "Metadata:\n"
+            info = pdf_info(filepath)
+            
+            preview_text = f"File: {info['file']}\n"
+            preview_text += f"Size: {info['size'] / 1024:.1f} KB\n"
+            preview_text += f"Pages: {info['pages']}\n\n"
+            preview_text += "Metadata:\n"
+            preview_text += "-" * 30 + "\n"
+            
+            if info['metadata']:
+                for key, value in info['metadata'].items():
+                    preview_text += f"{key}: {value}\n"
+            else:
+                preview_text += "No metadata found\n"
+            
+            if info['preview']:
+                preview_text += "\nFirst page preview (first 200 chars):\n"
                 preview_text += "-" * 30 + "\n"
-                
-                if metadata:
-                    for key, value in metadata.items():
-                        if value:
-                            preview_text += f"{key[1:] if key.startswith('/') else key}: {value}\n"
-                else:
-                    preview_text += "No metadata found\n"
-                
-                # Try to get text from first page using pdfplumber
-                try:
-                    with pdfplumber.open(filepath) as pdf:
-                        if len(pdf.pages) > 0:
-                            first_page = pdf.pages[0]
-                            text = first_page.extract_text()
-                            if text and len(text) > 0:
-                                preview_text += "\nFirst page preview (first 200 chars):\n"
-                                preview_text += "-" * 30 + "\n"
-                                preview_text += text[:200] + "..." if len(text) > 200 else text
-                except:
-                    preview_text += "\n[Could not extract text preview]"
-                
-                self.preview_text.insert(tk.END, preview_text)
+                preview_text += info['preview']
+            else:
+                preview_text += "\n[Could not extract text preview]"
+            
+            self.preview_text.insert(tk.END, preview_text)
         
         except Exception as e:
             self.preview_text.insert(tk.END, f"Error reading PDF metadata:\n{str(e)}")
@@ -925,8 +848,7 @@ class PDFToolkit:
             messagebox.showwarning("Missing Filename", "Please enter a new filename")
             return
         
-        if not new_filename.lower().endswith('.pdf'):
-            new_filename += '.pdf'
+        new_filename = pdf_filename(new_filename)
         
         try:
             original_path = Path(self.pdf_to_rename)
@@ -942,9 +864,7 @@ class PDFToolkit:
                     return
             
             # Rename the file
-            original_path.rename(new_path)
-            
-            self.log(f"Renamed: {original_path.name} -> {new_filename}")
+            rename_pdf(self.pdf_to_rename, new_filename, overwrite=True, log=self.log)
             messagebox.showinfo("Success", f"PDF renamed successfully!\n\nNew name: {new_filename}")
             
             # Update the UI
@@ -958,6 +878,57 @@ class PDFToolkit:
             self.log(f"Error renaming PDF: {str(e)}", error=True)
             messagebox.showerror("Error", f"Failed to rename PDF:\n{str(e)}")
     
+    # ===== JOB FUNCTIONS =====
+    def start_job(self, name, on_done, operation, *args):
+        """Run an engine operation on the worker thread; on_done(result) runs on the Tk thread"""
+        if self.jobs.running:
+            messagebox.showwarning("Busy", "Please wait for the current operation to finish")
+            return
+        
+        self.job_name = name
+        self.job_done = on_done
+        self.progress_var.set(0)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.status_var.set(f"{name[0].upper()}{name[1:]}...")
+        
+        self.jobs.start(operation, *args)
+        self.root.after(JOB_POLL_MS, self.poll_job)
+    
+    def poll_job(self):
+        """Apply queued job events to the log, progress bar and status bar"""
+        for event in self.jobs.poll():
+            if event.kind == "log":
+                self.log(event.message)
+            elif event.kind == "progress":
+                self.progress_var.set(100 * event.done / max(event.total, 1))
+                self.status_var.set(f"{self.job_name[0].upper()}{self.job_name[1:]}: {event.done} of {event.total}")
+            else:
+                self.finish_job(event)
+                return
+        
+        self.root.after(JOB_POLL_MS, self.poll_job)
+    
+    def finish_job(self, event):
+        self.cancel_button.config(state=tk.DISABLED)
+        
+        if event.kind == "done":
+            self.progress_var.set(100)
+            self.job_done(event.result)
+        elif event.kind == "cancelled":
+            self.progress_var.set(0)
+            self.log(f"Cancelled {self.job_name}")
+            self.status_var.set("Cancelled")
+        else:
+            self.progress_var.set(0)
+            self.log(f"Error {self.job_name}: {event.message}", error=True)
+            messagebox.showerror("Error", f"Failed while {self.job_name}:\n{event.message}")
+            self.status_var.set("Ready")
+    
+    def cancel_job(self):
+        if self.jobs.running:
+            self.jobs.cancel()
+            self.status_var.set("Cancelling...")
+    
     # ===== UTILITY FUNCTIONS =====
     def log(self, message, error=False):
         """Add message to log with timestamp"""
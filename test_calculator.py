@@ -0,0 +1,185 @@
+"""Differential tests: fast paths must agree with the plain evaluate() path"""
+
+import ast
+import math
+import os
+import random
+import subprocess
+import sys
+
+import pytest
+
+from Calculator import NUMPY_AVAILABLE, LivePreview, ParallelEvaluator, evaluate
+
+
+def _random_expression(rng: random.Random, depth: int = 0) -> str:
+    if depth > 2 or rng.random() < 0.3:
+        atom = rng.choice([str(rng.randint(0, 9)), f"{rng.randint(1, 9)}.5", "π", "e", "√4", "3!", "2²"])
+        return atom
+    choice = rng.random()
+    if choice < 0.15:
+        return f"({_random_expression(rng, depth + 1)})"
+    if choice < 0.25:
+        return f"-{_random_expression(rng, depth + 1)}"
+    terms = [_random_expression(rng, depth + 1) for _ in range(rng.randint(2, 4))]
+    expr = terms[0]
+    for term in terms[1:]:
+        expr += rng.choice("+-*/-+") + term
+    return expr
+
+
+def _same(preview, expected) -> bool:
+    return math.isclose(preview, expected, rel_tol=1e-9, abs_tol=1e-9)
+
+
+@pytest.mark.parametrize("text", ["5-π-1", "3/√4-√4/π-√4", "√4+2²-π-√4/(1+2)", "e-1-e", "4!-3!-2"])
+def test_live_preview_splits_after_constants(text):
+    assert _same(LivePreview().update(text), evaluate(text))
+
+
+def test_live_preview_matches_evaluate():
+    rng = random.Random(1234)
+    for _ in range(500):
+        text = _random_expression(rng)
+        try:
+            expected = evaluate(text)
+        except ValueError:
+            expected = None
+        # Type the expression one character at a time so the cached prefix
+        # and incremental re-tokenizing are exercised, then check the result
+        preview = LivePreview()
+        for end in range(1, len(text) + 1):
+            value = preview.update(text[:end])
+        if expected is None:
+            assert value is None, text
+        else:
+            assert value is not None and _same(value, expected), text
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="vectorized rows need numpy")
+@pytest.mark.parametrize("expr", ["x!+y", "(x+y)!", "sqrt(x)-y", "x/(y-1)", "ln(x)*y^2", "x^y"])
+def test_parallel_values_match_scalar(expr):
+    rng = random.Random(expr)
+    xs = [rng.choice([rng.randint(-3, 12), rng.uniform(-3, 12), 2.5, 0.0]) for _ in range(200)]
+    ys = [rng.choice([rng.randint(-2, 4), rng.uniform(-2, 4), 1.0]) for _ in range(200)]
+    with ParallelEvaluator(workers=2) as evaluator:
+        values, errors = evaluator.evaluate_values(expr, {"x": xs, "y": ys}, chunk_size=37)
+    for row, (x, y) in enumerate(zip(xs, ys)):
+        try:
+            # Complex results (negative base, fractional power) fail as floats
+            expected = float(evaluate(expr, None, {"x": x, "y": y}))
+        except (ValueError, TypeError):
+            assert row in errors, (expr, x, y, values[row])
+            continue
+        assert row not in errors, (expr, x, y, errors.get(row))
+        assert _same(values[row], expected) or values[row] == expected, (expr, x, y)
+
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="the NumPy linear algebra path needs numpy")
+@pytest.mark.parametrize("expr, expected", [("det([1,2;3,4])", -2.0), ("solve([1,2;3,4],[1,1])", [-1.0, 1.0])])
+def test_linear_algebra_in_fresh_process(expr, expected):
+    # NumPy is imported lazily, so check in a process that has not loaded it yet
+    code = f"from Calculator import evaluate; print(evaluate({expr!r}))"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert output.returncode == 0, output.stderr
+    assert ast.literal_eval(output.stdout.strip()) == pytest.approx(expected)
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="vectorized requests need numpy")
+def test_pipelined_matrix_requests_match_single():
+    from CalculatorServer import VECTORIZE_THRESHOLD, evaluate_requests
+    requests = [{"expr": "[x, 1]", "variables": {"x": i}} for i in range(VECTORIZE_THRESHOLD)]
+    responses = evaluate_requests(requests)
+    assert [response["result"] for response in responses] == [[float(i), 1.0] for i in range(len(requests))]
+
+
+def test_history_log_round_trip(tmp_path):
+    from decimal import Decimal
+    from fractions import Fraction
+    from Calculator import HistoryLog, Matrix
+    entries = [
+        ("1 + 2", 3.0),
+        ("2000!", math.factorial(2000)),
+        ("-(2^70)", -2 ** 70),
+        ("1/3", Fraction(1, 3)),
+        ("0.1 + 0.2", Decimal("0.3")),
+        ("+".join(["1.5"] * 200), 300.0),     # spills into continuation records
+        ("√" * 100, Decimal("1.0000000000000000000000000001")),
+    ]
+    path = str(tmp_path / "history.bin")
+    log = HistoryLog(path)
+    for operation, result in entries:
+        log.append(operation, result)
+    # Other results (matrices, quantities) are kept as their text
+    log.append("[1, 2]", Matrix.from_rows([1, 2]))
+    log.close()
+    
+    reopened = HistoryLog(path)
+    assert len(reopened) == len(entries) + 1
+    assert reopened[-1] == ("[1, 2]", str(Matrix.from_rows([1, 2])))
+    for index, (operation, result) in enumerate(entries):
+        assert reopened[index] == (operation, result)
+        assert type(reopened[index][1]) is type(result)
+    assert reopened.tail(3)[:2] == entries[-2:]
+    reopened.close()
+
+
+def test_history_accepts_ints_too_long_for_str(tmp_path):
+    from Calculator import CalculatorEngine
+    engine = CalculatorEngine(history_path=str(tmp_path / "history.bin"))
+    engine.add_to_history("2^20000", 2 ** 20000)
+    assert engine.get_history() == ["2^20000 = 3.980276840337967e+6020"]
+    assert engine.history_log[-1] == ("2^20000", 2 ** 20000)
+
+
+def test_live_preview_bounds_exact_work():
+    preview = LivePreview()
+    assert preview.update("200000!") is None
+    assert preview.update("2^1000000") is None
+    assert preview.update("100!") == math.factorial(100)
+    # The preview's lower limit does not leak into ordinary evaluation
+    assert evaluate("5000!") == math.factorial(5000)
+
+
+@pytest.mark.skipif(not NUMPY_AVAILABLE, reason="vectorized requests need numpy")
+@pytest.mark.parametrize("expr, x", [("x km", 1), ("x km/h", 36), ("x^2", 3), ("1/x", 0),
+                                     ("x!", 25), ("x!*2", 3), ("2^x", 80), ("10^x", 400)])
+def test_pipelined_requests_match_single(expr, x):
+    from CalculatorServer import VECTORIZE_THRESHOLD, evaluate_requests
+    request = {"expr": expr, "variables": {"x": x}}
+    single = evaluate_requests([request])[0]
+    for response in evaluate_requests([request] * VECTORIZE_THRESHOLD):
+        assert {k: v for k, v in response.items() if k != "latency_us"} == \
+               {k: v for k, v in single.items() if k != "latency_us"}
+
+
+@pytest.mark.parametrize("expr", ["1/x", "x!", "sqrt(x-2)", "ln(x)", "10^x"])
+def test_sweep_matches_evaluate(expr):
+    from Calculator import sweep
+    points = [0, 1, 2.5, 3, 171, 400, -2]
+    values = [value for chunk in sweep(expr, {"x": points}, chunk_size=4) for value in chunk]
+    for x, value in zip(points, values):
+        try:
+            expected = evaluate(expr, None, {"x": x})
+        except ValueError:
+            assert math.isnan(value), (expr, x, value)
+            continue
+        assert value == expected or _same(value, expected), (expr, x, value, expected)
+
+
+def test_integrate_singular_raises_without_warnings():
+    import warnings
+    from Calculator import integrate
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        with pytest.raises(ValueError):
+            integrate("1/x", 0, 1)
+
+
+@pytest.mark.parametrize("expr, expected", [("1/n^2", math.pi ** 2 / 6), ("1/n^1.5", 2.612375348685488),
+                                            ("1/(n*(n+1))", 1.0), ("0.5^n", 1.0)])
+def test_infinite_series_within_tolerance(expr, expected):
+    from Calculator import series_sum
+    assert series_sum(expr, 1, math.inf) == pytest.approx(expected, rel=1e-8)